@@ -0,0 +1,196 @@
+"""把已结算的旧记录从主库移到按月划分的归档文件中
+
+已结算：closed_channels及其htlcs，status为dead的open_channels和shutdown_cells，区块时间早于--days天前。
+归档文件为 <db>.archive/YYYY-MM.db，表结构与主库相同；超过ARCHIVE_MONTH_FILES个月份文件时，
+最早的月份合并到 older.db（SQLite最多同时ATTACH 10个库）。
+API通过 all_<table> 视图同时读取主库和归档文件，查询结果不变，见Database._sync_archives。
+
+先复制到归档文件并提交，再从主库删除已存在于归档中的记录，中途退出时重新运行即可，不会丢失数据。
+
+用法: python archive.py [--db fiber_monit.db] [--days 90] [--vacuum]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from src.const import ARCHIVE_AFTER_DAYS, ARCHIVE_MONTH_FILES
+from src.database import ARCHIVE_TABLES, INDEXES, Database, archive_dir_of
+
+MONTH_FILE = re.compile(r'^\d{4}-\d{2}\.db$')
+OLDER_FILE = 'older.db'
+# 每张表的归档条件，参数为时间范围 [start, end)；htlcs跟随所属的closed channel，需要在closed_channels之前处理
+SETTLED = {
+    'htlcs': "tx_hash IN (SELECT tx_hash FROM main.closed_channels WHERE timestamp >= ? AND timestamp < ?)",
+    'closed_channels': "timestamp >= ? AND timestamp < ?",
+    'shutdown_cells': "status = 'dead' AND timestamp >= ? AND timestamp < ?",
+    'open_channels': "status = 'dead' AND timestamp >= ? AND timestamp < ?",
+}
+ARCHIVE_SKIP_INDEXES = ('_status_next_check', '_status_capacity')
+# 各表的唯一键，用于判断记录是否已经在归档中
+UNIQUE_KEYS = {
+    'htlcs': ('tx_hash', 'input_index', 'htlc_index'),
+    'closed_channels': ('tx_hash',),
+    'shutdown_cells': ('tx_hash',),
+    'open_channels': ('tx_hash',),
+}
+
+
+def month_range(month):
+    """'YYYY-MM' -> 该月的毫秒时间范围 [start, end)"""
+    start = datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+class Archiver:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.archive_dir = archive_dir_of(db_name)
+        # 自己管理事务：ATTACH/DETACH不能在事务中执行
+        self.conn = sqlite3.connect(db_name, timeout=60, isolation_level=None)
+        self.columns = {table: [row[1] for row in self.conn.execute(f'PRAGMA main.table_info({table})')] for table in ARCHIVE_TABLES}
+
+    def _attach(self, path, alias):
+        self.conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+        self.conn.execute(f'PRAGMA {alias}.journal_mode=WAL')
+        for table in ARCHIVE_TABLES:
+            sql = self.conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            self.conn.execute(sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE IF NOT EXISTS {alias}.{table}', 1))
+            # 归档文件创建之后主库新增的列
+            existing = {row[1] for row in self.conn.execute(f'PRAGMA {alias}.table_info({table})')}
+            for row in self.conn.execute(f'PRAGMA main.table_info({table})').fetchall():
+                if row[1] not in existing:
+                    self.conn.execute(f'ALTER TABLE {alias}.{table} ADD COLUMN {row[1]} {row[2]}')
+        for index_sql in INDEXES:
+            # 归档中只有dead记录，不需要live检查和live统计的索引；status索引保留给过滤查询使用
+            if index_sql.split()[7] in ARCHIVE_TABLES and not any(name in index_sql for name in ARCHIVE_SKIP_INDEXES):
+                self.conn.execute(index_sql.replace('IF NOT EXISTS ', f'IF NOT EXISTS {alias}.', 1))
+
+    def _copy(self, alias, source, table, where='', params=()):
+        columns = ', '.join(self.columns[table])
+        return self.conn.execute(
+            f'INSERT OR IGNORE INTO {alias}.{table} ({columns}) SELECT {columns} FROM {source}.{table} {where}', params).rowcount
+
+    def settled_months(self, before):
+        """有早于before的已结算记录的月份，'YYYY-MM'"""
+        month = "strftime('%Y-%m', timestamp / 1000, 'unixepoch')"
+        return [row[0] for row in self.conn.execute(f'''
+            SELECT {month} FROM main.closed_channels WHERE timestamp < ?
+            UNION SELECT {month} FROM main.shutdown_cells WHERE status = 'dead' AND timestamp < ?
+            UNION SELECT {month} FROM main.open_channels WHERE status = 'dead' AND timestamp < ?
+            ORDER BY 1''', (before, before, before))]
+
+    def archive_month(self, month, before):
+        """归档该月中早于before的已结算记录，返回各表移动的行数"""
+        start, end = month_range(month)
+        params = (start, min(end, before))
+        self._attach(os.path.join(self.archive_dir, f'{month}.db'), 'archive')
+        moved = {}
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for table, where in SETTLED.items():
+                self._copy('archive', 'main', table, f'WHERE {where}', params)
+            self.conn.execute('COMMIT')
+            # 只删除已经在归档中的记录，复制之后新写入的记录留到下次
+            self.conn.execute('BEGIN IMMEDIATE')
+            for table, where in SETTLED.items():
+                exists = ' AND '.join(f'a.{key} = main.{table}.{key}' for key in UNIQUE_KEYS[table])
+                moved[table] = self.conn.execute(
+                    f'DELETE FROM main.{table} WHERE {where} AND EXISTS (SELECT 1 FROM archive.{table} a WHERE {exists})', params).rowcount
+            self.conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            print(f"Error archiving {month}: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK')
+            raise
+        finally:
+            self.conn.execute('DETACH DATABASE archive')
+        return moved
+
+    def consolidate(self):
+        """月份文件超过ARCHIVE_MONTH_FILES个时，把最早的月份合并到older.db，返回合并的文件"""
+        months = sorted(name for name in os.listdir(self.archive_dir) if MONTH_FILE.match(name))
+        merged = []
+        for name in months[:max(0, len(months) - ARCHIVE_MONTH_FILES)]:
+            path = os.path.join(self.archive_dir, name)
+            self._attach(os.path.join(self.archive_dir, OLDER_FILE), 'older')
+            self.conn.execute('ATTACH DATABASE ? AS month', (path,))
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                for table in ARCHIVE_TABLES:
+                    self._copy('older', 'month', table)
+                self.conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                print(f"Error merging {name}: {e}")
+                if self.conn.in_transaction:
+                    self.conn.execute('ROLLBACK')
+                raise
+            finally:
+                self.conn.execute('DETACH DATABASE month')
+                self.conn.execute('DETACH DATABASE older')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            merged.append(name)
+        return merged
+
+    def compact(self, names):
+        """VACUUM归档文件：归档文件之后很少写入，去掉空闲页并切回单文件模式"""
+        for name in names:
+            conn = sqlite3.connect(os.path.join(self.archive_dir, name), isolation_level=None)
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.close()
+
+    def run(self, before, vacuum=False):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        touched = set()
+        totals = dict.fromkeys(SETTLED, 0)
+        for month in self.settled_months(before):
+            moved = self.archive_month(month, before)
+            for table, count in moved.items():
+                totals[table] += count
+            touched.add(f'{month}.db')
+            print(f"archived {month}: {moved}")
+        merged = self.consolidate()
+        if merged:
+            print(f"merged {merged} into {OLDER_FILE}")
+            touched = (touched - set(merged)) | {OLDER_FILE}
+        self.compact(sorted(touched))
+        if vacuum:
+            # 需要独占主库，期间爬虫的写入会等待
+            print("vacuuming main database...")
+            self.conn.execute('VACUUM')
+        self.conn.execute('PRAGMA optimize')
+        return totals
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把已结算的旧记录移到按月划分的归档文件')
+    parser.add_argument('--db', default='fiber_monit.db')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='区块时间早于该天数的已结算记录会被归档')
+    parser.add_argument('--vacuum', action='store_true', help='归档后VACUUM主库，释放被删除记录占用的空间')
+    args = parser.parse_args()
+
+    # 确保主库表结构是最新的，归档文件按主库的表结构创建
+    db = Database(args.db)
+    db.init_db()
+    db.close()
+
+    start_time = time.time()
+    archiver = Archiver(args.db)
+    try:
+        totals = archiver.run(int(time.time() * 1000) - args.days * 24 * 60 * 60 * 1000, args.vacuum)
+    finally:
+        archiver.close()
+    print(f"archive finished in {time.time() - start_time:.1f}s: {totals}")
+
+
+if __name__ == '__main__':
+    main()
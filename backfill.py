@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.const import BEGIN_BLOCK_NUMBER, RPC_URLS, FUNDING_LOCK_CODE_HASH, COMMITMENT_LOCK_CODE_HASH
+from src.crawler import fetch_open_channel, fetch_closed_channel
+from src.database import Database
+from src.rpc_async import AsyncRPCClient, get_transactions
+from src.rpc_record import RECORD, REPLAY, RPCRecordStore
+
+logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+# 每种数据对应的lock code_hash和需要处理的io_type
+KINDS = {
+    'open_channels': (FUNDING_LOCK_CODE_HASH, 'output'),
+    'closed_channels': (COMMITMENT_LOCK_CODE_HASH, 'input'),
+}
+# 范围内每次请求的区块数，与实时爬虫一致；每批结果在一个事务中写入
+BATCH_SIZE = 1000
+# 多个回填进程和爬虫同时写主库时等待写锁的秒数
+BUSY_TIMEOUT = 60
+
+
+def open_database(db_name):
+    """回填使用的数据库连接：WAL模式，写锁冲突时等待而不是立即报database is locked"""
+    return Database(db_name, busy_timeout=BUSY_TIMEOUT, wal=True)
+
+
+async def backfill_range(db, rpc_client, kind, range_row):
+    """从该范围的next_block继续处理，每批写入后推进进度"""
+    code_hash, io_type = KINDS[kind]
+    range_start, range_end = range_row['range_start'], range_row['range_end']
+    for i in range(range_row['next_block'], range_end, BATCH_SIZE):
+        batch_end = min(i + BATCH_SIZE, range_end)
+        txs = [tx for tx in await get_transactions(rpc_client, code_hash, i, batch_end) if tx.io_type == io_type]
+        if kind == 'open_channels':
+            rows = [await fetch_open_channel(rpc_client, tx) for tx in txs]
+            db.merge_backfill_batch(kind, range_start, range_end, batch_end, open_channels=rows)
+        else:
+            results = [await fetch_closed_channel(rpc_client, tx) for tx in txs]
+            db.merge_backfill_batch(kind, range_start, range_end, batch_end,
+                                    closed_channels=[row for row, _, _ in results],
+                                    htlcs=[htlcs for _, htlcs, _ in results if htlcs],
+                                    have_htlcs=[have_htlcs for _, _, have_htlcs in results if have_htlcs])
+        print(f"backfill {kind} {range_start}-{range_end}: {batch_end} ({len(txs)} txs)")
+
+
+def create_rpc_client(rpc_urls, record=None):
+    """record为(mode, path)时把RPC请求录制到path，或只从path回放"""
+    rpc_client = AsyncRPCClient(rpc_urls)
+    if record is not None:
+        rpc_client.store = RPCRecordStore(record[1], record[0])
+    return rpc_client
+
+
+async def run_workers(tasks, workers, rpc_urls=RPC_URLS, db_name='fiber_monit.db', record=None):
+    """用workers个协程处理tasks中的(kind, range)，共用一个RPC客户端"""
+    db = open_database(db_name)
+    rpc_client = create_rpc_client(rpc_urls, record)
+    queue = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+
+    async def worker():
+        while not queue.empty():
+            kind, range_row = queue.get_nowait()
+            try:
+                await backfill_range(db, rpc_client, kind, range_row)
+            except Exception as e:
+                # 未完成的范围保留进度，下次运行时继续
+                print(f"Error in backfill {kind} {range_row['range_start']}-{range_row['range_end']}: {e}")
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(workers)])
+    finally:
+        await rpc_client.close()
+        db.close()
+        if rpc_client.store is not None:
+            rpc_client.store.close()
+            print(f"rpc {rpc_client.store.stats()}")
+
+
+def run_process(tasks, workers, rpc_urls, db_name, record=None):
+    """子进程入口，sqlite3.Row不能跨进程传递，tasks中的范围为dict"""
+    asyncio.run(run_workers(tasks, workers, rpc_urls, db_name, record))
+
+
+async def get_tip(rpc_urls, record=None):
+    rpc_client = create_rpc_client(rpc_urls, record)
+    try:
+        return await rpc_client.get_tip_block_number()
+    finally:
+        await rpc_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按区块范围并行回填历史数据')
+    parser.add_argument('--start', type=int, default=BEGIN_BLOCK_NUMBER)
+    parser.add_argument('--end', type=int, default=None, help='默认为当前tip')
+    parser.add_argument('--range-size', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=8, help='每个进程的协程数')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--kinds', default=','.join(KINDS), help='逗号分隔：' + ','.join(KINDS))
+    parser.add_argument('--rpc-url', dest='rpc_urls', action='append', default=None, help='可以指定多次，默认为RPC_URLS')
+    parser.add_argument('--db', default='fiber_monit.db')
+    record_group = parser.add_mutually_exclusive_group()
+    record_group.add_argument('--record', metavar='PATH', help='把只读RPC请求的响应录制到PATH，多个进程可以共用')
+    record_group.add_argument('--replay', metavar='PATH', help='只从PATH回放录制的响应，不访问节点')
+    args = parser.parse_args()
+    rpc_urls = args.rpc_urls or RPC_URLS
+    record = (RECORD, args.record) if args.record else (REPLAY, args.replay) if args.replay else None
+
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    for kind in kinds:
+        if kind not in KINDS:
+            parser.error(f"unknown kind: {kind}")
+    end = args.end if args.end is not None else asyncio.run(get_tip(rpc_urls, record))
+
+    db = open_database(args.db)
+    db.init_db()
+    tasks = []
+    for kind in kinds:
+        db.plan_backfill_ranges(kind, args.start, end, args.range_size)
+        tasks.extend((kind, dict(row)) for row in db.get_pending_backfill_ranges(kind, args.start, end))
+    db.close()
+    print(f"backfill {len(tasks)} ranges in [{args.start}, {end}) with {args.processes} process(es) x {args.workers} workers")
+
+    start_time = time.time()
+    if args.processes > 1:
+        # 轮流分配，使每个进程拿到的区块范围分布相近
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            futures = [executor.submit(run_process, tasks[i::args.processes], args.workers, rpc_urls, args.db, record)
+                       for i in range(args.processes)]
+            for future in futures:
+                future.result()
+    else:
+        asyncio.run(run_workers(tasks, args.workers, rpc_urls, args.db, record))
+    print(f"backfill finished in {time.time() - start_time:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""比较各JSON codec解析一页get_transactions/get_cells结果的耗时
+
+decode为只解析为dict；dict为先解析为dict再用schema转换为记录；
+call调用rpc_async.decode_response，与AsyncRPCClient.call(schema=...)的解析路径相同：
+msgspec按records中的Struct类型直接解析响应字节（path为typed），其他codec与dict列相同（path为dict）
+
+用法: python bench/bench_codec.py [--objects 65535] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.json_codec import CODECS, StdlibCodec  # noqa: E402
+from src.records import CELL_PAGE, TX_PAGE  # noqa: E402
+from src.rpc_async import decode_response, is_typed_decode  # noqa: E402
+
+
+def make_tx_page(count):
+    objects = []
+    for i in range(count):
+        objects.append({
+            "block_number": hex(18483877 + i // 4),
+            "io_index": hex(i % 3),
+            "io_type": "output" if i % 2 else "input",
+            "tx_hash": "0x" + f"{i:064x}",
+            "tx_index": hex(i % 7),
+        })
+    return {"id": 42, "jsonrpc": "2.0", "result": {"last_cursor": "0x" + "ab" * 60, "objects": objects}}
+
+
+def make_cell_page(count):
+    objects = []
+    for i in range(count):
+        objects.append({
+            "block_number": hex(18483877 + i),
+            "out_point": {"index": "0x0", "tx_hash": "0x" + f"{i:064x}"},
+            "output": {
+                "capacity": hex(6100000000 + i),
+                "lock": {"args": "0x" + "11" * 56, "code_hash": "0x" + "22" * 32, "hash_type": "type"},
+                "type": {"args": "0x" + "33" * 32, "code_hash": "0x" + "44" * 32, "hash_type": "type"} if i % 2 else None,
+            },
+            "output_data": "0x" + f"{i:032x}" if i % 2 else "0x",
+            "tx_index": "0x1",
+        })
+    return {"id": 42, "jsonrpc": "2.0", "result": {"last_cursor": "0x" + "ab" * 60, "objects": objects}}
+
+
+def available_codecs():
+    codecs = []
+    for codec_class in CODECS.values():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            continue
+    return codecs
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, default=0xffff)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    encoder = StdlibCodec()
+    pages = [
+        ("get_transactions", encoder.dumps(make_tx_page(args.objects)), TX_PAGE),
+        ("get_cells", encoder.dumps(make_cell_page(args.objects)), CELL_PAGE),
+    ]
+    print(f"{'method':<18}{'codec':<10}{'size':>10}{'decode ms':>12}{'dict ms':>10}{'call ms':>10}{'path':>7}")
+    for method, raw, schema in pages:
+        for codec in available_codecs():
+            decode = measure(lambda: codec.loads(raw), args.repeat)
+            two_pass = measure(lambda: schema(codec.loads(raw)["result"]), args.repeat)
+            call = measure(lambda: decode_response(codec, raw, schema), args.repeat)
+            path = "typed" if is_typed_decode(codec, schema) else "dict"
+            print(f"{method:<18}{codec.name:<10}{len(raw) // 1024:>8}KB{decode * 1000:>12.1f}{two_pass * 1000:>10.1f}{call * 1000:>10.1f}{path:>7}")
+
+if __name__ == "__main__":
+    main()
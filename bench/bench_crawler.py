@@ -0,0 +1,215 @@
+"""对本地模拟节点（bench/mock_ckb.py）运行爬虫各组件，输出吞吐量、每条记录的RPC请求数和峰值内存
+
+模拟节点在子进程中运行，不和爬虫争用同一个事件循环；爬取结果和合成链的期望记录数对比，
+不一致时ok列为NO，可以用来验证爬虫优化没有改变结果。
+
+用法: python bench/bench_crawler.py [--blocks 20000] [--channels-per-1k 20] [--latency-ms 2] [--error-rate 0]
+                                    [--components open,shutdown,closed,live,epochs] [--trace-memory] [--verbose]
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_ckb import add_chain_arguments, chain_from_args  # noqa: E402
+from src import crawler  # noqa: E402
+from src.database import Database  # noqa: E402
+from src.metrics import RPCMetricsObserver  # noqa: E402
+from src.rpc_async import AsyncRPCClient  # noqa: E402
+
+
+class CountingObserver(RPCMetricsObserver):
+    """在metrics之外按方法统计实际发出的请求数（不包括被合并的调用）"""
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.errors = 0
+
+    def on_request(self, method, seconds):
+        super().on_request(method, seconds)
+        self.requests[method] += 1
+
+    def on_error(self, method):
+        super().on_error(method)
+        self.errors += 1
+
+
+def _count(db, sql):
+    with db.get_connection() as conn:
+        return conn.execute(sql).fetchone()[0]
+
+
+# 组件名 -> (执行函数, 是否按区块范围扫描, 处理的记录数, 期望的记录数)
+COMPONENTS = {
+    "open": (
+        crawler.crawl_open_channels, True,
+        lambda db: _count(db, "SELECT COUNT(*) FROM open_channels"),
+        lambda expected: expected["open_channels"],
+    ),
+    "shutdown": (
+        crawler.crawl_shutdown_channels, True,
+        lambda db: _count(db, "SELECT COUNT(*) FROM shutdown_cells"),
+        lambda expected: expected["shutdown_cells"],
+    ),
+    "closed": (
+        crawler.crawl_closed_channels, True,
+        lambda db: _count(db, "SELECT COUNT(*) FROM closed_channels") + _count(db, "SELECT COUNT(*) FROM htlcs"),
+        lambda expected: expected["closed_channels"] + expected["htlcs"],
+    ),
+    "live": (
+        None, False,
+        lambda db: _count(db, "SELECT COUNT(*) FROM open_channels WHERE next_check_at IS NOT NULL")
+        + _count(db, "SELECT COUNT(*) FROM shutdown_cells WHERE next_check_at IS NOT NULL"),
+        lambda expected: expected["live_open_channels"] + expected["shutdown_cells"],
+    ),
+    "epochs": (
+        crawler.crawl_epochs, False,
+        lambda db: _count(db, "SELECT COUNT(*) FROM epochs"),
+        lambda expected: expected["epochs"],
+    ),
+}
+
+
+# 组件名 -> [(名称, 数据库中的值, 期望值)]：除记录数外还需要一致的统计
+EXTRA_CHECKS = {
+    "shutdown": [
+        ("have_htlcs", lambda db: _count(db, "SELECT COUNT(*) FROM shutdown_cells WHERE have_htlcs = 1"),
+         lambda expected: expected["shutdown_cells_have_htlcs"]),
+        ("unknown_htlcs", lambda db: _count(db, "SELECT COUNT(*) FROM shutdown_cells WHERE have_htlcs IS NULL"),
+         lambda expected: expected["shutdown_cells_unknown_htlcs"]),
+    ],
+}
+
+
+async def check_live(db, rpc_client):
+    """每轮最多检查LIVE_CHECK_BATCH条，这里一直检查到没有到期的记录"""
+    now = int(time.time() * 1000)
+    while db.get_due_live_open_channels_count(now) or db.get_due_live_shutdown_channels_count(now):
+        await crawler.check_open_channels_live_status(db, rpc_client)
+        await crawler.check_shutdown_channels_live_status(db, rpc_client)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args, port):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_ckb.py"), "--port", str(port)]
+    for name in ("blocks", "channels_per_1k", "shutdown_ratio", "close_ratio", "htlc_ratio", "udt_ratio", "v2_ratio", "seed",
+                 "latency_ms", "latency_jitter_ms", "error_rate"):
+        command += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # 第一行输出表示链已生成
+    process.stdout.readline()
+    for _ in range(100):
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.1):
+            return process
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock ckb node did not start")
+
+
+async def run_component(name, db, rpc_client, blocks, expected, trace_memory, verbose):
+    func, scans_blocks, count, expect = COMPONENTS[name]
+    func = func or check_live
+    observer = rpc_client.observer = CountingObserver()
+    if trace_memory:
+        tracemalloc.start()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output:
+        await func(db, rpc_client)
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        # 不开启tracemalloc时只能得到进程的最大RSS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    items = count(db)
+    calls = sum(observer.requests.values())
+    mismatches = []
+    for check_name, actual, expect_value in EXTRA_CHECKS.get(name, []):
+        if actual(db) != expect_value(expected):
+            mismatches.append(f"{check_name}: {actual(db)} != {expect_value(expected)}")
+    if mismatches:
+        print(f"{name} mismatch: {', '.join(mismatches)}")
+    return {
+        "component": name,
+        "seconds": elapsed,
+        "blocks_per_second": blocks / elapsed if scans_blocks else None,
+        "items": items,
+        "items_per_second": items / elapsed,
+        "rpc_calls": calls,
+        "calls_per_item": calls / items if items else None,
+        "rpc_errors": observer.errors,
+        "peak_mb": peak / 1024 / 1024,
+        "ok": items == expect(expected) and not mismatches,
+    }
+
+
+def print_results(results, trace_memory):
+    memory = "peak MB" if trace_memory else "max RSS MB"
+    print(f"{'component':<10}{'seconds':>9}{'blocks/s':>11}{'items':>8}{'items/s':>9}{'rpc':>8}{'rpc/item':>10}{'errors':>8}{memory:>12}{'ok':>5}")
+    for r in results:
+        blocks = f"{r['blocks_per_second']:.0f}" if r["blocks_per_second"] is not None else "-"
+        per_item = f"{r['calls_per_item']:.2f}" if r["calls_per_item"] is not None else "-"
+        print(f"{r['component']:<10}{r['seconds']:>9.2f}{blocks:>11}{r['items']:>8}{r['items_per_second']:>9.1f}"
+              f"{r['rpc_calls']:>8}{per_item:>10}{r['rpc_errors']:>8}{r['peak_mb']:>12.1f}{'yes' if r['ok'] else 'NO':>5}")
+
+
+async def run(args, url, expected):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        db.init_db()
+        rpc_client = AsyncRPCClient(url)
+        try:
+            for name in args.components.split(","):
+                results.append(await run_component(name, db, rpc_client, args.blocks, expected, args.trace_memory, args.verbose))
+        finally:
+            await rpc_client.close()
+            db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫组件基准测试")
+    add_chain_arguments(parser)
+    parser.add_argument("--components", default=",".join(COMPONENTS), help="逗号分隔，按顺序执行：" + ",".join(COMPONENTS))
+    parser.add_argument("--trace-memory", action="store_true", help="用tracemalloc统计每个组件的峰值内存（会变慢）")
+    parser.add_argument("--verbose", action="store_true", help="显示爬虫的输出")
+    args = parser.parse_args()
+    for name in args.components.split(","):
+        if name not in COMPONENTS:
+            parser.error(f"unknown component: {name}")
+
+    expected = chain_from_args(args).expected()
+    port = free_port()
+    process = start_mock(args, port)
+    try:
+        print(f"chain: {args.blocks} blocks, expected {expected}")
+        results = asyncio.run(run(args, f"http://127.0.0.1:{port}/", expected))
+    finally:
+        process.terminate()
+        process.wait()
+    print_results(results, args.trace_memory)
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
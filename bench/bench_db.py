@@ -0,0 +1,402 @@
+"""对gen_dataset.py生成的数据库压测Database方法和API接口，结果保存为JSON以便对比
+
+Database方法在单线程中逐个调用repeat次；API在子进程中以多线程WSGI服务器运行，
+每个接口用concurrency个线程持续请求duration秒。输出p50/p99延迟和QPS，--compare与之前的结果对比。
+写入类方法只使用已存在的数据（INSERT OR IGNORE、状态不变的UPDATE），不改变数据集。
+
+用法: python bench/bench_db.py --db /tmp/bench_1m.db [--repeat 50] [--concurrency 8] [--duration 5]
+                               [--output results.json] [--compare baseline.json] [--skip-db] [--skip-api]
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.columnar import ColumnSnapshot  # noqa: E402
+from src.dashboard import DashboardExporter  # noqa: E402
+from src.database import Database  # noqa: E402
+from src.live_history import DAY_MS, HOUR_MS, LIVE_STATS_FIELDS  # noqa: E402
+
+# 不压测的方法：建表、连接管理和回填、epoch、trace等批量写入
+SKIPPED_METHODS = {
+    'init_db', 'get_connection', 'close', 'insert_htlcs', 'insert_epochs', 'save_channel_trace',
+    'plan_backfill_ranges', 'merge_backfill_batch', 'update_open_channels_next_check', 'update_shutdown_channels_next_check',
+}
+
+
+class Samples:
+    """从数据集中随机取参数"""
+
+    def __init__(self, db, count=1000):
+        with db.get_connection() as conn:
+            self.open = [dict(row) for row in conn.execute(
+                'SELECT * FROM open_channels WHERE id IN (SELECT abs(random()) % (SELECT MAX(id) FROM open_channels) + 1 FROM open_channels LIMIT ?)', (count,))]
+            self.shutdown = [dict(row) for row in conn.execute(
+                'SELECT * FROM shutdown_cells WHERE id IN (SELECT abs(random()) % (SELECT MAX(id) FROM shutdown_cells) + 1 FROM shutdown_cells LIMIT ?)', (count,))]
+            self.closed = [dict(row) for row in conn.execute(
+                'SELECT * FROM closed_channels WHERE id IN (SELECT abs(random()) % (SELECT MAX(id) FROM closed_channels) + 1 FROM closed_channels LIMIT ?)', (count,))]
+            self.max_closed_id = conn.execute('SELECT MAX(id) FROM closed_channels').fetchone()[0] or 0
+            self.max_shutdown_id = conn.execute('SELECT MAX(id) FROM shutdown_cells').fetchone()[0] or 0
+            first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM open_channels').fetchone()
+        self.first_date = datetime.utcfromtimestamp((first or 0) / 1000).date()
+        self.last_date = datetime.utcfromtimestamp((last or 0) / 1000).date()
+
+    def open_row(self):
+        return random.choice(self.open)
+
+    def shutdown_row(self):
+        return random.choice(self.shutdown)
+
+    def closed_row(self):
+        return random.choice(self.closed)
+
+    def date(self):
+        days = (self.last_date - self.first_date).days
+        return str(self.first_date + timedelta(days=random.randint(0, max(days, 0))))
+
+    def date_range(self, days=30):
+        start = datetime.strptime(self.date(), '%Y-%m-%d').date()
+        return str(start), str(start + timedelta(days=days))
+
+    def page(self, max_page=100):
+        return random.randint(1, max_page)
+
+    def hash_prefix(self):
+        return self.open_row()['tx_hash'][:8]
+
+
+def db_cases(s):
+    """方法名 -> 返回调用参数 (args, kwargs) 的函数"""
+    now = int(time.time() * 1000)
+    return {
+        'insert_open_channel': lambda: (tuple(s.open_row()[k] for k in ('block_number', 'tx_hash', 'status', 'ckb_capacity', 'udt_capacity', 'timestamp_status_update', 'timestamp')), {}),
+        'insert_shutdown_cell': lambda: (tuple(s.shutdown_row()[k] for k in ('block_number', 'pre_tx_hash', 'tx_hash', 'status', 'ckb_capacity', 'udt_capacity', 'delay_epoch', 'have_htlcs', 'timestamp_status_update', 'timestamp')), {}),
+        'insert_closed_channel': lambda: (tuple(s.closed_row()[k] for k in ('block_number', 'pre_tx_hash', 'tx_hash', 'ckb_fee', 'udt_fee', 'timestamp')), {}),
+        'get_htlcs_by_commitment_tx_hash': lambda: ((s.shutdown_row()['tx_hash'],), {}),
+        'get_htlc_summary': lambda: ((), {}),
+        'get_upcoming_htlc_expiries': lambda: ((now,), {}),
+        'get_open_channels': lambda: ((s.page(),), {}),
+        'get_open_channels_count': lambda: ((), {}),
+        'get_open_channels_by_status': lambda: (('live', s.page()), {}),
+        'get_open_channels_count_by_status': lambda: (('live',), {}),
+        'get_live_open_channels_count': lambda: ((), {}),
+        'get_all_live_open_channels': lambda: ((), {}),
+        'update_open_channel_status': lambda: (tuple(s.open_row()[k] for k in ('tx_hash', 'status')), {}),
+        'get_due_live_open_channels': lambda: ((now, 200), {}),
+        'get_due_live_open_channels_count': lambda: ((now,), {}),
+        'get_all_live_shutdown_channels': lambda: ((), {}),
+        'update_shutdown_channel_status': lambda: (tuple(s.shutdown_row()[k] for k in ('tx_hash', 'status')), {}),
+        'get_due_live_shutdown_channels': lambda: ((now, 200), {}),
+        'get_due_live_shutdown_channels_count': lambda: ((now,), {}),
+        'get_last_open_channel': lambda: ((), {}),
+        'get_shutdown_channels': lambda: ((s.page(),), {}),
+        'get_shutdown_channels_count': lambda: ((), {}),
+        'get_shutdown_channels_by_status': lambda: (('live', s.page()), {}),
+        'get_shutdown_channels_count_by_status': lambda: (('live',), {}),
+        'get_live_shutdown_cells_count': lambda: ((), {}),
+        'update_shutdown_cell_have_htlcs': lambda: (([(s.shutdown_row()['tx_hash'], True)],), {}),
+        'mark_shutdown_cells_due': lambda: (([s.shutdown_row()['tx_hash']],), {}),
+        'get_shutdown_cell_by_tx_hash': lambda: ((s.shutdown_row()['tx_hash'],), {}),
+        'get_closed_channels': lambda: ((s.page(),), {}),
+        'get_closed_channels_count': lambda: ((), {}),
+        # FeeStats每次只增量读取新增的记录
+        'get_closed_channel_fees_after': lambda: ((max(s.max_closed_id - 1000, 0),), {}),
+        # 告警按游标读取新增的shutdown cell
+        'get_changes_after': lambda: (('shutdown_cells', max(s.max_shutdown_id - 100, 0)), {}),
+        'get_max_id': lambda: (('closed_channels',), {}),
+        # 列式快照每次追加一批新增记录，并读取live的id同步状态
+        'get_snapshot_rows': lambda: (('closed_channels', ['block_number', 'timestamp', 'ckb_fee'], max(s.max_closed_id - 1000, 0), 1000), {}),
+        'get_live_ids': lambda: (('shutdown_cells',), {}),
+        'get_last_close_channel': lambda: ((), {}),
+        'filter_channels': lambda: (('open_channels', [('status', '=', 'live'), ('ckb_capacity', '>=', 10**12)]), {}),
+        'search_tx_hash_prefix': lambda: ((s.hash_prefix(),), {}),
+        'get_channel_trace': lambda: ((s.open_row()['tx_hash'],), {}),
+        'save_metrics_snapshot': lambda: (('bench', '[]'), {}),
+        'get_metrics_snapshots': lambda: ((), {}),
+        'get_live_stats': lambda: ((), {}),
+        'record_live_stats': lambda: (({field: 1 for field in LIVE_STATS_FIELDS}, now), {}),
+        'get_live_stats_history': lambda: ((HOUR_MS, now - 7 * DAY_MS, now, HOUR_MS), {}),
+        'get_max_epoch_number': lambda: ((), {}),
+        'get_epochs': lambda: ((), {}),
+        'get_live_shutdown_cells_delay': lambda: ((), {}),
+        'get_pending_backfill_ranges': lambda: (('open_channels', 0, 1 << 62), {}),
+        'get_channel_lifecycle': lambda: ((s.open_row()['tx_hash'],), {}),
+        'get_channel_statistics': lambda: ((), {}),
+        'get_related_channels': lambda: ((s.open_row()['tx_hash'],), {}),
+        'get_daily_channel_stats': lambda: ((s.date(),), {}),
+        'get_date_range_channel_stats': lambda: (s.date_range(), {}),
+    }
+
+
+def api_cases(s):
+    """接口名 -> 返回请求路径的函数"""
+    return {
+        'open_channels': lambda: f'/open_channels?page={s.page()}',
+        'open_channels_live': lambda: f'/open_channels?status=live&page={s.page()}',
+        'open_channels_deep_page': lambda: f'/open_channels?page={s.page(10000)}',
+        'shutdown_channels': lambda: f'/shutdown_channels?page={s.page()}',
+        'shutdown_channels_live': lambda: f'/shutdown_channels?status=live&page={s.page()}',
+        'closed_channels': lambda: f'/closed_channels?page={s.page()}',
+        'filter_open_channels': lambda: '/filter/open_channels?status=live&ckb_capacity_min=1000000000000',
+        'filter_shutdown_cells': lambda: '/filter/shutdown_cells?status=live&have_htlcs=1',
+        'changes': lambda: f'/changes/shutdown_cells?after_id={max(s.max_shutdown_id - 100, 0)}',
+        'search': lambda: f'/search?q={s.hash_prefix()}',
+        'dashboard': lambda: '/dashboard',
+        'analytics_capacity': lambda: '/analytics/capacity?table=open_channels&status=live',
+        'analytics_durations': lambda: '/analytics/durations',
+        'channel_lifecycle': lambda: f"/channel_lifecycle/{s.open_row()['tx_hash']}",
+        'htlc_stats': lambda: '/htlc_stats',
+        'fee_stats': lambda: '/fee_stats?period=day',
+        'fee_stats_window': lambda: '/fee_stats?period=all&window_days=30',
+        'maturity': lambda: '/maturity',
+        'live_stats': lambda: '/live_stats',
+        'live_stats_history': lambda: '/live_stats/history?from={}'.format(int(time.time() * 1000) - 30 * DAY_MS),
+        'daily_stats': lambda: f'/daily_stats?date={s.date()}',
+        'daily_stats_range': lambda: '/daily_stats?start_date={}&end_date={}'.format(*s.date_range()),
+        'channel_statistics': lambda: '/channel_statistics',
+        'related_channels': lambda: f"/related_channels/{s.open_row()['tx_hash']}",
+        'metrics': lambda: '/metrics',
+    }
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0, 'errors': errors}
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'qps': len(latencies) / elapsed if elapsed else None,
+    }
+
+
+def bench_db(db, samples, repeat):
+    cases = db_cases(samples)
+    public = {name for name, func in inspect.getmembers(Database, inspect.isfunction) if not name.startswith('_')}
+    missing = sorted(public - set(cases) - SKIPPED_METHODS)
+    if missing:
+        print(f"not benchmarked (add to db_cases or SKIPPED_METHODS): {', '.join(missing)}")
+
+    results = {}
+    for name, make_args in cases.items():
+        method = getattr(db, name)
+        latencies = []
+        error = None
+        start = time.perf_counter()
+        for _ in range(repeat):
+            args, kwargs = make_args()
+            call_start = time.perf_counter()
+            try:
+                method(*args, **kwargs)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                break
+            latencies.append(time.perf_counter() - call_start)
+        result = summarize(latencies, time.perf_counter() - start, 1 if error else 0)
+        if error:
+            result['error'] = error
+        results[name] = result
+        print(format_row(name, result), flush=True)
+    return results
+
+
+def bench_api(base_url, samples, concurrency, duration):
+    results = {}
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    for name, make_path in api_cases(samples).items():
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            while time.perf_counter() < deadline:
+                path = make_path()
+                start = time.perf_counter()
+                try:
+                    ok = session().get(base_url + path, timeout=60).status_code < 400
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[name] = summarize(latencies, time.perf_counter() - start, errors[0])
+        print(format_row(name, results[name]), flush=True)
+    return results
+
+
+def format_row(name, result):
+    if not result['count']:
+        return f"{name:<40}{'failed':>10}  {result.get('error', '')}"
+    errors = f"  errors {result['errors']}" if result['errors'] else ''
+    return f"{name:<40}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['qps']:>10.1f}{errors}"
+
+
+def serve(db_name, port):
+    """API子进程入口：使用指定的数据库，在多线程WSGI服务器上运行app"""
+    from werkzeug.serving import make_server
+    import src.app as api
+    from src.analytics import Analytics
+    from src.columnar import ColumnStore, columns_dir_of
+    from src.dashboard import DashboardCache, dashboard_path_of
+    from src.fee_stats import FeeStats
+    from src.maturity import MaturityForecast
+
+    api.db = Database(db_name)
+    api.column_store = ColumnStore(columns_dir_of(db_name))
+    api.fee_stats = FeeStats(api.db, api.column_store)
+    api.analytics = Analytics(api.column_store)
+    api.dashboard_cache = DashboardCache(dashboard_path_of(db_name))
+    api.maturity_forecast = MaturityForecast(api.db)
+    make_server('127.0.0.1', port, api.app, threaded=True).serve_forever()
+
+
+def start_api(db_name):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    # src.app导入时会在当前目录创建默认数据库文件，在临时目录中启动
+    workdir = tempfile.mkdtemp()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--db', os.path.abspath(db_name), '--port', str(port)],
+                               cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(200):
+        try:
+            requests.get(base_url + '/live_stats', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('api server did not start')
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} ({baseline['meta'].get('timestamp')})")
+    print(f"{'name':<40}{'p50 old':>10}{'p50 new':>10}{'change':>9}{'p99 old':>10}{'p99 new':>10}{'change':>9}")
+    for section in ('db', 'api'):
+        for name, new in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not old or not old.get('count') or not new.get('count'):
+                continue
+            p50 = (new['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0
+            p99 = (new['p99_ms'] / old['p99_ms'] - 1) * 100 if old['p99_ms'] else 0
+            print(f"{section + '.' + name:<40}{old['p50_ms']:>10.2f}{new['p50_ms']:>10.2f}{p50:>+8.0f}%"
+                  f"{old['p99_ms']:>10.2f}{new['p99_ms']:>10.2f}{p99:>+8.0f}%")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database方法和API接口压测')
+    parser.add_argument('--db', required=True, help='gen_dataset.py生成的数据库')
+    parser.add_argument('--repeat', type=int, default=50, help='每个Database方法的调用次数')
+    parser.add_argument('--concurrency', type=int, default=8, help='API压测的并发线程数')
+    parser.add_argument('--duration', type=float, default=5, help='每个接口的压测秒数')
+    parser.add_argument('--output', default=None, help='结果JSON路径，默认为bench_db-<时间>.json')
+    parser.add_argument('--compare', default=None, help='与之前保存的结果JSON对比')
+    parser.add_argument('--skip-db', action='store_true')
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.db, args.port)
+        return
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist, generate it with bench/gen_dataset.py")
+
+    db = Database(args.db)
+    samples = Samples(db)
+    with db.get_connection() as conn:
+        rows = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('open_channels', 'shutdown_cells', 'closed_channels', 'htlcs')}
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'db': os.path.abspath(args.db),
+            'rows': rows,
+            'repeat': args.repeat,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+    }
+    print(f"dataset: {rows}")
+    header = f"{'name':<40}{'p50 ms':>10}{'p99 ms':>10}{'qps':>10}"
+
+    if not args.skip_db:
+        print(f"\nDatabase methods ({args.repeat} calls each)\n{header}")
+        results['db'] = bench_db(db, samples, args.repeat)
+    if not args.skip_api:
+        # /analytics/* 和 /dashboard 读取爬虫生成的快照，压测前先更新到数据集的最新状态
+        ColumnSnapshot(db).update()
+        DashboardExporter(db).export()
+    db.close()
+
+    if not args.skip_api:
+        print(f"\nAPI endpoints ({args.concurrency} concurrent, {args.duration}s each)\n{header}")
+        process, base_url = start_api(args.db)
+        try:
+            results['api'] = bench_api(base_url, samples, args.concurrency, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+    output = args.output or f"bench_db-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults saved to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""回放合成链最后一段时间的shutdown cell，比较have_htlcs按不同方式得到时live检查的RPC数量
+
+使用bench/mock_ckb.py的合成链（V1/V2 commitment lock混合）：cell在commitment交易上链时进入检查队列，
+按分钟推进时间，每轮最多检查LIVE_CHECK_BATCH条到期的记录（与crawler.check_shutdown_channels_live_status一致），
+检查时已被花费的cell记为发现变化并移出队列。对比：
+  every_5min   分级调度之前，每5分钟检查全部live记录
+  args_length  分级调度，args长度超过固定字段即认为有htlc（旧逻辑，V2的settlement_hash导致全部为有htlc）
+  decoded      分级调度，have_htlcs为commitment_lock.decode_lock_args的结果（V1按args判断，V2未知，到期前按有htlc处理）
+  spend_scan   decoded加上live_check.ShutdownSpendScanner：每分钟一次get_indexer_tip和一次get_transactions，
+               每笔花费一次get_transaction，被花费的cell在同一轮立即检查；逐个检查只按时长和金额兜底
+scan rpc为扫描使用的RPC数，total为检查和扫描的RPC总数。
+
+用法: python bench/bench_live_check.py [--blocks 200000] [--channels-per-1k 20] [--v2-ratio 0.8] [--hours 24]
+"""
+import argparse
+import heapq
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.mock_ckb import add_chain_arguments, block_timestamp, chain_from_args  # noqa: E402
+from src.commitment_lock import LOCK_ARGS_BASE_LEN, decode_lock_args  # noqa: E402
+from src.const import COMMITMENT_LOCK_CODE_HASH  # noqa: E402
+from src.live_check import LIVE_CHECK_BATCH, MINUTE_MS, shutdown_cell_next_check  # noqa: E402
+
+# 每轮扫描固定的RPC数：get_indexer_tip和一页get_transactions
+SCAN_RPCS_PER_MINUTE = 2
+
+# 名称 -> (have_htlcs, 下次检查时间, 每轮最多检查数, 是否扫描花费)
+POLICIES = {
+    # 分级调度之前：每5分钟检查全部live记录
+    'every_5min': (lambda args: decode_lock_args(args)['has_htlcs'], lambda row, now: now + 5 * MINUTE_MS, None, False),
+    'args_length': (lambda args: len(args) - 2 > LOCK_ARGS_BASE_LEN, shutdown_cell_next_check, LIVE_CHECK_BATCH, False),
+    'decoded': (lambda args: decode_lock_args(args)['has_htlcs'], shutdown_cell_next_check, LIVE_CHECK_BATCH, False),
+    'spend_scan': (lambda args: decode_lock_args(args)['has_htlcs'], lambda row, now: shutdown_cell_next_check(row, now, True), LIVE_CHECK_BATCH, True),
+}
+
+
+def shutdown_cells(chain):
+    """合成链中所有commitment cell，字段与Database.get_due_live_shutdown_channels一致，
+    另外记录上链时间created和被花费的时间spent（没有被花费为None）"""
+    spent_at = {}
+    for block_number, _, io_type, io_index, tx_hash in chain.code_index[COMMITMENT_LOCK_CODE_HASH]:
+        if io_type == 'input':
+            previous = chain.txs[tx_hash]['transaction']['inputs'][io_index]['previous_output']
+            spent_at[(previous['tx_hash'], int(previous['index'], 16))] = block_timestamp(block_number)
+    cells = []
+    for block_number, _, io_type, io_index, tx_hash in chain.code_index[COMMITMENT_LOCK_CODE_HASH]:
+        if io_type != 'output':
+            continue
+        tx = chain.txs[tx_hash]['transaction']
+        output = tx['outputs'][io_index]
+        data = tx['outputs_data'][io_index]
+        lock_args = decode_lock_args(output['lock']['args'])
+        cells.append({
+            'args': output['lock']['args'],
+            'lock_version': lock_args['lock_version'],
+            'ckb_capacity': int(output['capacity'], 16),
+            'udt_capacity': int.from_bytes(bytes.fromhex(data[2:34]), 'little') if len(data) > 2 else 0,
+            'delay_epoch': lock_args['delay_epoch']['number'],
+            'timestamp': block_timestamp(block_number),
+            'created': block_timestamp(block_number),
+            'spent': spent_at.get((tx_hash, io_index)),
+        })
+    return cells
+
+
+def simulate(cells, have_htlcs, next_check, batch_size, scan, start, minutes):
+    """返回 (检查次数, 扫描RPC数, 发现的花费数, 平均发现延迟(分钟), 结束时积压的到期记录数)"""
+    rows = sorted((dict(cell, have_htlcs=have_htlcs(cell['args'])) for cell in cells
+                   if cell['created'] < start + minutes * MINUTE_MS and (cell['spent'] is None or cell['spent'] >= start)),
+                  key=lambda row: row['created'])
+    spends = sorted((row['spent'], i) for i, row in enumerate(rows) if row['spent'] is not None)
+    # (下次检查时间, 序号)，新记录在上链时立即到期；due[i]为当前有效的检查时间，堆中其他项已过期
+    queue = []
+    due = {}
+    pending = 0
+    next_spend = 0
+    checks = 0
+    scan_rpcs = 0
+    detected = []
+    for minute in range(minutes):
+        now = start + minute * MINUTE_MS
+        while pending < len(rows) and rows[pending]['created'] <= now:
+            due[pending] = max(rows[pending]['created'], start)
+            heapq.heappush(queue, (due[pending], pending))
+            pending += 1
+        if scan:
+            scan_rpcs += SCAN_RPCS_PER_MINUTE
+            # 上一轮之后被花费的cell：每笔花费一次get_transaction，标记为立即检查
+            while next_spend < len(spends) and spends[next_spend][0] <= now:
+                i = spends[next_spend][1]
+                next_spend += 1
+                if spends[next_spend - 1][0] < start:
+                    continue
+                scan_rpcs += 1
+                if i in due:
+                    due[i] = 0
+                    heapq.heappush(queue, (0, i))
+        batch = []
+        while queue and queue[0][0] <= now and (batch_size is None or len(batch) < batch_size):
+            scheduled, i = heapq.heappop(queue)
+            if due.get(i) == scheduled:
+                batch.append(i)
+        for i in batch:
+            checks += 1
+            row = rows[i]
+            if row['spent'] is not None and row['spent'] <= now:
+                detected.append(now - max(row['spent'], start))
+                del due[i]
+                continue
+            due[i] = next_check(row, now)
+            heapq.heappush(queue, (due[i], i))
+    backlog = sum(1 for scheduled in due.values() if scheduled <= start + minutes * MINUTE_MS)
+    delay = sum(detected) / len(detected) / MINUTE_MS if detected else 0
+    return checks, scan_rpcs, len(detected), delay, backlog
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较have_htlcs的不同判断方式下shutdown cell的live检查次数')
+    add_chain_arguments(parser)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.set_defaults(blocks=200000)
+    args = parser.parse_args()
+
+    chain = chain_from_args(args)
+    cells = shutdown_cells(chain)
+    start = block_timestamp(chain.tip) - args.hours * 60 * MINUTE_MS
+    live = [cell for cell in cells if cell['spent'] is None or cell['spent'] >= start]
+    v2 = sum(1 for cell in live if cell['lock_version'] == 2)
+    print(f"shutdown cells live during the last {args.hours}h: {len(live)} (V1 {len(live) - v2}, V2 {v2}), batch {LIVE_CHECK_BATCH}/min")
+    print(f"{'policy':<14}{'have_htlcs':>12}{'checks':>10}{'scan rpc':>10}{'total':>10}{'detected':>10}{'delay min':>11}{'end backlog':>13}")
+    for name, (have_htlcs, next_check, batch_size, scan) in POLICIES.items():
+        flagged = sum(1 for cell in live if have_htlcs(cell['args']))
+        checks, scan_rpcs, detected, delay, backlog = simulate(cells, have_htlcs, next_check, batch_size, scan, start, args.hours * 60)
+        print(f"{name:<14}{flagged:>12}{checks:>10}{scan_rpcs:>10}{checks + scan_rpcs:>10}{detected:>10}{delay:>11.1f}{backlog:>13}")
+
+
+if __name__ == '__main__':
+    main()
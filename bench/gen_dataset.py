@@ -0,0 +1,160 @@
+"""生成用于压测的合成数据库：open_channels、shutdown_cells、closed_channels和htlcs
+
+每条open channel有一定概率进入shutdown，shutdown cell再有一定概率被领取成为closed channel，
+tx_hash/pre_tx_hash与爬虫写入的关联方式一致；金额为对数正态分布，区块按时间均匀分布且越靠近tip越密集。
+写入前删除索引，写完后由init_db重新创建。
+
+用法: python bench/gen_dataset.py --rows 1000000 --db /tmp/bench_1m.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.const import BEGIN_BLOCK_NUMBER  # noqa: E402
+from src.database import INDEXES, INSERT_HTLC_SQL, Database  # noqa: E402
+
+BLOCK_INTERVAL_MS = 8000
+BLOCKS_PER_DAY = 24 * 60 * 60 * 1000 // BLOCK_INTERVAL_MS
+SHANNONS = 10**8
+CHUNK = 100000
+
+
+def _hashes(rng, count):
+    data = rng.bytes(32 * count).hex()
+    return ["0x" + data[i:i + 64] for i in range(0, len(data), 64)]
+
+
+def _log_normal(rng, median, sigma, count):
+    return np.exp(rng.normal(np.log(median), sigma, count))
+
+
+class DatasetGenerator:
+    def __init__(self, rows, days=365, shutdown_ratio=0.45, close_ratio=0.85, htlc_ratio=0.2, udt_ratio=0.2, seed=1):
+        self.rows = rows
+        self.blocks = days * BLOCKS_PER_DAY
+        self.tip = BEGIN_BLOCK_NUMBER + self.blocks
+        self.shutdown_ratio = shutdown_ratio
+        self.close_ratio = close_ratio
+        self.htlc_ratio = htlc_ratio
+        self.udt_ratio = udt_ratio
+        self.rng = np.random.default_rng(seed)
+        # tip对应当前时间，区块时间按固定间隔往前推
+        self.tip_timestamp = int(time.time() * 1000)
+        self.counts = {'open_channels': 0, 'shutdown_cells': 0, 'closed_channels': 0, 'htlcs': 0}
+
+    def timestamp(self, blocks):
+        return self.tip_timestamp - (self.tip - blocks) * BLOCK_INTERVAL_MS
+
+    def chunk(self, start, count):
+        """生成第start到start+count条通道，返回各表的行"""
+        rng = self.rng
+        # sqrt使区块号越靠近tip越密集（通道数随时间增长）
+        position = np.sqrt((np.arange(start, start + count) + rng.random(count)) / self.rows)
+        funding_blocks = BEGIN_BLOCK_NUMBER + (position * self.blocks).astype(np.int64)
+        capacity = (np.maximum(_log_normal(rng, 1000, 1.6, count), 61) * SHANNONS).astype(np.int64)
+        udt = np.where(rng.random(count) < self.udt_ratio, _log_normal(rng, 10**8, 2, count).astype(np.int64), 0)
+        funding_hashes = _hashes(rng, count)
+
+        # 距离funding的区块数，平均约30天
+        shutdown_blocks = funding_blocks + rng.exponential(30 * BLOCKS_PER_DAY, count).astype(np.int64) + 1
+        shutdown = (rng.random(count) < self.shutdown_ratio) & (shutdown_blocks < self.tip)
+        closed = shutdown & (rng.random(count) < self.close_ratio)
+        delay_epoch = rng.choice([1, 6, 42], count, p=[0.2, 0.3, 0.5])
+        # delay之后再过平均2天被领取
+        closed_blocks = shutdown_blocks + delay_epoch * 1800 + rng.exponential(2 * BLOCKS_PER_DAY, count).astype(np.int64)
+        closed &= closed_blocks < self.tip
+        have_htlcs = rng.random(count) < self.htlc_ratio
+        fees = _log_normal(rng, 10000, 1.0, count).astype(np.int64)
+        status_update = self.tip_timestamp - rng.integers(0, 7 * 24 * 3600 * 1000, count)
+
+        open_rows, shutdown_rows, closed_rows, htlc_rows = [], [], [], []
+        for i in range(count):
+            block = int(funding_blocks[i])
+            open_rows.append((block, funding_hashes[i], 'dead' if shutdown[i] else 'live', int(capacity[i]), int(udt[i]),
+                              int(status_update[i]), self.timestamp(block)))
+            if not shutdown[i]:
+                continue
+            block = int(shutdown_blocks[i])
+            shutdown_hash = "0x" + rng.bytes(32).hex()
+            delay = int(delay_epoch[i])
+            # V2 lock：是否有htlc在关闭时由witness确定，还没关闭的为NULL
+            shutdown_rows.append((block, funding_hashes[i], shutdown_hash, 'dead' if closed[i] else 'live', int(capacity[i]) - 1000,
+                                  int(udt[i]), delay, int(have_htlcs[i]) if closed[i] else None, int(status_update[i]), self.timestamp(block),
+                                  delay | (1 << 40), 2, "0x" + rng.bytes(20).hex()))
+            if not closed[i]:
+                continue
+            block = int(closed_blocks[i])
+            closed_hash = "0x" + rng.bytes(32).hex()
+            closed_timestamp = self.timestamp(block)
+            closed_rows.append((block, shutdown_hash, closed_hash, int(fees[i]), 0, closed_timestamp))
+            if have_htlcs[i]:
+                for htlc_index in range(int(rng.integers(1, 4))):
+                    htlc_rows.append((block, closed_hash, shutdown_hash, 0, htlc_index, int(rng.integers(0, 2)),
+                                      int(_log_normal(rng, 10**8, 1.5, 1)[0]), None, "0x" + rng.bytes(20).hex(),
+                                      "0x" + rng.bytes(20).hex(), "0x" + rng.bytes(20).hex(),
+                                      closed_timestamp + int(rng.integers(-86400000, 86400000)), closed_timestamp))
+        return open_rows, shutdown_rows, closed_rows, htlc_rows
+
+    def write(self, db_name):
+        db = Database(db_name)
+        db.init_db()
+        db.close()
+        conn = sqlite3.connect(db_name)
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        for index_sql in INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index_sql.split()[5]}")
+        start_time = time.time()
+        for start in range(0, self.rows, CHUNK):
+            count = min(CHUNK, self.rows - start)
+            open_rows, shutdown_rows, closed_rows, htlc_rows = self.chunk(start, count)
+            conn.executemany(
+                "INSERT OR IGNORE INTO open_channels (block_number, tx_hash, status, ckb_capacity, udt_capacity, timestamp_status_update, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                open_rows)
+            conn.executemany(
+                "INSERT OR IGNORE INTO shutdown_cells (block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp, delay_epoch_value, lock_version, settlement_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                shutdown_rows)
+            conn.executemany(
+                "INSERT OR IGNORE INTO closed_channels (block_number, pre_tx_hash, tx_hash, ckb_fee, udt_fee, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                closed_rows)
+            conn.executemany(INSERT_HTLC_SQL, htlc_rows)
+            conn.commit()
+            for table, rows in zip(self.counts, (open_rows, shutdown_rows, closed_rows, htlc_rows)):
+                self.counts[table] += len(rows)
+            print(f"generated {start + count}/{self.rows} channels ({time.time() - start_time:.0f}s)", flush=True)
+        conn.close()
+
+        print("creating indexes...", flush=True)
+        db = Database(db_name)
+        db.init_db()
+        db.close()
+        print(f"done in {time.time() - start_time:.0f}s: {self.counts}")
+        return self.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成压测用的合成数据库")
+    parser.add_argument("--rows", type=int, default=1000000, help="open_channels的行数，其余表按比例生成")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--days", type=int, default=365, help="数据覆盖的天数")
+    parser.add_argument("--shutdown-ratio", type=float, default=0.45)
+    parser.add_argument("--close-ratio", type=float, default=0.85)
+    parser.add_argument("--htlc-ratio", type=float, default=0.2)
+    parser.add_argument("--udt-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+
+    DatasetGenerator(args.rows, args.days, args.shutdown_ratio, args.close_ratio, args.htlc_ratio,
+                     args.udt_ratio, args.seed).write(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""本地模拟CKB节点：按参数生成一条合成链，提供爬虫用到的JSON-RPC方法
+
+每个通道包含funding交易，一部分通道有commitment交易（shutdown cell），其中一部分再被settlement交易领取
+（closed channel，可以带pending htlc）。支持get_transactions/get_cells的分页游标、get_transaction、
+get_live_cell、区块头和epoch相关方法，可以注入延迟和HTTP 503错误。GET /stats 返回每个方法的请求次数。
+
+用法: python bench/mock_ckb.py [--port 8114] [--blocks 20000] [--channels-per-1k 20] [--latency-ms 0] [--error-rate 0]
+"""
+import argparse
+import asyncio
+import bisect
+import collections
+import os
+import random
+import sys
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.const import BEGIN_BLOCK_NUMBER, COMMITMENT_LOCK_CODE_HASH, FUNDING_LOCK_CODE_HASH  # noqa: E402
+
+UDT_CODE_HASH = "0x" + "55" * 32
+SECP_CODE_HASH = "0x9bd7e06f3ecf4be0f2fcd2188b23f1b9fcc88e5d4b65a8637b17723bbda3cce8"
+EPOCH_LENGTH = 1800
+BLOCK_INTERVAL_MS = 8000
+GENESIS_TIMESTAMP_MS = 1700000000000
+COMMITMENT_FEE = 1000
+MAX_LIMIT = 0xffff
+
+
+def block_hash(number):
+    return "0x" + f"{number:064x}"
+
+
+def block_timestamp(number):
+    return GENESIS_TIMESTAMP_MS + number * BLOCK_INTERVAL_MS
+
+
+def epoch_value(number, index, length):
+    return number | (index << 24) | (length << 40)
+
+
+def _le(value, size):
+    return value.to_bytes(size, "little").hex()
+
+
+def _script(code_hash, args):
+    return {"code_hash": code_hash, "hash_type": "type", "args": args}
+
+
+class Chain:
+    """确定性的合成链，相同参数和seed生成相同的数据，基准测试用expected()校验爬取结果"""
+
+    def __init__(self, blocks=20000, channels_per_1k=20, shutdown_ratio=0.5, close_ratio=0.6,
+                 htlc_ratio=0.3, udt_ratio=0.2, begin=BEGIN_BLOCK_NUMBER, seed=1, v2_ratio=0.8):
+        self.begin = begin
+        self.tip = begin + blocks
+        self.rng = random.Random(seed)
+        self.txs = {}
+        self.tx_counts = collections.Counter()
+        # (code_hash, args) -> [(block_number, tx_index, io_type, io_index, tx_hash)]
+        self.lock_index = collections.defaultdict(list)
+        self.code_index = collections.defaultdict(list)
+        self.spent = set()
+        self.channels = collections.Counter()
+
+        for _ in range(int(blocks * channels_per_1k / 1000)):
+            self._add_channel(shutdown_ratio, close_ratio, htlc_ratio, udt_ratio, v2_ratio)
+        for entries in list(self.lock_index.values()) + list(self.code_index.values()):
+            entries.sort()
+        self.code_blocks = {code_hash: [entry[0] for entry in entries] for code_hash, entries in self.code_index.items()}
+
+    def _hash(self):
+        return "0x" + f"{self.rng.getrandbits(256):064x}"
+
+    def _add_tx(self, block_number, inputs, outputs, outputs_data, witnesses):
+        tx_hash = self._hash()
+        tx_index = self.tx_counts[block_number] + 1
+        self.tx_counts[block_number] += 1
+        self.txs[tx_hash] = {
+            "transaction": {
+                "version": "0x0",
+                "cell_deps": [],
+                "header_deps": [],
+                "hash": tx_hash,
+                "inputs": [{"previous_output": {"tx_hash": h, "index": hex(i)}, "since": "0x0"} for h, i in inputs],
+                "outputs": outputs,
+                "outputs_data": outputs_data,
+                "witnesses": witnesses,
+            },
+            "tx_status": {"status": "committed", "block_hash": block_hash(block_number), "block_number": hex(block_number)},
+        }
+        for io_index, (prev_hash, prev_index) in enumerate(inputs):
+            self.spent.add((prev_hash, prev_index))
+            prev = self.txs.get(prev_hash)
+            if prev is not None:
+                self._index(prev["transaction"]["outputs"][prev_index]["lock"], (block_number, tx_index, "input", io_index, tx_hash))
+        for io_index, output in enumerate(outputs):
+            self._index(output["lock"], (block_number, tx_index, "output", io_index, tx_hash))
+        return tx_hash
+
+    def _index(self, lock, entry):
+        self.lock_index[(lock["code_hash"], lock["args"])].append(entry)
+        self.code_index[lock["code_hash"]].append(entry)
+
+    def _wallet_output(self, capacity):
+        return {"capacity": hex(capacity), "lock": _script(SECP_CODE_HASH, f"0x{self.rng.getrandbits(160):040x}"), "type": None}
+
+    def _add_channel(self, shutdown_ratio, close_ratio, htlc_ratio, udt_ratio, v2_ratio):
+        rng = self.rng
+        funding_block = self.begin + rng.randrange(self.tip - self.begin)
+        capacity = int(10 ** rng.uniform(2, 5.5)) * 10**8
+        udt = rng.random() < udt_ratio
+        udt_type = _script(UDT_CODE_HASH, "0x" + "66" * 32) if udt else None
+        udt_data = "0x" + _le(rng.randrange(1, 10**12), 16) if udt else "0x"
+
+        funding_lock = _script(FUNDING_LOCK_CODE_HASH, "0x" + f"{rng.getrandbits(256):064x}")
+        funding = self._add_tx(funding_block, [(self._hash(), 0)],
+                               [{"capacity": hex(capacity), "lock": funding_lock, "type": udt_type}], [udt_data], ["0x"])
+        self.channels["open"] += 1
+
+        commitment_block = funding_block + rng.randint(1, 2000)
+        if rng.random() >= shutdown_ratio or commitment_block >= self.tip:
+            self.channels["live_open"] += 1
+            return
+        has_htlcs = rng.random() < htlc_ratio
+        v2 = rng.random() < v2_ratio
+        delay = rng.choice([1, 6, 42])
+        args = "0x" + f"{rng.getrandbits(160):040x}" + _le(epoch_value(delay, 0, 1), 8)
+        if v2:
+            # V2：version之后总是settlement_hash，是否有htlc只能从关闭时的witness得知
+            args += f"{rng.randrange(2, 1000):016x}" + f"{rng.getrandbits(160):040x}"
+        else:
+            # V1：只有pending htlc时version之后才有htlcs hash
+            args += _le(1, 8) + (f"{rng.getrandbits(160):040x}" if has_htlcs else "")
+        commitment_lock = _script(COMMITMENT_LOCK_CODE_HASH, args)
+        commitment = self._add_tx(commitment_block, [(funding, 0)],
+                                  [{"capacity": hex(capacity - COMMITMENT_FEE), "lock": commitment_lock, "type": udt_type}],
+                                  [udt_data], ["0x"])
+
+        settlement_block = commitment_block + rng.randint(1, 2000)
+        if rng.random() >= close_ratio or settlement_block >= self.tip:
+            self.channels["shutdown"] += 1
+            if v2:
+                self.channels["shutdown_unknown_htlcs"] += 1
+            elif has_htlcs:
+                self.channels["shutdown_have_htlcs"] += 1
+            return
+        htlc_count = rng.randint(1, 3) if has_htlcs else 0
+        witness = self._settlement_witness(htlc_count, settlement_block) if v2 else self._v1_witness(htlc_count, settlement_block)
+        self._add_tx(settlement_block, [(commitment, 0)],
+                     [self._wallet_output(capacity // 2), self._wallet_output(capacity // 2 - 2 * COMMITMENT_FEE)],
+                     ["0x", "0x"], [witness])
+        self.channels["closed"] += 1
+        self.channels["htlcs"] += htlc_count
+
+    def _htlcs(self, htlc_count, block_number):
+        rng = self.rng
+        data = ""
+        for _ in range(htlc_count):
+            data += f"{rng.randrange(2):02x}" + _le(rng.randrange(1, 10**10), 16)
+            data += f"{rng.getrandbits(160):040x}" * 3
+            data += _le(block_timestamp(block_number) // 1000 + 86400, 8)
+        return data
+
+    def _v1_witness(self, htlc_count, block_number):
+        """commitment lock V1的解锁witness（与commitment_lock.parse_witness对应）：
+        有htlc时为pending htlc解锁，否则为non-pending htlc解锁(0xFE)"""
+        if not htlc_count:
+            return "0x" + "00" * 16 + "fe" + "22" * 32 + "11" * 65
+        return "0x" + "00" * 16 + "00" + f"{htlc_count:02x}" + self._htlcs(htlc_count, block_number) + "11" * 65
+
+    def _settlement_witness(self, htlc_count, block_number):
+        """commitment lock V2的settlement解锁witness（与commitment_lock.parse_witness_v2对应）"""
+        rng = self.rng
+        data = "00" * 16 + "01" + f"{htlc_count:02x}" + self._htlcs(htlc_count, block_number)
+        data += f"{rng.getrandbits(160):040x}" + _le(rng.randrange(10**10), 16)
+        data += f"{rng.getrandbits(160):040x}" + _le(rng.randrange(10**10), 16)
+        data += "00" + "00" + "11" * 65
+        return "0x" + data
+
+    def expected(self):
+        """爬取完整条链后各表应有的记录数"""
+        return {
+            "open_channels": self.channels["open"],
+            "live_open_channels": self.channels["live_open"],
+            "shutdown_cells": self.channels["shutdown"],
+            "shutdown_cells_have_htlcs": self.channels["shutdown_have_htlcs"],
+            "shutdown_cells_unknown_htlcs": self.channels["shutdown_unknown_htlcs"],
+            "closed_channels": self.channels["closed"],
+            "htlcs": self.channels["htlcs"],
+            "epochs": self.tip // EPOCH_LENGTH - self.begin // EPOCH_LENGTH + 1,
+        }
+
+    # ---- RPC方法 ----
+
+    def header(self, number):
+        return {
+            "number": hex(number),
+            "hash": block_hash(number),
+            "timestamp": hex(block_timestamp(number)),
+            "epoch": hex(epoch_value(number // EPOCH_LENGTH, number % EPOCH_LENGTH, EPOCH_LENGTH)),
+            "compact_target": "0x1d0fffff",
+            "parent_hash": block_hash(max(number - 1, 0)),
+            "version": "0x0",
+        }
+
+    def epoch(self, number):
+        return {"number": hex(number), "start_number": hex(number * EPOCH_LENGTH), "length": hex(EPOCH_LENGTH), "compact_target": "0x1d0fffff"}
+
+    def _search(self, search_key):
+        script = search_key["script"]
+        if search_key.get("script_search_mode", "prefix") == "exact":
+            entries = self.lock_index.get((script["code_hash"], script["args"]), [])
+        else:
+            entries = self.code_index.get(script["code_hash"], [])
+            block_range = (search_key.get("filter") or {}).get("block_range")
+            if block_range:
+                blocks = self.code_blocks[script["code_hash"]] if entries else []
+                start, end = int(block_range[0], 16), int(block_range[1], 16)
+                entries = entries[bisect.bisect_left(blocks, start):bisect.bisect_left(blocks, end)]
+            if script["args"] not in ("", "0x"):
+                entries = [e for e in entries if self._lock(e)["args"].startswith(script["args"])]
+        return entries
+
+    def _lock(self, entry):
+        block_number, tx_index, io_type, io_index, tx_hash = entry
+        tx = self.txs[tx_hash]["transaction"]
+        if io_type == "output":
+            return tx["outputs"][io_index]["lock"]
+        previous = tx["inputs"][io_index]["previous_output"]
+        return self.txs[previous["tx_hash"]]["transaction"]["outputs"][int(previous["index"], 16)]["lock"]
+
+    @staticmethod
+    def _page(entries, order, limit, after, to_json):
+        if order == "desc":
+            entries = entries[::-1]
+        start = int(after, 16) if after else 0
+        end = start + min(int(limit, 16), MAX_LIMIT)
+        return {"objects": [to_json(e) for e in entries[start:end]], "last_cursor": hex(min(end, len(entries)))}
+
+    def get_transactions(self, search_key, order, limit, after=None):
+        def to_json(e):
+            return {"block_number": hex(e[0]), "tx_index": hex(e[1]), "io_type": e[2], "io_index": hex(e[3]), "tx_hash": e[4]}
+        return self._page(self._search(search_key), order, limit, after, to_json)
+
+    def get_cells(self, search_key, order, limit, after=None):
+        entries = [e for e in self._search(search_key) if e[2] == "output" and (e[4], e[3]) not in self.spent]
+
+        def to_json(e):
+            tx = self.txs[e[4]]["transaction"]
+            return {
+                "block_number": hex(e[0]),
+                "out_point": {"tx_hash": e[4], "index": hex(e[3])},
+                "output": tx["outputs"][e[3]],
+                "output_data": tx["outputs_data"][e[3]],
+                "tx_index": hex(e[1]),
+            }
+        return self._page(entries, order, limit, after, to_json)
+
+    def get_transaction(self, tx_hash, *args):
+        return self.txs.get(tx_hash) or {"transaction": None, "tx_status": {"status": "unknown", "block_hash": None, "block_number": None}}
+
+    def get_live_cell(self, out_point, with_data=True, *args):
+        tx_hash, index = out_point["tx_hash"], int(out_point["index"], 16)
+        tx = self.txs.get(tx_hash)
+        if tx is None or (tx_hash, index) in self.spent or index >= len(tx["transaction"]["outputs"]):
+            return {"cell": None, "status": "unknown"}
+        cell = {"output": tx["transaction"]["outputs"][index]}
+        if with_data:
+            cell["data"] = {"content": tx["transaction"]["outputs_data"][index], "hash": "0x" + "00" * 32}
+        return {"cell": cell, "status": "live"}
+
+    def get_tip_block_number(self):
+        return hex(self.tip)
+
+    def get_indexer_tip(self):
+        return {"block_number": hex(self.tip), "block_hash": block_hash(self.tip)}
+
+    def get_tip_header(self, *args):
+        return self.header(self.tip)
+
+    def get_header_by_number(self, number, *args):
+        number = int(number, 16)
+        return self.header(number) if number <= self.tip else None
+
+    def get_header(self, hash, *args):
+        return self.get_header_by_number(hash)
+
+    def get_block_hash(self, number):
+        number = int(number, 16)
+        return block_hash(number) if number <= self.tip else None
+
+    def get_block_median_time(self, hash):
+        return hex(block_timestamp(max(int(hash, 16) - 18, 0)))
+
+    def get_current_epoch(self):
+        return self.epoch(self.tip // EPOCH_LENGTH)
+
+    def get_epoch_by_number(self, number):
+        number = int(number, 16)
+        return self.epoch(number) if number <= self.tip // EPOCH_LENGTH else None
+
+
+class MockNode:
+    def __init__(self, chain, latency_ms=0, latency_jitter_ms=0, error_rate=0, seed=1):
+        self.chain = chain
+        self.latency = latency_ms / 1000
+        self.latency_jitter = latency_jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = collections.Counter()
+
+    async def handle_rpc(self, request):
+        body = await request.json()
+        method = body.get("method")
+        self.calls[method] += 1
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + self.rng.uniform(0, self.latency_jitter))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return web.Response(status=503, text="injected error")
+        handler = getattr(self.chain, method, None) if method and not method.startswith("_") else None
+        if handler is None:
+            return web.json_response({"id": body.get("id"), "jsonrpc": "2.0", "error": {"code": -32601, "message": f"Method not found: {method}"}})
+        return web.json_response({"id": body.get("id"), "jsonrpc": "2.0", "result": handler(*body.get("params", []))})
+
+    async def handle_stats(self, request):
+        return web.json_response({"calls": self.calls, "expected": self.chain.expected()})
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/", self.handle_rpc)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+
+def add_chain_arguments(parser):
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--channels-per-1k", type=float, default=20, help="每1000个区块的通道数")
+    parser.add_argument("--shutdown-ratio", type=float, default=0.5)
+    parser.add_argument("--close-ratio", type=float, default=0.6, help="shutdown cell中已被领取的比例")
+    parser.add_argument("--htlc-ratio", type=float, default=0.3)
+    parser.add_argument("--udt-ratio", type=float, default=0.2)
+    parser.add_argument("--v2-ratio", type=float, default=0.8, help="使用commitment lock V2的通道比例")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="返回HTTP 503的比例")
+
+
+def chain_from_args(args):
+    return Chain(args.blocks, args.channels_per_1k, args.shutdown_ratio, args.close_ratio,
+                 args.htlc_ratio, args.udt_ratio, seed=args.seed, v2_ratio=args.v2_ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟CKB JSON-RPC节点")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8114)
+    add_chain_arguments(parser)
+    args = parser.parse_args()
+
+    chain = chain_from_args(args)
+    node = MockNode(chain, args.latency_ms, args.latency_jitter_ms, args.error_rate, args.seed)
+    print(f"mock ckb node on http://{args.host}:{args.port}/ blocks {chain.begin}-{chain.tip} {chain.expected()}", flush=True)
+    web.run_app(node.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
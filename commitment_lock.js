@@ -1,4 +1,7 @@
 const CKB_RPC_URL = "https://testnet.ckb.dev/";
+const API_BASE_URL = 'http://18.167.71.41:8130';
+// Read-only RPC calls go through the caching proxy, falling back to the public node
+const RPC_PROXY_URL = `${API_BASE_URL}/rpc`;
 const COMMITMENT_CODE_HASH = "0x740dee83f87c6f309824d8fd3fbdd3c8380ee6fc9acc90b1a748438afcdf81d8";
 
 document.addEventListener('DOMContentLoaded', async () => {
@@ -76,6 +79,24 @@ async function fetchAndParseTransaction(txHash) {
 // --- Tracing Logic ---
 
 async function getLnTxTrace(openChannelTxHash) {
+    // Prefer the server-side trace cache, fall back to tracing in the browser
+    try {
+        const response = await fetch(`${API_BASE_URL}/channel_trace/${openChannelTxHash}`);
+        if (response.ok) {
+            const data = await response.json();
+            return data.trace.map(item => {
+                if (item.msg.block_timestamp) {
+                    item.msg.block_timestamp = new Date(item.msg.block_timestamp).toLocaleString();
+                } else {
+                    item.msg.block_timestamp = '';
+                }
+                return item;
+            });
+        }
+    } catch (e) {
+        console.error("Server trace unavailable, tracing locally:", e);
+    }
+
     const txTrace = [];
     
     // Initial Transaction
@@ -457,52 +478,53 @@ function renderTrace(trace, container) {
     });
 }
 
-async function getTransaction(txHash) {
-    const response = await fetch(CKB_RPC_URL, {
+async function rpcFetch(body) {
+    const options = {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({
-            id: 1,
-            jsonrpc: '2.0',
-            method: 'get_transaction',
-            params: [txHash]
-        })
+        body: JSON.stringify(body)
+    };
+    try {
+        const response = await fetch(RPC_PROXY_URL, options);
+        if (response.ok) {
+            return response;
+        }
+    } catch (e) {
+        console.error("RPC proxy unavailable, using public node:", e);
+    }
+    return await fetch(CKB_RPC_URL, options);
+}
+
+async function getTransaction(txHash) {
+    const response = await rpcFetch({
+        id: 1,
+        jsonrpc: '2.0',
+        method: 'get_transaction',
+        params: [txHash]
     });
     const data = await response.json();
     return data.result;
 }
 
 async function getBlockHeader(blockHash) {
-    const response = await fetch(CKB_RPC_URL, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            id: 3,
-            jsonrpc: '2.0',
-            method: 'get_header',
-            params: [blockHash]
-        })
+    const response = await rpcFetch({
+        id: 3,
+        jsonrpc: '2.0',
+        method: 'get_header',
+        params: [blockHash]
     });
     const data = await response.json();
     return data.result;
 }
 
 async function getTransactions(searchKey, order = "asc", limit = "0xff", after = null) {
-    const response = await fetch(CKB_RPC_URL, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            id: 2,
-            jsonrpc: '2.0',
-            method: 'get_transactions',
-            params: [searchKey, order, limit, after]
-        })
+    const response = await rpcFetch({
+        id: 2,
+        jsonrpc: '2.0',
+        method: 'get_transactions',
+        params: [searchKey, order, limit, after]
     });
     const data = await response.json();
     if (data.error) {
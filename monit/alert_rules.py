@@ -0,0 +1,151 @@
+"""告警规则引擎：按id游标增量消费 /changes 返回的新行，在内存中逐条评估规则
+
+每条新行是一个事件 (table, row)，规则返回需要发送的告警；同一个告警key在DEDUP_TTL内只发送一次，
+告警先进入队列，由Notifier合并为摘要消息再发送。
+"""
+import collections
+import time
+
+SHANNONS_PER_CKB = 10**8
+# 同一个告警key的去重时间，以及最多记住的key数
+DEDUP_TTL = 24 * 60 * 60
+DEDUP_MAX_KEYS = 100000
+# 区块时间早于该时长的行不告警（回填写入的历史数据）
+MAX_EVENT_AGE_MS = 24 * 60 * 60 * 1000
+
+
+def _ckb(shannons):
+    return f"{(shannons or 0) / SHANNONS_PER_CKB:,.2f} CKB"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class Alert:
+    def __init__(self, key, rule, text):
+        # 用于去重的key，例如 (规则名, tx_hash)
+        self.key = key
+        self.rule = rule
+        self.text = text
+
+    def __repr__(self):
+        return f"Alert({self.key!r})"
+
+
+class HTLCShutdownRule:
+    """可能带HTLC且金额不小于min_ckb的通道进入shutdown
+
+    只有V1 lock在shutdown时能确定是否带HTLC；V2插入时have_htlcs为NULL，之后解锁时才由witness
+    UPDATE补充，而按id游标消费的 /changes 看不到UPDATE，所以have_htlcs为NULL时也告警，并在消息中注明未知。
+    """
+    name = "htlc_shutdown"
+    tables = ("shutdown_cells",)
+
+    def __init__(self, min_ckb):
+        self.min_capacity = min_ckb * SHANNONS_PER_CKB
+
+    def evaluate(self, table, row, now_ms):
+        have_htlcs = row.get("have_htlcs")
+        if have_htlcs == 0 or (row.get("ckb_capacity") or 0) < self.min_capacity:
+            return []
+        title = "HTLC通道关停" if have_htlcs else "通道关停(是否带HTLC未知)"
+        text = (f"{title}: {_ckb(row['ckb_capacity'])}, delay_epoch={row.get('delay_epoch')}\n"
+                f"  shutdown tx: {row['tx_hash']}\n  上一笔交易: {row.get('pre_tx_hash')}")
+        return [Alert((self.name, row["tx_hash"]), self.name, text)]
+
+
+class CloseFeeRule:
+    """关闭通道的CKB手续费不小于min_fee_ckb"""
+    name = "close_fee"
+    tables = ("closed_channels",)
+
+    def __init__(self, min_fee_ckb):
+        self.min_fee = min_fee_ckb * SHANNONS_PER_CKB
+
+    def evaluate(self, table, row, now_ms):
+        if (row.get("ckb_fee") or 0) < self.min_fee:
+            return []
+        text = f"高手续费关闭: fee={_ckb(row['ckb_fee'])}\n  tx: {row['tx_hash']}"
+        return [Alert((self.name, row["tx_hash"]), self.name, text)]
+
+
+class ShutdownBurstRule:
+    """window_minutes分钟内（按区块时间）出现不少于count个shutdown
+
+    触发后清空窗口，之后需要重新累计count个才会再次告警。
+    """
+    name = "shutdown_burst"
+    tables = ("shutdown_cells",)
+
+    def __init__(self, count, window_minutes):
+        self.count = count
+        self.window_ms = window_minutes * 60 * 1000
+        # 窗口内的 (区块时间, tx_hash)
+        self.recent = collections.deque()
+
+    def evaluate(self, table, row, now_ms):
+        timestamp = row.get("timestamp") or now_ms
+        self.recent.append((timestamp, row["tx_hash"]))
+        while self.recent and self.recent[0][0] < timestamp - self.window_ms:
+            self.recent.popleft()
+        if len(self.recent) < self.count:
+            return []
+        tx_hashes = [tx_hash for _, tx_hash in self.recent]
+        self.recent.clear()
+        text = (f"{self.window_ms // 60000}分钟内 {len(tx_hashes)} 个通道关停:\n"
+                + "\n".join(f"  {tx_hash}" for tx_hash in tx_hashes[:10])
+                + (f"\n  ...另外 {len(tx_hashes) - 10} 个" if len(tx_hashes) > 10 else ""))
+        return [Alert((self.name, tx_hashes[0]), self.name, text)]
+
+
+class AlertEngine:
+    def __init__(self, rules, dedup_ttl=DEDUP_TTL, max_event_age_ms=MAX_EVENT_AGE_MS):
+        self.rules = rules
+        self.dedup_ttl = dedup_ttl
+        self.max_event_age_ms = max_event_age_ms
+        # 告警key -> 过期时间，按插入顺序淘汰
+        self.sent = collections.OrderedDict()
+        self.skipped_old = 0
+
+    def _is_duplicate(self, key, now):
+        while self.sent and (len(self.sent) > DEDUP_MAX_KEYS or next(iter(self.sent.values())) < now):
+            self.sent.popitem(last=False)
+        if key in self.sent:
+            return True
+        self.sent[key] = now + self.dedup_ttl
+        return False
+
+    def process(self, table, rows, now_ms=None):
+        """评估一批新行，返回去重后的告警列表"""
+        now_ms = now_ms if now_ms is not None else _now_ms()
+        now = now_ms / 1000
+        rules = [rule for rule in self.rules if table in rule.tables]
+        alerts = []
+        for row in rows:
+            timestamp = row.get("timestamp")
+            if isinstance(timestamp, int) and timestamp < now_ms - self.max_event_age_ms:
+                self.skipped_old += 1
+                continue
+            for rule in rules:
+                for alert in rule.evaluate(table, row, now_ms):
+                    if not self._is_duplicate(alert.key, now):
+                        alerts.append(alert)
+        return alerts
+
+
+def format_digest(alerts, max_length=2000):
+    """把告警合并为摘要消息，每条消息不超过Discord的长度限制，单条过长的告警会被截断"""
+    counts = collections.Counter(alert.rule for alert in alerts)
+    header = "@here 告警 " + ", ".join(f"{rule}×{count}" for rule, count in counts.items())
+    messages = []
+    current = header
+    for alert in alerts:
+        text = alert.text[:max_length - 10]
+        if len(current) + len(text) + 2 > max_length:
+            messages.append(current)
+            current = text
+        else:
+            current += "\n\n" + text
+    messages.append(current)
+    return messages
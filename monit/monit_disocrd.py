@@ -1,27 +1,42 @@
 from datetime import datetime
 
-import discord
 import asyncio
-import requests
+import time
 
-intents = discord.Intents.default()
-intents.message_content = True
-client = discord.Client(intents=intents)
+import aiohttp
+
+from alert_rules import AlertEngine, CloseFeeRule, HTLCShutdownRule, ShutdownBurstRule, format_digest
 
 CHANNEL_ID = ""
 TOKEN = ""
 MONIT_URL = ""
 
-LATEST_SHUTDOWN_COUNT = None
+DISCORD_API = "https://discord.com/api/v10"
+# 轮询 /changes 的间隔（秒），一页取满时立即继续读取
+POLL_INTERVAL = 30
+CHANGES_LIMIT = 500
+# 第一条告警到达后等待该秒数，把期间的告警合并为一条摘要消息
+DIGEST_DELAY = 10
+SEND_TRY_COUNT = 5
+
+# 告警规则：HTLC通道关停金额(CKB)、关闭手续费(CKB)、M分钟内N个关停
+RULES = [
+    HTLCShutdownRule(min_ckb=1000),
+    CloseFeeRule(min_fee_ckb=1),
+    ShutdownBurstRule(count=10, window_minutes=30),
+]
+
+
+async def fetch_json(session, path, params=None):
+    async with session.get(f"{MONIT_URL}{path}", params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        resp.raise_for_status()
+        return await resp.json()
 
 
-async def fetch_live_stats():
+async def fetch_live_stats(session):
     """异步获取 live_stats 数据。返回 (open_count, shutdown_count)。"""
-    url = f"{MONIT_URL}/live_stats"
     try:
-        resp = await asyncio.to_thread(requests.get, url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        data = await fetch_json(session, "/live_stats")
         open_count = int(data.get("live_open_channels_count", 0))
         shutdown_count = int(data.get("live_shutdown_cells_count", 0))
         return open_count, shutdown_count
@@ -30,46 +45,92 @@ async def fetch_live_stats():
         return None, None
 
 
-async def watch_shutdown_and_alert(channel):
-    """每5分钟检测 live_shutdown_cells_count 是否增加，增加则报警到 Discord。"""
-    global LATEST_SHUTDOWN_COUNT
-    while True:
-        open_count, shutdown_count = await fetch_live_stats()
-        if open_count is None:
-            # 请求失败，稍后重试
-            await asyncio.sleep(300)
-            continue
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        if LATEST_SHUTDOWN_COUNT is None:
-            # 初始化基线
-            LATEST_SHUTDOWN_COUNT = shutdown_count
-            print(f"[init] {now} 基线 shutdown_count={shutdown_count}")
-        else:
-            if shutdown_count > LATEST_SHUTDOWN_COUNT:
-                delta = shutdown_count - LATEST_SHUTDOWN_COUNT
-                msg = (
-                    f"@here 关停增长报警\n"
-                    f"时间: {now}\n"
-                    f"live_shutdown_cells_count 增加: +{delta} (从 {LATEST_SHUTDOWN_COUNT} 到 {shutdown_count})\n"
-                    f"当前 live_open_channels_count: {open_count}"
-                )
+class DiscordSender:
+    """通过Discord REST API发送消息，遵守响应头中的速率限制，429时按retry_after等待后重试"""
+
+    def __init__(self, session, token, channel_id):
+        self.session = session
+        self.url = f"{DISCORD_API}/channels/{channel_id}/messages"
+        self.headers = {"Authorization": f"Bot {token}"}
+        # 当前速率限制窗口用完时，在该时间之前不再发送
+        self.blocked_until = 0
+        self.lock = asyncio.Lock()
+
+    async def send(self, content):
+        # 串行发送，保证消息顺序，也避免并发请求同时触发429
+        async with self.lock:
+            for _ in range(SEND_TRY_COUNT):
+                delay = self.blocked_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                payload = {"content": content, "allowed_mentions": {"parse": ["everyone"]}}
+                async with self.session.post(self.url, json=payload, headers=self.headers) as resp:
+                    if resp.headers.get("X-RateLimit-Remaining") == "0":
+                        self.blocked_until = time.monotonic() + float(resp.headers.get("X-RateLimit-Reset-After", 1))
+                    if resp.status == 429:
+                        data = await resp.json()
+                        retry_after = float(data.get("retry_after", 1))
+                        print(f"[discord] rate limited, retry after {retry_after}s")
+                        self.blocked_until = time.monotonic() + retry_after
+                        continue
+                    resp.raise_for_status()
+                    return
+            raise RuntimeError(f"discord send failed after {SEND_TRY_COUNT} tries")
+
+
+class Notifier:
+    """告警先进入队列，DIGEST_DELAY秒内到达的告警合并为摘要消息发送"""
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.queue = asyncio.Queue()
+
+    def push(self, alerts):
+        for alert in alerts:
+            self.queue.put_nowait(alert)
+
+    async def run(self):
+        while True:
+            alerts = [await self.queue.get()]
+            await asyncio.sleep(DIGEST_DELAY)
+            while not self.queue.empty():
+                alerts.append(self.queue.get_nowait())
+            for message in format_digest(alerts):
                 try:
-                    await channel.send(msg)
+                    await self.sender.send(message)
                 except Exception as send_err:
                     print(f"[discord] 发送报警失败: {send_err}")
-                LATEST_SHUTDOWN_COUNT = shutdown_count
-            else:
-                print(f"[watch] {now} 无增长，shutdown_count={shutdown_count}")
-
-        await asyncio.sleep(300)  # 5分钟
 
 
-async def hourly_summary(channel):
+async def watch_changes(session, engine, notifier, tables=("shutdown_cells", "closed_channels")):
+    """按id游标增量读取新行并评估告警规则，首次启动时从当前最大id开始，避免历史数据误报警"""
+    cursors = {}
+    while True:
+        for table in tables:
+            try:
+                while True:
+                    params = {"limit": CHANGES_LIMIT}
+                    if table in cursors:
+                        params["after_id"] = cursors[table]
+                    data = await fetch_json(session, f"/changes/{table}", params)
+                    if table not in cursors:
+                        print(f"[init] {table} 从 id={data['last_id']} 开始")
+                    cursors[table] = data["last_id"]
+                    alerts = engine.process(table, data["data"])
+                    if alerts:
+                        notifier.push(alerts)
+                    if len(data["data"]) < CHANGES_LIMIT:
+                        break
+            except Exception as e:
+                # 请求失败时保留游标，下次从同一位置继续
+                print(f"[changes] 读取 {table} 失败: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def hourly_summary(session, sender):
     """每小时发送一次打开/关停数量汇总到 Discord。"""
     while True:
-        open_count, shutdown_count = await fetch_live_stats()
+        open_count, shutdown_count = await fetch_live_stats(session)
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         if open_count is None:
@@ -83,38 +144,25 @@ async def hourly_summary(channel):
                 f"live_shutdown_cells_count: {shutdown_count}"
             )
         try:
-            await channel.send(msg)
+            await sender.send(msg)
         except Exception as send_err:
             print(f"[discord] 发送汇总失败: {send_err}")
 
         await asyncio.sleep(3600)  # 1小时
 
 
- 
-
-
- 
-
-
- 
-
-
-@client.event
-async def on_ready():
-    print(f'We have logged in as {client.user}')
-    channel = client.get_channel(CHANNEL_ID)
-    if channel is None:
-        print(f'[discord] 未找到频道: {CHANNEL_ID}')
-        return
-
-    # 初始化基线，避免首次误报警
-    open_count, shutdown_count = await fetch_live_stats()
-    if shutdown_count is not None:
-        global LATEST_SHUTDOWN_COUNT
-        LATEST_SHUTDOWN_COUNT = shutdown_count
-        print(f'[ready] 初始化基线 shutdown_count={shutdown_count}')
+async def main():
+    # 查询监控接口和发送Discord消息共用一个会话
+    async with aiohttp.ClientSession() as session:
+        sender = DiscordSender(session, TOKEN, CHANNEL_ID)
+        notifier = Notifier(sender)
+        engine = AlertEngine(RULES)
+        await asyncio.gather(
+            watch_changes(session, engine, notifier),
+            notifier.run(),
+            hourly_summary(session, sender),
+        )
 
-    asyncio.create_task(watch_shutdown_and_alert(channel))
-    asyncio.create_task(hourly_summary(channel))
 
-client.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -11,7 +11,8 @@ const API_ENDPOINTS = {
     openChannels: '/open_channels',
     shutdownChannels: '/shutdown_channels',
     closedChannels: '/closed_channels',
-    liveStats: '/live_stats'
+    liveStats: '/live_stats',
+    dashboard: '/dashboard'
 };
 
 // 分页状态
@@ -182,9 +183,10 @@ const utils = {
         // 可以在这里添加更友好的错误提示
     },
     
-    // 更新最后更新时间
-    updateLastUpdateTime() {
-        elements.lastUpdate.textContent = new Date().toLocaleString('zh-CN');
+    // 更新最后更新时间，传入时间戳时显示数据快照的生成时间
+    updateLastUpdateTime(timestamp = null) {
+        const date = timestamp ? new Date(timestamp) : new Date();
+        elements.lastUpdate.textContent = date.toLocaleString('zh-CN');
     }
 };
 
@@ -221,6 +223,15 @@ const api = {
         }
     },
     
+    // 首页快照，浏览器按ETag重新验证，数据未变化时服务器返回304
+    async fetchDashboard() {
+        const response = await fetch(`${API_BASE_URL}${API_ENDPOINTS.dashboard}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return await response.json();
+    },
+    
     async getOpenChannels(page = 1, status = null) {
         return await this.fetchData('/open_channels', page, PER_PAGE, status);
     },
@@ -405,7 +416,7 @@ const renderer = {
                 <td>${utils.formatStatus(channel.status)}</td>
                 <td>${utils.formatAmount(channel.ckb_capacity)}</td>
                 <td>${utils.formatAmount(channel.udt_capacity)}</td>
-                <td>${channel.have_htlcs ? '是' : '否'}</td>
+                <td>${channel.have_htlcs === null ? '未知' : (channel.have_htlcs ? '是' : '否')}</td>
                 <td>${utils.formatShutdownStages(channel)}</td>
                 <td>${utils.formatTimestamp(channel.timestamp_status_update)}</td>
                 <td>${utils.formatTimestamp(channel.timestamp)}</td>
@@ -527,21 +538,45 @@ const dataLoader = {
         }
     },
     
+    // 通过 /dashboard 一次请求加载三个列表的第一页和统计数据，选择了状态过滤的列表单独请求
+    async loadDashboard() {
+        const dashboard = await api.fetchDashboard();
+        const [openChannels, shutdownChannels] = await Promise.all([
+            filterState.open === 'all' ? dashboard.open_channels : this.loadOpenChannels(),
+            filterState.shutdown === 'all' ? dashboard.shutdown_channels : this.loadShutdownChannels()
+        ]);
+        if (filterState.open === 'all') {
+            renderer.renderOpenChannels(openChannels);
+        }
+        if (filterState.shutdown === 'all') {
+            renderer.renderShutdownChannels(shutdownChannels);
+        }
+        renderer.renderClosedChannels(dashboard.closed_channels);
+        
+        renderer.updateStats(openChannels, shutdownChannels, dashboard.closed_channels, dashboard.live_stats);
+        utils.updateLastUpdateTime(dashboard.updated_at);
+    },
+    
     // 加载所有数据
     async loadAllData() {
         elements.refreshBtn.disabled = true;
         elements.refreshBtn.textContent = '🔄 加载中...';
         
         try {
-            const [openChannels, shutdownChannels, closedChannels, liveStats] = await Promise.all([
-                this.loadOpenChannels(),
-                this.loadShutdownChannels(),
-                this.loadClosedChannels(),
-                api.fetchLiveStats()
-            ]);
-            
-            renderer.updateStats(openChannels, shutdownChannels, closedChannels, liveStats);
-            utils.updateLastUpdateTime();
+            try {
+                await this.loadDashboard();
+            } catch (error) {
+                // 快照还没有生成时分别请求各接口
+                const [openChannels, shutdownChannels, closedChannels, liveStats] = await Promise.all([
+                    this.loadOpenChannels(),
+                    this.loadShutdownChannels(),
+                    this.loadClosedChannels(),
+                    api.fetchLiveStats()
+                ]);
+                
+                renderer.updateStats(openChannels, shutdownChannels, closedChannels, liveStats);
+                utils.updateLastUpdateTime();
+            }
         } catch (error) {
             utils.showError('Failed to load data');
         } finally {
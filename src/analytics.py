@@ -0,0 +1,107 @@
+import threading
+
+import numpy as np
+
+from src.fee_stats import _summary
+
+SHANNONS_PER_CKB = 10**8
+DAY_MS = 24 * 60 * 60 * 1000
+# 容量分布的对数分箱（CKB），超出范围的值计入第一个或最后一个分箱
+CAPACITY_EDGES = np.logspace(2, 8, 13)
+# 持续时间的分箱（天）
+DURATION_EDGES = np.array([0, 1, 7, 30, 90, 180, 365, 730, np.inf])
+CAPACITY_TABLES = ('open_channels', 'shutdown_cells')
+CAPACITY_STATUSES = (None, 'live', 'dead')
+
+
+def _histogram(values, edges):
+    counts, _ = np.histogram(np.clip(values, edges[0], edges[-1]), edges)
+    return counts.tolist()
+
+
+def _lookup(keys, targets):
+    """在keys中查找每个target，返回 (位置, 是否找到)，keys为按hash前缀编码的int64"""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    index = np.clip(np.searchsorted(sorted_keys, targets), 0, max(len(keys) - 1, 0))
+    if not len(keys):
+        return index, np.zeros(len(targets), dtype=bool)
+    found = (sorted_keys[index] == targets) & (targets != 0)
+    return order[index], found
+
+
+class Analytics:
+    """基于列式快照（src/columnar.py）的全量历史统计
+
+    计算直接在内存映射的数组上向量化进行，不访问数据库；结果按快照版本缓存，
+    快照更新之前重复的请求直接返回缓存。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.version = None
+        self.cache = {}
+
+    def _cached(self, key, compute):
+        version = self.store.version()
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.cache = {}
+            if key not in self.cache:
+                self.cache[key] = compute()
+            return self.cache[key]
+
+    def capacity_distribution(self, table='open_channels', status=None):
+        if table not in CAPACITY_TABLES:
+            raise ValueError(f"invalid table: {table}")
+        if status not in CAPACITY_STATUSES:
+            raise ValueError(f"invalid status: {status}")
+        return self._cached(('capacity', table, status), lambda: self._capacity(table, status))
+
+    def _capacity(self, table, status):
+        columns = self.store.table(table)
+        capacity = columns['ckb_capacity']
+        if status is not None:
+            capacity = capacity[columns['live'] == (status == 'live')]
+        capacity = capacity / SHANNONS_PER_CKB
+        return {
+            'table': table,
+            'status': status,
+            'total_ckb': float(capacity.sum()),
+            'summary': _summary(capacity),
+            'histogram_edges': CAPACITY_EDGES.tolist(),
+            'histogram': _histogram(capacity, CAPACITY_EDGES),
+        }
+
+    def durations(self):
+        """通道从open到shutdown、shutdown到close、open到close的时长（天）"""
+        return self._cached(('durations',), self._durations)
+
+    def _durations(self):
+        open_channels = self.store.table('open_channels')
+        shutdown_cells = self.store.table('shutdown_cells')
+        closed_channels = self.store.table('closed_channels')
+
+        # shutdown cell的pre_tx_hash为funding交易，closed channel的pre_tx_hash为shutdown交易
+        open_index, shutdown_has_open = _lookup(open_channels['tx_key'], shutdown_cells['pre_tx_key'])
+        shutdown_index, closed_has_shutdown = _lookup(shutdown_cells['tx_key'], closed_channels['pre_tx_key'])
+        # 每个shutdown cell对应的open时间，没有open记录时为0
+        open_timestamp = open_channels['timestamp'][open_index] if len(open_channels['timestamp']) else np.zeros(len(open_index), dtype=np.int64)
+        shutdown_timestamp = shutdown_cells['timestamp']
+        closed_timestamp = closed_channels['timestamp']
+
+        closed_has_open = closed_has_shutdown.copy()
+        closed_has_open[closed_has_shutdown] = shutdown_has_open[shutdown_index[closed_has_shutdown]]
+        pairs = {
+            'open_to_shutdown': (shutdown_timestamp[shutdown_has_open], open_timestamp[shutdown_has_open]),
+            'shutdown_to_close': (closed_timestamp[closed_has_shutdown], shutdown_timestamp[shutdown_index[closed_has_shutdown]]),
+            'open_to_close': (closed_timestamp[closed_has_open], open_timestamp[shutdown_index[closed_has_open]]),
+        }
+        result = {'histogram_edges_days': DURATION_EDGES[:-1].tolist()}
+        for name, (end, start) in pairs.items():
+            valid = (start > 0) & (end >= start)
+            days = (end[valid] - start[valid]) / DAY_MS
+            result[name] = {'summary': _summary(days), 'histogram': _histogram(days, DURATION_EDGES)}
+        return result
@@ -1,11 +1,60 @@
-from flask import Flask, jsonify, request, send_from_directory, send_file
-from flask_cors import CORS
-from database import Database
+import json
 import os
+import sys
+import time
+
+# 以 python app.py 启动时也能按 src.xxx 导入，与爬虫使用同一套模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, g, jsonify, request, send_from_directory, send_file
+from flask_cors import CORS
+from src.database import CHANGES_MAX_LIMIT, Database
+from src.rpc_async import AsyncRPCClient
+from src.channel_trace import get_channel_trace
+from src.rpc_proxy import RPCProxy, RPCError
+from src.fee_stats import FeeStats
+from src.columnar import ColumnStore, columns_dir_of
+from src.analytics import Analytics
+from src.dashboard import DashboardCache, dashboard_path_of, page_payload
+from src.maturity import MaturityForecast
+from src.live_history import DAY_MS, history_plan
+from src.metrics import REGISTRY, API_LATENCY, API_REQUESTS, instrument_database, instrument_rpc_client, render
+
+instrument_database(Database)
+instrument_rpc_client(AsyncRPCClient)
+REGISTRY.const_labels = {'process': 'api'}
 
 app = Flask(__name__)
 CORS(app)  # 启用CORS支持
 db = Database()
+rpc_proxy = RPCProxy()
+# 爬虫定期写入的列式快照，统计接口在内存映射的列上计算，不查询数据库
+column_store = ColumnStore(columns_dir_of(db.db_name))
+fee_stats = FeeStats(db, column_store)
+analytics = Analytics(column_store)
+maturity_forecast = MaturityForecast(db)
+# 爬虫在数据变化时生成的首页快照
+dashboard_cache = DashboardCache(dashboard_path_of(db.db_name))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        API_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    API_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus指标，合并API进程和爬虫进程的数据"""
+    families = [REGISTRY.collect()]
+    for row in db.get_metrics_snapshots():
+        families.append(json.loads(row['body']))
+    return Response(render(*families), mimetype='text/plain; version=0.0.4')
 
 # 静态文件路由
 @app.route('/')
@@ -16,6 +65,21 @@ def index():
 def static_files(filename):
     return send_from_directory('..', filename)
 
+@app.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    """首页快照：三个列表的第一页、总数、live数量和生成时间，由爬虫在数据变化时生成
+
+    从内存返回，不查询数据库；带ETag，内容未变化时对If-None-Match返回304
+    """
+    body, etag = dashboard_cache.get()
+    if body is None:
+        return jsonify({'error': 'dashboard snapshot not ready'}), 503
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 浏览器每次都带ETag重新验证，快照更新后立即看到新数据
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/open_channels', methods=['GET'])
 def get_open_channels():
     page = request.args.get('page', 1, type=int)
@@ -29,15 +93,7 @@ def get_open_channels():
         channels = db.get_open_channels(page, per_page)
         total = db.get_open_channels_count()
     
-    return jsonify({
-        'data': [dict(row) for row in channels],
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'pages': (total + per_page - 1) // per_page
-        }
-    })
+    return jsonify(page_payload(channels, page, per_page, total))
 
 @app.route('/shutdown_channels', methods=['GET'])
 def get_shutdown_channels():
@@ -52,15 +108,7 @@ def get_shutdown_channels():
         channels = db.get_shutdown_channels(page, per_page)
         total = db.get_shutdown_channels_count()
     
-    return jsonify({
-        'data': [dict(row) for row in channels],
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'pages': (total + per_page - 1) // per_page
-        }
-    })
+    return jsonify(page_payload(channels, page, per_page, total))
 
 @app.route('/closed_channels', methods=['GET'])
 def get_closed_channels():
@@ -70,16 +118,67 @@ def get_closed_channels():
     channels = db.get_closed_channels(page, per_page)
     total = db.get_closed_channels_count()
     
+    return jsonify(page_payload(channels, page, per_page, total))
+
+@app.route('/filter/<table>', methods=['GET'])
+def filter_channels(table):
+    """多字段过滤查询，例如 /filter/open_channels?status=live&ckb_capacity_min=100000000000
+
+    字段名后加 _min / _max 表示范围，分页使用上一页返回的 next_cursor
+    """
+    cursor = request.args.get('cursor', None, type=str)
+    limit = request.args.get('limit', 50, type=int)
+    filters = []
+    for key, value in request.args.items():
+        if key in ('cursor', 'limit'):
+            continue
+        if key.endswith('_min'):
+            filters.append((key[:-4], '>=', value))
+        elif key.endswith('_max'):
+            filters.append((key[:-4], '<=', value))
+        else:
+            filters.append((key, '=', value))
+
+    try:
+        rows, next_cursor = db.filter_channels(table, filters, cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     return jsonify({
-        'data': [dict(row) for row in channels],
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'pages': (total + per_page - 1) // per_page
-        }
+        'data': [dict(row) for row in rows],
+        'next_cursor': next_cursor
     })
 
+@app.route('/changes/<table>', methods=['GET'])
+def get_changes(table):
+    """按id游标增量读取新写入的行，例如 /changes/shutdown_cells?after_id=123
+
+    不带after_id时只返回当前最大id作为起点；下一次请求使用返回的last_id
+    """
+    after_id = request.args.get('after_id', None, type=int)
+    limit = request.args.get('limit', CHANGES_MAX_LIMIT, type=int)
+    try:
+        if after_id is None:
+            return jsonify({'data': [], 'last_id': db.get_max_id(table)})
+        rows = db.get_changes_after(table, after_id, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'data': [dict(row) for row in rows],
+        'last_id': rows[-1]['id'] if rows else after_id
+    })
+
+@app.route('/search', methods=['GET'])
+def search():
+    """按tx_hash前缀搜索，例如 /search?q=0xabc"""
+    q = request.args.get('q', '', type=str)
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        return jsonify(db.search_tx_hash_prefix(q, limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/channel_lifecycle/<tx_hash>', methods=['GET'])
 def get_channel_lifecycle(tx_hash):
     try:
@@ -88,6 +187,57 @@ def get_channel_lifecycle(tx_hash):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/channel_trace/<tx_hash>', methods=['GET'])
+def get_channel_trace_route(tx_hash):
+    try:
+        trace = get_channel_trace(db, tx_hash)
+        return jsonify(trace)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/htlc_stats', methods=['GET'])
+def get_htlc_stats():
+    """htlc金额汇总和即将到期的htlc"""
+    limit = request.args.get('limit', 50, type=int)
+    now = int(time.time() * 1000)
+    return jsonify({
+        'summary': [dict(row) for row in db.get_htlc_summary()],
+        'upcoming_expiries': [dict(row) for row in db.get_upcoming_htlc_expiries(now, limit)]
+    })
+
+@app.route('/fee_stats', methods=['GET'])
+def get_fee_stats():
+    """关闭通道手续费统计，period为day/week/all，window_days为滚动窗口天数"""
+    period = request.args.get('period', 'day', type=str)
+    window_days = request.args.get('window_days', None, type=int)
+    field = request.args.get('field', 'ckb_fee', type=str)
+    try:
+        return jsonify(fee_stats.get_stats(period, window_days, field))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/analytics/capacity', methods=['GET'])
+def get_capacity_distribution():
+    """通道容量分布，table为open_channels/shutdown_cells，status为live/dead，不传表示全部"""
+    table = request.args.get('table', 'open_channels', type=str)
+    status = request.args.get('status', None, type=str)
+    try:
+        return jsonify(analytics.capacity_distribution(table, status))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/analytics/durations', methods=['GET'])
+def get_channel_durations():
+    """通道open到shutdown、shutdown到close、open到close的时长分布（天）"""
+    return jsonify(analytics.durations())
+
+@app.route('/maturity', methods=['GET'])
+def get_maturity():
+    """live状态shutdown cell的预计可领取时间，within_hours只返回该时间内到期的cell"""
+    limit = request.args.get('limit', 100, type=int)
+    within_hours = request.args.get('within_hours', None, type=float)
+    return jsonify(maturity_forecast.get_forecast(limit=limit, within_hours=within_hours))
+
 @app.route('/channel_statistics', methods=['GET'])
 def get_channel_statistics():
     try:
@@ -129,6 +279,22 @@ def get_daily_stats():
             'error': '请提供date参数查询单日统计，或提供start_date和end_date参数查询日期范围统计'
         }), 400
 
+@app.route('/rpc', methods=['POST'])
+def rpc():
+    """浏览器端工具使用的只读JSON-RPC代理"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'method' not in data:
+        return jsonify({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid Request'}}), 400
+
+    response = {'jsonrpc': '2.0', 'id': data.get('id')}
+    try:
+        response['result'] = rpc_proxy.call(data['method'], data.get('params', []))
+    except RPCError as e:
+        response['error'] = e.error
+    except Exception as e:
+        response['error'] = {'code': -32603, 'message': str(e)}
+    return jsonify(response)
+
 @app.route('/live_stats', methods=['GET'])
 def get_live_stats():
     """获取live状态的统计数据"""
@@ -140,6 +306,28 @@ def get_live_stats():
         'live_shutdown_cells_count': live_shutdown_cells
     })
 
+@app.route('/live_stats/history', methods=['GET'])
+def get_live_stats_history():
+    """live数量和锁定金额的历史，例如 /live_stats/history?from=1700000000000&to=1700086400000&step=3600000
+
+    时间为毫秒，默认最近一天；step会被放大到点数不超过上限，并对齐到所用分辨率的整数倍
+    """
+    now = int(time.time() * 1000)
+    end = request.args.get('to', now, type=int)
+    start = request.args.get('from', end - DAY_MS, type=int)
+    step = request.args.get('step', None, type=int)
+    try:
+        resolution, step = history_plan(start, end, step, now)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = db.get_live_stats_history(resolution, start, end, step)
+    return jsonify({
+        'resolution': resolution,
+        'step': step,
+        'data': [dict(row) for row in rows]
+    })
+
 if __name__ == '__main__':
     db.init_db()
     app.run("0.0.0.0","8130")
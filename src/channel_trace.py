@@ -0,0 +1,195 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from src.const import RPC_URLS, COMMITMENT_LOCK_CODE_HASH, TRACE_RPC_MAX_RPS, TRACE_RPC_MAX_CONCURRENCY
+from src.rpc_async import AsyncRPCClient, get_tx_message, get_ln_cell_death_hash
+from src.commitment_lock import decode_witness
+from src.scheduler import RPCBudget
+
+# 尾部cell仍为live的trace，距离上次检查超过该秒数才会再次向节点查询
+TRACE_RECHECK_INTERVAL = 60
+
+# tx_hash -> [锁, 持有或等待该锁的请求数]，只保存正在追踪的tx_hash
+_trace_locks = {}
+_trace_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _trace_lock(tx_hash):
+    """同一个tx_hash的trace同时只允许一个请求去节点上追踪；最后一个请求结束时删除该锁，
+    _trace_locks不会随请求过的tx_hash数量增长"""
+    with _trace_locks_lock:
+        entry = _trace_locks.get(tx_hash)
+        if entry is None:
+            entry = _trace_locks[tx_hash] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _trace_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _trace_locks[tx_hash]
+
+
+def _format_cells(cells):
+    result = []
+    for cell in cells:
+        item = {"args": cell["args"], "capacity": str(cell["capacity"])}
+        if "udt_args" in cell:
+            item["udt_args"] = cell["udt_args"]
+            item["udt_capacity"] = str(cell["udt_capacity"])
+        result.append(item)
+    return result
+
+
+def _stringify_ints(value):
+    """金额等大整数在JS中会丢精度，转换为字符串"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _stringify_ints(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_stringify_ints(v) for v in value]
+    return value
+
+
+def _parse_commitment_witness(msg):
+    """解析第一个commitment lock input的witness"""
+    for i, cell in enumerate(msg["input_cells"]):
+        if cell["lock"]["code_hash"] != COMMITMENT_LOCK_CODE_HASH:
+            continue
+        try:
+            return _stringify_ints(decode_witness(cell["args"], msg["witnesses"][i]))
+        except (ValueError, IndexError) as e:
+            return {"error": str(e)}
+    return None
+
+
+def _balance_changes(input_cells, output_cells):
+    """按lock args汇总余额变化，只保留有变化的args"""
+    changes = {}
+    for cell, sign in [(c, -1) for c in input_cells] + [(c, 1) for c in output_cells]:
+        balance = changes.setdefault(cell["args"], {"ckb": 0, "udt": 0})
+        balance["ckb"] += sign * cell["capacity"]
+        balance["udt"] += sign * cell.get("udt_capacity", 0)
+    return {
+        args: {"ckb": str(balance["ckb"]), "udt": str(balance["udt"])}
+        for args, balance in changes.items()
+        if balance["ckb"] != 0 or balance["udt"] != 0
+    }
+
+
+async def build_trace_item(rpc_client, tx_hash):
+    """生成trace中单笔交易的信息，格式与commitment_lock.js的getTxMessage保持一致"""
+    msg = await get_tx_message(rpc_client, tx_hash)
+    block_number = "Pending"
+    block_timestamp = None
+    if msg["block_hash"]:
+        header = await rpc_client.get_header(msg["block_hash"])
+        if header:
+            block_number = str(int(header["number"], 16))
+            block_timestamp = int(header["timestamp"], 16)
+    return {
+        "tx_hash": tx_hash,
+        "msg": {
+            "input_cells": _format_cells(msg["input_cells"]),
+            "output_cells": _format_cells(msg["output_cells"]),
+            "fee": str(msg["ckb_fee"]),
+            "udt_fee": str(msg["udt_fee"]),
+            "parsed_witness": _parse_commitment_witness(msg),
+            "balance_changes": _balance_changes(msg["input_cells"], msg["output_cells"]),
+            "block_number": block_number,
+            "block_timestamp": block_timestamp,
+        },
+    }
+
+
+async def extend_trace(rpc_client, tx_hash, trace):
+    """从已有trace的尾部继续向后追踪，返回(trace, finished)
+
+    与getLnTxTrace的规则一致：尾部cell还没被消费时trace未结束，
+    追踪到非commitment lock的cell被消费后trace结束。
+    """
+    if not trace:
+        trace.append(await build_trace_item(rpc_client, tx_hash))
+    while True:
+        tail = trace[-1]["tx_hash"]
+        next_tx_hash, code_hash = await get_ln_cell_death_hash(rpc_client, tail)
+        if next_tx_hash is None:
+            return trace, False
+        trace.append(await build_trace_item(rpc_client, next_tx_hash))
+        if tail != tx_hash and code_hash != COMMITMENT_LOCK_CODE_HASH:
+            return trace, True
+
+
+class TraceClient:
+    """API进程中所有trace请求共用的AsyncRPCClient
+
+    client及其aiohttp session、节点池、熔断状态和请求额度都属于一个常驻后台线程中的事件循环，
+    第一次使用时启动；Flask的请求线程用run_coroutine_threadsafe提交协程并等待结果。
+    """
+
+    def __init__(self, urls=RPC_URLS):
+        self.urls = urls
+        self.loop = None
+        self.client = None
+        self.lock = threading.Lock()
+
+    async def _create_client(self):
+        # aiohttp的session需要在所属的事件循环中创建
+        client = AsyncRPCClient(self.urls)
+        client.budget = RPCBudget(TRACE_RPC_MAX_RPS, TRACE_RPC_MAX_CONCURRENCY)
+        return client
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="channel-trace-rpc", daemon=True).start()
+        self.client = asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+        self.loop = loop
+
+    def run(self, func, *args):
+        """在后台事件循环中执行 func(client, *args)，返回结果"""
+        with self.lock:
+            if self.loop is None:
+                self._start()
+        return asyncio.run_coroutine_threadsafe(func(self.client, *args), self.loop).result()
+
+
+_trace_client = TraceClient()
+
+
+def _need_extend(row):
+    if row is None:
+        return True
+    if row["finished"]:
+        return False
+    return time.time() * 1000 - row["timestamp_status_update"] >= TRACE_RECHECK_INTERVAL * 1000
+
+
+def _trace_response(tx_hash, trace, finished):
+    return {"tx_hash": tx_hash, "finished": bool(finished), "trace": trace}
+
+
+def get_channel_trace(db, tx_hash):
+    """获取channel trace，已结束或刚检查过的trace直接从数据库返回，否则只追踪新增的部分"""
+    row = db.get_channel_trace(tx_hash)
+    if not _need_extend(row):
+        return _trace_response(tx_hash, json.loads(row["trace"]), row["finished"])
+
+    with _trace_lock(tx_hash):
+        # 等锁期间其他请求可能已经更新过
+        row = db.get_channel_trace(tx_hash)
+        if not _need_extend(row):
+            return _trace_response(tx_hash, json.loads(row["trace"]), row["finished"])
+
+        trace = json.loads(row["trace"]) if row else []
+        trace, finished = _trace_client.run(extend_trace, tx_hash, trace)
+        db.save_channel_trace(tx_hash, json.dumps(trace), finished)
+        return _trace_response(tx_hash, trace, finished)
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+# 每次从数据库读取的行数
+SNAPSHOT_CHUNK = 100000
+KEY_HEX_CHARS = 16
+INT_TIMESTAMP = "CASE WHEN typeof(timestamp) = 'integer' THEN timestamp ELSE 0 END"
+
+# 表 -> [(列名, SQL表达式, dtype)]，第一列必须是id。
+# *_key为tx_hash的前8字节（int64），交易hash是均匀分布的，用于表之间的向量化连接
+# 除live外快照只追加不更新，只放插入后不再变化的列（have_htlcs之后会被UPDATE补充，不放入快照）
+SNAPSHOT_COLUMNS = {
+    'open_channels': [
+        ('id', 'id', np.int64),
+        ('block_number', 'block_number', np.int64),
+        ('timestamp', INT_TIMESTAMP, np.int64),
+        ('ckb_capacity', 'COALESCE(ckb_capacity, 0)', np.int64),
+        ('udt_capacity', 'CAST(COALESCE(udt_capacity, 0) AS REAL)', np.float64),
+        ('live', "status = 'live'", np.uint8),
+        ('tx_key', f'substr(tx_hash, 3, {KEY_HEX_CHARS})', 'key'),
+    ],
+    'shutdown_cells': [
+        ('id', 'id', np.int64),
+        ('block_number', 'block_number', np.int64),
+        ('timestamp', INT_TIMESTAMP, np.int64),
+        ('ckb_capacity', 'COALESCE(ckb_capacity, 0)', np.int64),
+        ('udt_capacity', 'CAST(COALESCE(udt_capacity, 0) AS REAL)', np.float64),
+        ('delay_epoch', 'COALESCE(delay_epoch, 0)', np.int64),
+        ('live', "status = 'live'", np.uint8),
+        ('tx_key', f'substr(tx_hash, 3, {KEY_HEX_CHARS})', 'key'),
+        ('pre_tx_key', f'substr(pre_tx_hash, 3, {KEY_HEX_CHARS})', 'key'),
+    ],
+    'closed_channels': [
+        ('id', 'id', np.int64),
+        ('block_number', 'block_number', np.int64),
+        ('timestamp', INT_TIMESTAMP, np.int64),
+        ('ckb_fee', 'COALESCE(ckb_fee, 0)', np.int64),
+        ('udt_fee', 'CAST(COALESCE(udt_fee, 0) AS REAL)', np.float64),
+        ('tx_key', f'substr(tx_hash, 3, {KEY_HEX_CHARS})', 'key'),
+        ('pre_tx_key', f'substr(pre_tx_hash, 3, {KEY_HEX_CHARS})', 'key'),
+    ],
+}
+
+
+def columns_dir_of(db_name):
+    return db_name + '.columns'
+
+
+def _dtype(dtype):
+    return np.dtype(np.int64 if dtype == 'key' else dtype)
+
+
+def hash_keys(values):
+    """tx_hash前16个十六进制字符 -> int64，NULL为0"""
+    hex_string = ''.join(value if value and len(value) == KEY_HEX_CHARS else '0' * KEY_HEX_CHARS for value in values)
+    return np.frombuffer(bytes.fromhex(hex_string), dtype='>i8').astype(np.int64)
+
+
+def _read_meta(table_dir):
+    try:
+        with open(os.path.join(table_dir, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'last_id': 0}
+
+
+def _write_meta(table_dir, meta):
+    """先写临时文件再替换，读取方看到的行数总是和已写入的列数据一致"""
+    path = os.path.join(table_dir, 'meta.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+class ColumnSnapshot:
+    """把各表的数值列按id增量追加到列式文件中，供ColumnStore内存映射读取
+
+    每列一个原始二进制文件 <table>/<column>.bin，meta.json记录已提交的行数和最大id；
+    live列在每次更新时按当前live的id修正（live只会变为dead）。
+    """
+
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or columns_dir_of(db.db_name)
+
+    def update(self):
+        """返回各表新增的行数"""
+        added = {}
+        for table, columns in SNAPSHOT_COLUMNS.items():
+            table_dir = os.path.join(self.path, table)
+            os.makedirs(table_dir, exist_ok=True)
+            added[table] = self._append(table, table_dir, columns)
+            if any(name == 'live' for name, _, _ in columns):
+                self._sync_live(table, table_dir)
+        return added
+
+    def _append(self, table, table_dir, columns):
+        meta = _read_meta(table_dir)
+        # 上次中途退出时，丢弃超出meta行数的部分
+        for name, _, dtype in columns:
+            with open(os.path.join(table_dir, f'{name}.bin'), 'ab') as f:
+                f.truncate(meta['rows'] * _dtype(dtype).itemsize)
+        added = 0
+        expressions = [expression for _, expression, _ in columns[1:]]
+        while True:
+            rows = self.db.get_snapshot_rows(table, expressions, meta['last_id'], SNAPSHOT_CHUNK)
+            if not rows:
+                break
+            values = list(zip(*rows))
+            for (name, _, dtype), column in zip(columns, values):
+                array = hash_keys(column) if dtype == 'key' else np.array(column, dtype=dtype)
+                with open(os.path.join(table_dir, f'{name}.bin'), 'ab') as f:
+                    f.write(array.tobytes())
+            meta = {'rows': meta['rows'] + len(rows), 'last_id': values[0][-1],
+                    'columns': {name: _dtype(dtype).str for name, _, dtype in columns}}
+            _write_meta(table_dir, meta)
+            added += len(rows)
+        return added
+
+    def _sync_live(self, table, table_dir):
+        """快照中为live、但数据库中已不是live的行改为0，只写入变化的字节"""
+        rows = _read_meta(table_dir)['rows']
+        if not rows:
+            return
+        live = np.memmap(os.path.join(table_dir, 'live.bin'), dtype=np.uint8, mode='r+', shape=(rows,))
+        ids = np.memmap(os.path.join(table_dir, 'id.bin'), dtype=np.int64, mode='r', shape=(rows,))
+        positions = np.flatnonzero(live)
+        dead = positions[~np.isin(ids[positions], np.array(self.db.get_live_ids(table), dtype=np.int64))]
+        if len(dead):
+            live[dead] = 0
+            live.flush()
+        del live
+
+
+class ColumnStore:
+    """以只读内存映射的方式读取ColumnSnapshot写入的列，快照更新后自动重新映射"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # 表 -> (meta.json的mtime, {列名: 数组})
+        self.tables = {}
+
+    def _stat(self, table):
+        try:
+            return os.stat(os.path.join(self.path, table, 'meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def table(self, table):
+        mtime = self._stat(table)
+        with self.lock:
+            cached = self.tables.get(table)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            table_dir = os.path.join(self.path, table)
+            rows = _read_meta(table_dir)['rows']
+            arrays = {}
+            for name, _, dtype in SNAPSHOT_COLUMNS[table]:
+                if rows:
+                    arrays[name] = np.memmap(os.path.join(table_dir, f'{name}.bin'), dtype=_dtype(dtype), mode='r', shape=(rows,))
+                else:
+                    arrays[name] = np.empty(0, dtype=_dtype(dtype))
+            self.tables[table] = (mtime, arrays)
+            return arrays
+
+    def version(self):
+        """各表的快照版本，快照更新后变化，可用作计算结果的缓存key"""
+        return tuple(self._stat(table) for table in SNAPSHOT_COLUMNS)
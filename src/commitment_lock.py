@@ -0,0 +1,226 @@
+# commitment lock 的 lock args 和解锁 witness 解析，与 commitment_lock.js 中的
+# parseLockArgs / parseLockArgsV2 / parseWitness / parseWitnessV2 格式保持一致
+
+# pubkey_hash(20) + delay_epoch(8) + version(8)，之后是 htlcs / settlement_hash
+LOCK_ARGS_BASE_LEN = 72
+REVOCATION_UNLOCK_V1 = 0xFF
+NON_PENDING_HTLC_UNLOCK_V1 = 0xFE
+
+
+def _strip(hex_str):
+    return hex_str[2:] if hex_str.startswith("0x") else hex_str
+
+
+def _take(data, offset, length):
+    """读取data[offset:offset+length]，长度不足时抛出ValueError"""
+    if offset + length > len(data):
+        raise ValueError(f"data too short: need {offset + length} hex chars, got {len(data)}")
+    return data[offset:offset + length]
+
+
+def _le_int(hex_str):
+    return int.from_bytes(bytes.fromhex(hex_str), "little")
+
+
+def parse_epoch(value):
+    return {
+        "number": value & ((1 << 24) - 1),
+        "index": (value >> 24) & ((1 << 16) - 1),
+        "length": (value >> 40) & ((1 << 16) - 1),
+        "value": value,
+    }
+
+
+def lock_args_version(args):
+    """根据args中的version字段判断lock版本：小端为1时是V1，否则按V2处理"""
+    data = _strip(args)
+    if len(data) < LOCK_ARGS_BASE_LEN:
+        return None
+    return 1 if _le_int(data[56:72]) == 1 else 2
+
+
+def parse_lock_args(args):
+    data = _strip(args)
+    htlcs = data[LOCK_ARGS_BASE_LEN:]
+    return {
+        "pubkey_hash": "0x" + _take(data, 0, 40),
+        "delay_epoch": parse_epoch(_le_int(_take(data, 40, 16))),
+        "version": _le_int(_take(data, 56, 16)),
+        "htlcs": "0x" + htlcs if htlcs else "",
+    }
+
+
+def parse_lock_args_v2(args):
+    data = _strip(args)
+    settlement_hash = data[LOCK_ARGS_BASE_LEN:]
+    return {
+        "pubkey_hash": "0x" + _take(data, 0, 40),
+        "delay_epoch": parse_epoch(_le_int(_take(data, 40, 16))),
+        "version": int(_take(data, 56, 16), 16),
+        "settlement_hash": "0x" + settlement_hash if settlement_hash else "",
+    }
+
+
+def _parse_htlcs(data, offset, count):
+    htlcs = []
+    for _ in range(count):
+        htlc_type = int(_take(data, offset, 2), 16)
+        offset += 2
+        payment_amount = _le_int(_take(data, offset, 32))
+        offset += 32
+        payment_hash = "0x" + _take(data, offset, 40)
+        offset += 40
+        remote_htlc_pubkey_hash = "0x" + _take(data, offset, 40)
+        offset += 40
+        local_htlc_pubkey_hash = "0x" + _take(data, offset, 40)
+        offset += 40
+        htlc_expiry = _le_int(_take(data, offset, 16))
+        offset += 16
+        htlcs.append({
+            "htlc_type": htlc_type,
+            "payment_amount": payment_amount,
+            "payment_hash": payment_hash,
+            "remote_htlc_pubkey_hash": remote_htlc_pubkey_hash,
+            "local_htlc_pubkey_hash": local_htlc_pubkey_hash,
+            # 低56位是秒级时间戳，转换为毫秒
+            "htlc_expiry_timestamp": (htlc_expiry & ((1 << 56) - 1)) * 1000,
+        })
+    return htlcs, offset
+
+
+def _parse_revocation(data, offset):
+    return {
+        "version": int(_take(data, offset, 16), 16),
+        "pubkey": "0x" + _take(data, offset + 16, 64),
+        "signature": "0x" + data[offset + 16 + 64:],
+    }
+
+
+def parse_witness(witness):
+    data = _strip(witness)
+    offset = 0
+    empty_witness_args = _take(data, offset, 32)
+    offset += 32
+    unlock_type = int(_take(data, offset, 2), 16)
+    offset += 2
+
+    result = {"empty_witness_args": "0x" + empty_witness_args, "unlock_type": unlock_type}
+    if unlock_type == REVOCATION_UNLOCK_V1:
+        result["revocation"] = _parse_revocation(data, offset)
+    elif unlock_type == NON_PENDING_HTLC_UNLOCK_V1:
+        result["non_pending_htlc"] = {
+            "pubkey": "0x" + _take(data, offset, 64),
+            "signature": "0x" + data[offset + 64:],
+        }
+    else:
+        pending_htlc_count = int(_take(data, offset, 2), 16)
+        offset += 2
+        htlcs, offset = _parse_htlcs(data, offset, pending_htlc_count)
+        signature = "0x" + _take(data, offset, 130)
+        offset += 130
+        preimage = "0x" + data[offset:offset + 64] if len(data) > offset else None
+        result["pending_htlc"] = {
+            "pending_htlc_count": pending_htlc_count,
+            "htlcs": htlcs,
+            "signature": signature,
+            "preimage": preimage,
+        }
+    return result
+
+
+def parse_witness_v2(witness):
+    data = _strip(witness)
+    offset = 0
+    empty_witness_args = _take(data, offset, 32)
+    offset += 32
+    unlock_count = int(_take(data, offset, 2), 16)
+    offset += 2
+
+    result = {"empty_witness_args": "0x" + empty_witness_args, "unlock_count": unlock_count}
+    if unlock_count == 0:
+        result["revocation"] = _parse_revocation(data, offset)
+        return result
+
+    pending_htlc_count = int(_take(data, offset, 2), 16)
+    offset += 2
+    htlcs, offset = _parse_htlcs(data, offset, pending_htlc_count)
+
+    settlement_remote_pubkey_hash = "0x" + _take(data, offset, 40)
+    offset += 40
+    settlement_remote_amount = _le_int(_take(data, offset, 32))
+    offset += 32
+    settlement_local_pubkey_hash = "0x" + _take(data, offset, 40)
+    offset += 40
+    settlement_local_amount = _le_int(_take(data, offset, 32))
+    offset += 32
+
+    unlocks = []
+    for _ in range(unlock_count):
+        unlock_type = int(_take(data, offset, 2), 16)
+        offset += 2
+        with_preimage = int(_take(data, offset, 2), 16)
+        offset += 2
+        signature = "0x" + _take(data, offset, 130)
+        offset += 130
+        preimage = None
+        if with_preimage == 0x01:
+            preimage = "0x" + _take(data, offset, 64)
+            offset += 64
+        unlocks.append({
+            "unlock_type": unlock_type,
+            "with_preimage": with_preimage,
+            "signature": signature,
+            "preimage": preimage,
+        })
+
+    result["settlement"] = {
+        "pending_htlc_count": pending_htlc_count,
+        "htlcs": htlcs,
+        "settlement_remote_pubkey_hash": settlement_remote_pubkey_hash,
+        "settlement_remote_amount": settlement_remote_amount,
+        "settlement_local_pubkey_hash": settlement_local_pubkey_hash,
+        "settlement_local_amount": settlement_local_amount,
+        "unlocks": unlocks,
+    }
+    return result
+
+
+def decode_lock_args(args):
+    """解析commitment lock args，自动判断版本
+
+    has_htlcs：V1的args只在有pending htlc时带htlcs hash；V2的args总是带settlement_hash
+    （htlc和结算金额的hash），从args无法判断，为None，关闭时由witness确定，见witness_has_htlcs
+    """
+    version = lock_args_version(args)
+    if version is None:
+        raise ValueError(f"commitment lock args too short: {args}")
+    parsed = parse_lock_args(args) if version == 1 else parse_lock_args_v2(args)
+    parsed["lock_version"] = version
+    parsed["has_htlcs"] = bool(parsed["htlcs"]) if version == 1 else None
+    return parsed
+
+
+def decode_witness(args, witness):
+    """按lock args的版本解析解锁witness"""
+    version = lock_args_version(args)
+    if version is None:
+        raise ValueError(f"commitment lock args too short: {args}")
+    return parse_witness(witness) if version == 1 else parse_witness_v2(witness)
+
+
+def witness_htlcs(parsed_witness):
+    """从解析后的witness中取出pending htlc列表，撤销等没有htlc的解锁方式返回空列表"""
+    for key in ("pending_htlc", "settlement"):
+        if key in parsed_witness:
+            return parsed_witness[key]["htlcs"]
+    return []
+
+
+def witness_has_htlcs(parsed_witness):
+    """解锁witness是否说明该commitment cell有pending htlc，撤销解锁不包含htlc信息，返回None"""
+    for key in ("pending_htlc", "settlement"):
+        if key in parsed_witness:
+            return parsed_witness[key]["pending_htlc_count"] > 0
+    if "non_pending_htlc" in parsed_witness:
+        return False
+    return None
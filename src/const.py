@@ -1,7 +1,39 @@
 # Configuration constants
 RPC_URL = "https://testnet.ckb.dev/"
+# 爬虫使用的RPC节点列表，可以配置多个节点，按延迟和错误率自动选择
+RPC_URLS = [RPC_URL]
 BEGIN_BLOCK_NUMBER = 18483877
 
+# 爬虫的RPC请求额度：每秒请求数、最大并发数，以及只留给同步新区块任务的并发名额
+RPC_MAX_RPS = 20
+RPC_MAX_CONCURRENCY = 16
+RPC_RESERVED_FOR_INGEST = 4
+# API进程中 /channel_trace 共用的RPC请求额度：每秒请求数、最大并发数
+TRACE_RPC_MAX_RPS = 5
+TRACE_RPC_MAX_CONCURRENCY = 4
+
+# 爬虫的分阶段耗时统计：开启后每次任务执行和每1000个区块输出各阶段耗时；
+# 采样间隔不为None时还会定期把调用栈按collapsed stack格式写入CRAWLER_PROFILE_DIR，用于生成火焰图
+CRAWLER_PROFILE = False
+CRAWLER_PROFILE_SAMPLE_INTERVAL = 0.01
+CRAWLER_PROFILE_DIR = "profiles"
+CRAWLER_PROFILE_DUMP_INTERVAL = 5 * 60
+
+# /rpc 代理的缓存配置：只缓存确认数达到该深度的结果
+RPC_CACHE_DB = "rpc_cache.db"
+RPC_CONFIRMATION_DEPTH = 24
+
+# AsyncRPCClient使用的JSON编解码："msgspec"、"orjson"、"json"，None表示自动选择已安装的最快实现
+JSON_CODEC = None
+
+# AsyncRPCClient的请求录制/回放：RPC_RECORD_MODE为"record"或"replay"时使用RPC_RECORD_DB，None表示不开启
+RPC_RECORD_DB = "rpc_record.db"
+RPC_RECORD_MODE = None
+
+# 归档（archive.py）：区块时间早于该天数的已结算记录移到按月划分的归档文件，最多保留的月份文件数
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_MONTH_FILES = 6
+
 # Lock script code hashes
 FUNDING_LOCK_CODE_HASH = "0x6c67887fe201ee0c7853f1682c0b77c0e6214044c156c7558269390a8afa6d7c"
 COMMITMENT_LOCK_CODE_HASH = "0x740dee83f87c6f309824d8fd3fbdd3c8380ee6fc9acc90b1a748438afcdf81d8"
@@ -15,5 +47,8 @@ def get_rpc_client():
     global rpc_client
     if rpc_client is None:
         from src.rpc_async import AsyncRPCClient
-        rpc_client = AsyncRPCClient(RPC_URL)
+        rpc_client = AsyncRPCClient(RPC_URLS)
+        if RPC_RECORD_MODE is not None:
+            from src.rpc_record import RPCRecordStore
+            rpc_client.store = RPCRecordStore(RPC_RECORD_DB, RPC_RECORD_MODE)
     return rpc_client
\ No newline at end of file
@@ -1,238 +1,319 @@
 import asyncio
+import json
 from src.database import Database
-from src.rpc_async import get_cells, get_transactions, get_tx_message, get_ln_cell_linked_hashs, get_udt_balance
-from src.const import BEGIN_BLOCK_NUMBER, get_rpc_client,FUNDING_LOCK_CODE_HASH,COMMITMENT_LOCK_CODE_HASH
-from src.rpc_async import to_int_from_big_uint128_le
+from src.rpc_async import AsyncRPCClient, get_cells, get_transactions, get_tx_message, get_ln_cell_linked_hashs, get_udt_balance
+from src.const import BEGIN_BLOCK_NUMBER, get_rpc_client,FUNDING_LOCK_CODE_HASH,COMMITMENT_LOCK_CODE_HASH, RPC_MAX_RPS, RPC_MAX_CONCURRENCY, RPC_RESERVED_FOR_INGEST, CRAWLER_PROFILE, CRAWLER_PROFILE_SAMPLE_INTERVAL, CRAWLER_PROFILE_DIR, CRAWLER_PROFILE_DUMP_INTERVAL
+from src.records import TRANSACTION
+from src.commitment_lock import decode_lock_args, decode_witness, witness_has_htlcs, witness_htlcs
+from src.profiling import profile_database, profiler
+from src.scheduler import PRIORITY_BACKGROUND, PRIORITY_INGEST, PRIORITY_MAINTENANCE, RPCBudget, Scheduler
+from src.columnar import ColumnSnapshot
+from src.dashboard import DashboardExporter
+from src.live_check import LIVE_CHECK_BATCH, ShutdownSpendScanner, open_channel_next_check, retry_next_check, shutdown_cell_next_check
+from src.metrics import REGISTRY, CRAWLER_EXPORT_TIME, LIVE_CHECKS, LIVE_CHECK_OVERDUE, instrument_database, instrument_rpc_client, set_chain_tip, set_crawler_checkpoint
 import time
 
-async def crawl_open_channels(interval=60):
+instrument_database(Database)
+profile_database(Database)
+instrument_rpc_client(AsyncRPCClient)
+
+async def crawl_open_channels(db, rpc_client):
     """爬取开放通道数据"""
-    db = Database()
-    rpc_client = get_rpc_client()
+    # 获取最后一条记录的区块号
+    last_open_channel = db.get_last_open_channel()
+    if last_open_channel:
+        begin_number = last_open_channel['block_number'] + 1
+    else:
+        begin_number = BEGIN_BLOCK_NUMBER
     
-    while True:
-        try:
-            # 获取最后一条记录的区块号
-            last_open_channel = db.get_last_open_channel()
-            if last_open_channel:
-                begin_number = last_open_channel['block_number'] + 1
-            else:
-                begin_number = BEGIN_BLOCK_NUMBER
-            
-            # 获取当前最新区块号
-            end_number = await rpc_client.get_tip_block_number()
-            
-            print(f"Crawling open channels from block {begin_number} to {end_number}")
-            
-            # 分批处理区块
-            for i in range(begin_number, end_number, 1000):
-                batch_end = min(i + 1000, end_number)
-                print(f"crawl open channels Processing blocks {i} to {batch_end}")
+    # 获取当前最新区块号
+    end_number = await rpc_client.get_tip_block_number()
+    set_chain_tip(end_number)
+    
+    print(f"Crawling open channels from block {begin_number} to {end_number}")
+    
+    # 分批处理区块
+    for i in range(begin_number, end_number, 1000):
+        batch_end = min(i + 1000, end_number)
+        with profiler.aggregate(f"crawl_open_channels {i}-{batch_end}"):
+            print(f"crawl open channels Processing blocks {i} to {batch_end}")
+            with profiler.span("indexer_scan"):
                 txs = await get_transactions(rpc_client,FUNDING_LOCK_CODE_HASH, i, batch_end)
-                for tx in txs:
-                    if tx['io_type'] == 'output':
-                        cell_status = await rpc_client.get_live_cell(tx['io_index'],tx['tx_hash'])            
-                        block_hash = await rpc_client.get_block_hash(tx['block_number'])
-                        media_time = await rpc_client.get_block_median_time(block_hash)
-                        # ckb_capacity
-                        tx1 = await rpc_client.get_transaction(tx['tx_hash'])
-
-                        ckb_capacity = int(tx1['transaction']['outputs'][0]['capacity'],16)
-                        # udt_capacity
-                        if tx1['transaction']['outputs'][0]['type'] is None:
-                            udt_capacity = 0
-                        else:
-                            udt_capacity = to_int_from_big_uint128_le(tx1['transaction']['outputs_data'][0])
-                        print(f"crawl_open_channels:{int(tx['block_number'],16), tx['tx_hash'], cell_status['status'], ckb_capacity, udt_capacity, int(time.time()*1000), int(media_time,16)}")
-                        db.insert_open_channel(int(tx['block_number'],16), tx['tx_hash'], cell_status['status'], ckb_capacity, udt_capacity, int(time.time()*1000), int(media_time,16))
-                
-        except Exception as e:
-            print(f"Error in crawl_open_channels: {e}")
-        
-        await asyncio.sleep(interval)
+            for tx in txs:
+                if tx.io_type == 'output':
+                    with profiler.span("enrich"):
+                        row = await fetch_open_channel(rpc_client, tx)
+                    print(f"crawl_open_channels:{row}")
+                    with profiler.span("db_insert"):
+                        db.insert_open_channel(*row)
+        set_crawler_checkpoint('open_channels', batch_end)
+    set_crawler_checkpoint('open_channels', end_number)
 
 
-async def crawl_shutdown_channels(interval=60):
+async def crawl_shutdown_channels(db, rpc_client):
     """爬取关闭通道数据"""
-    db = Database()
-    rpc_client = get_rpc_client()
+    # last_shutdown_channel = db.get_last_shutdown_channel()
+    # if last_shutdown_channel:
+    #     begin_number = last_shutdown_channel['block_number'] + 1
+    # else:
+    #     begin_number = BEGIN_BLOCK_NUMBER
     
-    while True:
-        try:
-            # last_shutdown_channel = db.get_last_shutdown_channel()
-            # if last_shutdown_channel:
-            #     begin_number = last_shutdown_channel['block_number'] + 1
-            # else:
-            #     begin_number = BEGIN_BLOCK_NUMBER
-            
-            # 获取当前最新区块号
-            end_number = await rpc_client.get_tip_block_number()
-            
+    # 获取当前最新区块号
+    end_number = await rpc_client.get_tip_block_number()
+    set_chain_tip(end_number)
+    
+    
+    # 分批处理区块
+    print(f"Crawling shutdown channel Processing blocks")
+    with profiler.span("indexer_scan"):
+        cells = await get_cells(rpc_client,COMMITMENT_LOCK_CODE_HASH, BEGIN_BLOCK_NUMBER, end_number)
+    for cell in cells:
+        tx_hash = cell.out_point.tx_hash
+        data = db.get_shutdown_cell_by_tx_hash(tx_hash)
+        # print(f"crawl_shutdown_channels data:{data}:{data is None}")
+        if data is None:
+            # 解析commitment lock args，得到delay_epoch和是否有tlc（V2为None，关闭时由witness确定）
+            # 任何人都可以用commitment lock创建args不合法的cell，先解析再查询，跳过时不浪费RPC
+            try:
+                lock_args = decode_lock_args(cell.output.lock.args)
+            except ValueError as e:
+                print(f"Error decoding lock args for tx_hash {tx_hash}: {e}")
+                continue
+            with profiler.span("enrich"):
+                linked_hashs = await get_ln_cell_linked_hashs(rpc_client,tx_hash)
+                # print(f"linked_hashs:{linked_hashs}")
+                block_hash = await rpc_client.get_block_hash(hex(cell.block_number))
+                media_time = int(await rpc_client.get_block_median_time(block_hash),16)
+            ckb_capacity = cell.output.capacity
+            udt_capacity = cell.output.udt_amount
             
-            # 分批处理区块
-            print(f"Crawling shutdown channel Processing blocks")
-            cells = await get_cells(rpc_client,COMMITMENT_LOCK_CODE_HASH, BEGIN_BLOCK_NUMBER, end_number)
-            for cell in cells:
-                data = db.get_shutdown_cell_by_tx_hash(cell['out_point']['tx_hash'])
-                # print(f"crawl_shutdown_channels data:{data}:{data is None}")
-                if data is None:
-                    linked_hashs = await get_ln_cell_linked_hashs(rpc_client,cell['out_point']['tx_hash'])
-                    # print(f"linked_hashs:{linked_hashs}")
-                    block_hash = await rpc_client.get_block_hash(cell['block_number'])                
-                    media_time = await rpc_client.get_block_median_time(block_hash)
-                    # ckb_capacity
-                    ckb_capacity = int(cell['output']['capacity'],16)
-
-                    # udt_capacity 
-                    if cell['output']['type'] is None:
-                        udt_capacity = 0
-                    else:
-                        udt_capacity = to_int_from_big_uint128_le(cell["output_data"])
-                    
-                    # get delay_epoch 
-                    cell_args = cell['output']['lock']['args']
-                    # if len(cell_args) == 32:
-                    epoch = int.from_bytes(bytes.fromhex(cell_args[42:40+16]), 'little')
-                    epoch = EpochNumberWithFraction(epoch)
-                    delay_epoch = epoch.number()
-                    # check have_tlc 
-                    if len(cell_args) == 74:
-                        have_tlc = False
-                    else:
-                        have_tlc = True
-                    print(f"insert_shutdown_cell:{int(cell['block_number'],16),linked_hashs[0], cell['out_point']['tx_hash'], 'live',ckb_capacity,udt_capacity,delay_epoch,have_tlc,int(time.time()*1000),int(media_time,16)}")
-                    db.insert_shutdown_cell(int(cell['block_number'],16),linked_hashs[0], cell['out_point']['tx_hash'], "live",ckb_capacity,udt_capacity,delay_epoch,have_tlc,int(time.time()*1000),int(media_time,16))
-
-            print(f"crawl_shutdown_channels end")
-        except Exception as e:
-            print(f"Error in crawl_shutdown_channels: {e}")
-        
-        await asyncio.sleep(interval)
+            delay_epoch = lock_args['delay_epoch']['number']
+            have_tlc = lock_args['has_htlcs']
+            print(f"insert_shutdown_cell:{cell.block_number,linked_hashs[0], tx_hash, 'live',ckb_capacity,udt_capacity,delay_epoch,have_tlc,int(time.time()*1000),media_time}")
+            db.insert_shutdown_cell(cell.block_number,linked_hashs[0], tx_hash, "live",ckb_capacity,udt_capacity,delay_epoch,have_tlc,int(time.time()*1000),media_time,
+                                    lock_args['delay_epoch']['value'], lock_args['lock_version'], lock_args.get('settlement_hash') or None)
 
+    set_crawler_checkpoint('shutdown_cells', end_number)
+    print(f"crawl_shutdown_channels end")
 
-async def crawl_closed_channels(interval=60):
+
+async def fetch_open_channel(rpc_client, tx):
+    """查询funding交易的信息，返回insert_open_channel的参数"""
+    cell_status = await rpc_client.get_live_cell(hex(tx.io_index),tx.tx_hash)            
+    block_hash = await rpc_client.get_block_hash(hex(tx.block_number))
+    media_time = int(await rpc_client.get_block_median_time(block_hash),16)
+    # ckb_capacity / udt_capacity
+    funding_output = (await rpc_client.get_transaction(tx.tx_hash, schema=TRANSACTION)).outputs[0]
+    return tx.block_number, tx.tx_hash, cell_status['status'], funding_output.capacity, funding_output.udt_amount, int(time.time()*1000), media_time
+
+
+async def fetch_closed_channel(rpc_client, tx):
+    """查询关闭交易的信息，返回(insert_closed_channel的参数, insert_htlcs的参数或None,
+    (commitment tx_hash, have_htlcs)或None)"""
+    with profiler.span("get_tx_message"):
+        tx_msg = await get_tx_message(rpc_client,tx.tx_hash)
+    block_hash = await rpc_client.get_block_hash(hex(tx.block_number))
+    media_time = int(await rpc_client.get_block_median_time(block_hash),16)
+    linked_hashs = await get_ln_cell_linked_hashs(rpc_client,tx.tx_hash)
+    row = (tx.block_number, linked_hashs[0], tx.tx_hash, tx_msg['ckb_fee'], tx_msg['udt_fee'], media_time)
+    return (row,) + unlock_htlcs(tx, tx_msg, media_time)
+
+
+def unlock_htlcs(tx, tx_msg, timestamp):
+    """解析解锁commitment cell的witness，返回(pending htlc对应的insert_htlcs参数, (commitment tx_hash, have_htlcs))
+
+    没有htlc时第一项为None；witness不能说明是否有htlc（例如撤销解锁）或解析失败时第二项为None
+    """
+    input_index = tx.io_index
+    input_cell = tx_msg['input_cells'][input_index]
+    commitment_tx_hash = input_cell['out_point']['tx_hash']
+    try:
+        parsed_witness = decode_witness(input_cell['args'], tx_msg['witnesses'][input_index])
+    except (ValueError, IndexError) as e:
+        print(f"Error decoding witness for tx_hash {tx.tx_hash} input {input_index}: {e}")
+        return None, None
+    has_htlcs = witness_has_htlcs(parsed_witness)
+    have_htlcs = None if has_htlcs is None else (commitment_tx_hash, has_htlcs)
+    htlcs = witness_htlcs(parsed_witness)
+    if not htlcs:
+        return None, have_htlcs
+    return (tx.block_number, tx.tx_hash, input_index, commitment_tx_hash, htlcs, input_cell.get('udt_args'), timestamp), have_htlcs
+
+
+async def crawl_closed_channels(db, rpc_client):
     """爬取关闭通道数据"""
-    db = Database()
-    rpc_client = get_rpc_client()
+    # 获取最后一条记录的区块号
+    last_close_channel = db.get_last_close_channel()
+    if last_close_channel:
+        begin_number = last_close_channel['block_number'] + 1
+    else:
+        begin_number = BEGIN_BLOCK_NUMBER
     
-    while True:
-        try:
-            # 获取最后一条记录的区块号
-            last_close_channel = db.get_last_close_channel()
-            if last_close_channel:
-                begin_number = last_close_channel['block_number'] + 1
-            else:
-                begin_number = BEGIN_BLOCK_NUMBER
-            
-            # 获取当前最新区块号
-            end_number = await rpc_client.get_tip_block_number()
-            
-            print(f"Crawling closed channels from block {begin_number} to {end_number}")
-            
-            # 分批处理区块
-            for i in range(begin_number, end_number, 1000):
-                batch_end = min(i + 1000, end_number)
-                print(f"Crawling closed channels Processing blocks {i} to {batch_end}")
+    # 获取当前最新区块号
+    end_number = await rpc_client.get_tip_block_number()
+    set_chain_tip(end_number)
+    
+    print(f"Crawling closed channels from block {begin_number} to {end_number}")
+    
+    # 分批处理区块
+    for i in range(begin_number, end_number, 1000):
+        batch_end = min(i + 1000, end_number)
+        with profiler.aggregate(f"crawl_closed_channels {i}-{batch_end}"):
+            print(f"Crawling closed channels Processing blocks {i} to {batch_end}")
+            with profiler.span("indexer_scan"):
                 txs = await get_transactions(rpc_client,COMMITMENT_LOCK_CODE_HASH, i, batch_end)
-                for tx in txs:
-                    if tx['io_type'] == 'input':
-                        tx_msg = await get_tx_message(rpc_client,tx['tx_hash'])
-                        block_hash = await rpc_client.get_block_hash(tx['block_number'])
-                        media_time = await rpc_client.get_block_median_time(block_hash)
-                        linked_hashs = await get_ln_cell_linked_hashs(rpc_client,tx['tx_hash'])
-                        db.insert_closed_channel(int(tx['block_number'],16),linked_hashs[0], tx['tx_hash'], tx_msg['ckb_fee'], tx_msg['udt_fee'], int(media_time,16))
-                        print(f"insert_close_channel:{int(tx['block_number'],16), tx['tx_hash'], tx_msg['ckb_fee'], tx_msg['udt_fee'], int(media_time,16)}")
+            for tx in txs:
+                if tx.io_type == 'input':
+                    with profiler.span("enrich"):
+                        row, htlcs, have_htlcs = await fetch_closed_channel(rpc_client, tx)
+                    with profiler.span("db_insert"):
+                        db.insert_closed_channel(*row)
+                        if htlcs:
+                            db.insert_htlcs(*htlcs)
+                        if have_htlcs:
+                            db.update_shutdown_cell_have_htlcs([have_htlcs])
+                    print(f"insert_close_channel:{row}")
+        set_crawler_checkpoint('closed_channels', batch_end)
+    set_crawler_checkpoint('closed_channels', end_number)
 
-        except Exception as e:
-            print(f"Error in crawl_closed_channels: {e}")
-        
-        await asyncio.sleep(interval)
 
 
-async def check_open_channels_live_status(interval=300):
-    """检查数据库中open_channels记录的live状态"""
-    db = Database()
-    rpc_client = get_rpc_client()
-    
-    while True:
+async def check_live_status(table, rows, rpc_client, next_check, update_status, update_next_check):
+    """检查一批到期记录的live状态，状态变化时更新状态，否则按next_check重新安排检查时间"""
+    now = int(time.time() * 1000)
+
+    async def check(row):
         try:
-            print("Checking open channels live status...")
-            # 获取所有open_channels记录
-            open_channels = db.get_all_live_open_channels()
-            print(f"Found {len(open_channels)} open channels to check")
-            
-            for channel in open_channels:
-                try:
-                    # 检查cell的live状态
-                    # 使用数据库中存储的output_index
-                    cell_status = await rpc_client.get_live_cell("0x0", channel['tx_hash'])
-                    current_status = cell_status['status']
-                    
-                    # 如果状态发生变化，更新数据库
-                    if current_status != "live":
-                        print(f"Status changed for tx_hash {channel['tx_hash']}: {channel['status']} -> {current_status}")
-                        db.update_open_channel_status(channel['tx_hash'], current_status)
-                        
-                except Exception as e:
-                    print(f"Error checking live status for tx_hash {channel['tx_hash']}: {e}")
-                    
-            print("Finished checking open channels live status")
-            
+            cell_status = await rpc_client.get_live_cell("0x0", row['tx_hash'])
         except Exception as e:
-            print(f"Error in check_open_channels_live_status: {e}")
-        
-        await asyncio.sleep(interval)
+            print(f"Error checking live status for tx_hash {row['tx_hash']}: {e}")
+            LIVE_CHECKS.inc(table=table, result="error")
+            return retry_next_check(now), row['tx_hash']
+        current_status = cell_status['status']
+        # 如果状态发生变化，更新数据库，记录不再是live，不需要再检查
+        if current_status != row['status']:
+            print(f"Status changed for tx_hash {row['tx_hash']}: {row['status']} -> {current_status}")
+            update_status(row['tx_hash'], current_status)
+            LIVE_CHECKS.inc(table=table, result="changed")
+            return None
+        LIVE_CHECKS.inc(table=table, result="unchanged")
+        return next_check(row, now), row['tx_hash']
 
+    # 并发由rpc_client.budget限制
+    results = await asyncio.gather(*[check(row) for row in rows])
+    update_next_check([item for item in results if item is not None])
 
-async def check_shutdown_channels_live_status(interval=300):
-    """检查数据库中shutdown_channels记录的live状态"""
-    db = Database()
-    rpc_client = get_rpc_client()
-    
-    while True:
-        try:
-            print("Checking shutdown channels live status...")
-            
-            # 获取所有shutdown_channels记录
-            shutdown_channels = db.get_all_live_shutdown_channels()
-            print(f"Found {len(shutdown_channels)} shutdown channels to check")
-            
-            for channel in shutdown_channels:
-                try:
-                    # 检查cell的live状态
-                    # shutdown_cells使用tx_hash直接检查
-                    cell_status = await rpc_client.get_live_cell("0x0", channel['tx_hash'])
-                    current_status = cell_status['status']
-                    
-                    # 如果状态发生变化，更新数据库
-                    if current_status != channel['status']:
-                        print(f"Status changed for tx_hash {channel['tx_hash']}: {channel['status']} -> {current_status}")
-                        db.update_shutdown_channel_status(channel['tx_hash'], current_status)         
-                except Exception as e:
-                    print(f"Error checking live status for tx_hash {channel['tx_hash']}: {e}")
-                    
-            print("Finished checking shutdown channels live status")
-            
-        except Exception as e:
-            print(f"Error in check_shutdown_channels_live_status: {e}")
-        
-        await asyncio.sleep(interval)
+
+async def check_open_channels_live_status(db, rpc_client):
+    """检查已到期的live open_channels，每轮最多LIVE_CHECK_BATCH条"""
+    now = int(time.time() * 1000)
+    open_channels = db.get_due_live_open_channels(now, LIVE_CHECK_BATCH)
+    print(f"Found {len(open_channels)} open channels to check")
+    await check_live_status('open_channels', open_channels, rpc_client, open_channel_next_check,
+                            db.update_open_channel_status, db.update_open_channels_next_check)
+    LIVE_CHECK_OVERDUE.set(db.get_due_live_open_channels_count(now), table='open_channels')
+
+
+async def scan_shutdown_spends(db, rpc_client, spend_scanner):
+    """扫描新区块中被花费的shutdown cell，标记为立即检查"""
+    marked = await spend_scanner.scan(db, rpc_client)
+    print(f"Found {marked} spent shutdown cells")
 
 
-async def crawl_all(open_interval=60*60, shutdown_interval=60*60, closed_interval=60*60, check_live_interval=5*60):
-    """并发运行所有爬虫任务"""
+async def check_shutdown_channels_live_status(db, rpc_client, spend_scanner=None):
+    """检查已到期的live shutdown_cells，每轮最多LIVE_CHECK_BATCH条；spend_scanner正常扫描时逐个检查只作为兜底"""
+    now = int(time.time() * 1000)
+    shutdown_channels = db.get_due_live_shutdown_channels(now, LIVE_CHECK_BATCH)
+    print(f"Found {len(shutdown_channels)} shutdown channels to check")
+    spends_scanned = spend_scanner is not None and spend_scanner.current(now)
+    await check_live_status('shutdown_cells', shutdown_channels, rpc_client,
+                            lambda row, now: shutdown_cell_next_check(row, now, spends_scanned),
+                            db.update_shutdown_channel_status, db.update_shutdown_channels_next_check)
+    LIVE_CHECK_OVERDUE.set(db.get_due_live_shutdown_channels_count(now), table='shutdown_cells')
+
+
+async def fetch_epoch(rpc_client, number):
+    """返回(number, start_number, length, start_timestamp)，开始时间取epoch第一个区块的时间"""
+    epoch = await rpc_client.get_epoch_by_number(hex(number))
+    header = await rpc_client.get_header_by_number(epoch['start_number'])
+    return number, int(epoch['start_number'], 16), int(epoch['length'], 16), int(header['timestamp'], 16)
+
+
+async def crawl_epochs(db, rpc_client, batch_size=50):
+    """把BEGIN_BLOCK_NUMBER所在epoch到当前epoch的信息批量写入epochs表，已保存的epoch不再请求"""
+    current = int((await rpc_client.get_current_epoch())['number'], 16)
+    begin = db.get_max_epoch_number()
+    if begin is None:
+        header = await rpc_client.get_header_by_number(hex(BEGIN_BLOCK_NUMBER))
+        begin = int(header['epoch'], 16) & 0xFFFFFF
+    else:
+        begin += 1
+    for i in range(begin, current + 1, batch_size):
+        batch_end = min(i + batch_size, current + 1)
+        epochs = await asyncio.gather(*[fetch_epoch(rpc_client, number) for number in range(i, batch_end)])
+        db.insert_epochs(epochs)
+        print(f"crawl_epochs: {i}-{batch_end - 1}/{current}")
+
+
+async def export_metrics(db):
+    """定期把爬虫进程的metrics写入数据库，由API的 /metrics 统一输出"""
+    CRAWLER_EXPORT_TIME.set(time.time())
+    db.save_metrics_snapshot('crawler', json.dumps(REGISTRY.collect()))
+
+
+async def record_live_stats(db):
+    """记录一次live数量和锁定金额的采样，按分辨率降采样保存，见src/live_history.py"""
+    db.record_live_stats(db.get_live_stats(), int(time.time() * 1000))
+
+
+async def snapshot_columns(snapshot):
+    """把新增记录追加到列式快照，并同步live状态，见src/columnar.py"""
+    added = await asyncio.to_thread(snapshot.update)
+    if any(added.values()):
+        print(f"column snapshot: {added}")
+
+
+async def export_dashboard(exporter):
+    """数据变化时重新生成 /dashboard 的快照，见src/dashboard.py"""
+    exporter.export()
+
+
+async def crawl_all(open_interval=60*60, shutdown_interval=60*60, closed_interval=60*60, check_live_interval=60, epoch_interval=10*60, metrics_interval=15, snapshot_interval=5*60, dashboard_interval=15):
+    """由调度器统一运行所有爬虫任务
+
+    同步新区块的任务优先使用RPC额度，live状态检查只使用剩余额度；
+    live状态检查每轮只检查到期的记录，各记录的检查频率见src/live_check.py
+    """
+    db = Database()
     rpc_client = get_rpc_client()
+    rpc_client.budget = RPCBudget(RPC_MAX_RPS, RPC_MAX_CONCURRENCY, RPC_RESERVED_FOR_INGEST)
+    REGISTRY.const_labels = {'process': 'crawler'}
+    scheduler = Scheduler()
+    scheduler.add(crawl_open_channels, open_interval, PRIORITY_INGEST, (db, rpc_client))
+    scheduler.add(crawl_shutdown_channels, shutdown_interval, PRIORITY_INGEST, (db, rpc_client))
+    scheduler.add(crawl_closed_channels, closed_interval, PRIORITY_INGEST, (db, rpc_client))
+    scheduler.add(crawl_epochs, epoch_interval, PRIORITY_MAINTENANCE, (db, rpc_client))
+    scheduler.add(check_open_channels_live_status, check_live_interval, PRIORITY_BACKGROUND, (db, rpc_client))
+    spend_scanner = ShutdownSpendScanner()
+    scheduler.add(scan_shutdown_spends, check_live_interval, PRIORITY_MAINTENANCE, (db, rpc_client, spend_scanner))
+    scheduler.add(check_shutdown_channels_live_status, check_live_interval, PRIORITY_BACKGROUND, (db, rpc_client, spend_scanner))
+    # 与live状态检查同一周期采样，不需要RPC
+    scheduler.add(record_live_stats, check_live_interval, PRIORITY_BACKGROUND, (db,))
+    scheduler.add(snapshot_columns, snapshot_interval, PRIORITY_BACKGROUND, (ColumnSnapshot(db),))
+    scheduler.add(export_metrics, metrics_interval, PRIORITY_BACKGROUND, (db,), profile=False)
+    scheduler.add(export_dashboard, dashboard_interval, PRIORITY_BACKGROUND, (DashboardExporter(db),), profile=False)
+    if CRAWLER_PROFILE:
+        profiler.enable(CRAWLER_PROFILE_SAMPLE_INTERVAL, CRAWLER_PROFILE_DIR)
+        scheduler.add(profiler.dump_stacks, CRAWLER_PROFILE_DUMP_INTERVAL, PRIORITY_BACKGROUND, name='dump_profile', profile=False)
     try:
-        await asyncio.gather(
-            crawl_open_channels(open_interval),
-            crawl_shutdown_channels(shutdown_interval),
-            crawl_closed_channels(closed_interval),
-            check_open_channels_live_status(check_live_interval),
-            check_shutdown_channels_live_status(check_live_interval)
-        )
+        await scheduler.run()
     finally:
         # 确保在程序结束时关闭 RPC 客户端会话
         await rpc_client.close()
+        if rpc_client.store is not None:
+            # 等待录制队列中的记录写完
+            await asyncio.to_thread(rpc_client.store.close)
+
 
 class EpochNumberWithFraction:
     def __init__(self, value):
@@ -256,7 +337,7 @@ if __name__ == "__main__":
     open_interval = 60  # 开放通道爬取间隔
     shutdown_interval = 60  # 关闭通道爬取间隔
     closed_interval = 60  # 关闭通道爬取间隔
-    check_live_interval = 300  # 检查live状态间隔（5分钟）
+    check_live_interval = 60  # 检查到期live状态的间隔（1分钟）
     db = Database()
     db.init_db()
     db.close()
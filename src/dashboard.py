@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 与前端 script.js 的 PER_PAGE 一致
+DASHBOARD_PER_PAGE = 10
+
+
+def dashboard_path_of(db_name):
+    return db_name + '.dashboard.json'
+
+
+def page_payload(rows, page, per_page, total):
+    """列表接口的返回格式，/dashboard 中的第一页与 /open_channels 等接口完全相同"""
+    return {
+        'data': [dict(row) for row in rows],
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page
+        }
+    }
+
+
+class DashboardExporter:
+    """在爬虫进程中生成 /dashboard 的快照：各列表第一页、总数、live数量和生成时间
+
+    每次先读取各表最大id和live数量作为签名，签名不变时不重新生成；
+    快照先写临时文件再替换，API读取到的总是完整的文件。
+    """
+
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or dashboard_path_of(db.db_name)
+        self.signature = None
+
+    def _signature(self):
+        # 新记录会增大最大id，live记录变为dead会改变live数量
+        max_ids = tuple(self.db.get_max_id(table) for table in ('open_channels', 'shutdown_cells', 'closed_channels'))
+        return max_ids + (self.db.get_live_open_channels_count(), self.db.get_live_shutdown_cells_count())
+
+    def export(self):
+        """数据有变化时重新生成快照，返回是否生成"""
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+        snapshot = {
+            'open_channels': page_payload(self.db.get_open_channels(1, DASHBOARD_PER_PAGE), 1, DASHBOARD_PER_PAGE, self.db.get_open_channels_count()),
+            'shutdown_channels': page_payload(self.db.get_shutdown_channels(1, DASHBOARD_PER_PAGE), 1, DASHBOARD_PER_PAGE, self.db.get_shutdown_channels_count()),
+            'closed_channels': page_payload(self.db.get_closed_channels(1, DASHBOARD_PER_PAGE), 1, DASHBOARD_PER_PAGE, self.db.get_closed_channels_count()),
+            'live_stats': {
+                'live_open_channels_count': signature[3],
+                'live_shutdown_cells_count': signature[4]
+            },
+            'updated_at': int(time.time() * 1000),
+        }
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(self.path + '.tmp', self.path)
+        self.signature = signature
+        return True
+
+
+class DashboardCache:
+    """在API进程中缓存快照文件的内容和ETag，文件被替换后重新读取，请求不查询数据库"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.body = None
+        self.etag = None
+
+    def get(self):
+        """返回 (内容, ETag)，快照还没有生成时返回 (None, None)"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None, None
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.path, 'rb') as f:
+                    self.body = f.read()
+                self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+                self.mtime = mtime
+            return self.body, self.etag
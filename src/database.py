@@ -1,17 +1,167 @@
+import glob
+import os
 import sqlite3
 import time
 import threading
 from contextlib import contextmanager
 from queue import Queue, Empty
 
+from src.live_history import LIVE_STATS_FIELDS, RESOLUTIONS, bucket_of
+
+
+def _sqlite_int(value):
+    """超出SQLite INTEGER范围的u128金额按REAL保存"""
+    if -(1 << 63) <= value < (1 << 63):
+        return value
+    return float(value)
+
+
+# 只补充未知的值，V1 lock在args中已经确定
+UPDATE_HAVE_HTLCS_SQL = "UPDATE shutdown_cells SET have_htlcs = ? WHERE tx_hash = ? AND have_htlcs IS NULL"
+INSERT_HTLC_SQL = "INSERT OR IGNORE INTO htlcs (block_number, tx_hash, commitment_tx_hash, input_index, htlc_index, htlc_type, payment_amount, udt_args, payment_hash, remote_htlc_pubkey_hash, local_htlc_pubkey_hash, htlc_expiry_timestamp, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _htlc_rows(block_number, tx_hash, input_index, commitment_tx_hash, htlcs, udt_args, timestamp):
+    return [(block_number, tx_hash, commitment_tx_hash, input_index, i, htlc['htlc_type'], _sqlite_int(htlc['payment_amount']), udt_args, htlc['payment_hash'],
+             htlc['remote_htlc_pubkey_hash'], htlc['local_htlc_pubkey_hash'], htlc['htlc_expiry_timestamp'], timestamp)
+            for i, htlc in enumerate(htlcs)]
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('1', 'true', 'yes'):
+            return 1
+        if value in ('0', 'false', 'no'):
+            return 0
+        raise ValueError(f"invalid boolean: {value}")
+    return 1 if value else 0
+
+
+# 过滤查询允许使用的字段及其类型，只有这些字段会被拼进SQL
+FILTER_FIELDS = {
+    'open_channels': {
+        'block_number': int,
+        'status': str,
+        'ckb_capacity': int,
+        'udt_capacity': int,
+        'timestamp': int,
+    },
+    'shutdown_cells': {
+        'block_number': int,
+        'status': str,
+        'ckb_capacity': int,
+        'udt_capacity': int,
+        'delay_epoch': int,
+        'have_htlcs': _parse_bool,
+        'timestamp': int,
+    },
+    'closed_channels': {
+        'block_number': int,
+        'ckb_fee': int,
+        'udt_fee': int,
+        'timestamp': int,
+    },
+}
+
+FILTER_OPERATORS = ('=', '>=', '<=')
+
+# 过滤查询单页最大条数
+FILTER_MAX_LIMIT = 500
+
+# 可以按id游标增量读取新增行的表，以及每次最多返回的条数
+CHANGE_TABLES = ('open_channels', 'shutdown_cells', 'closed_channels')
+CHANGES_MAX_LIMIT = 1000
+
+# 前缀搜索涉及的 (表, 字段)，都有索引，按范围扫描
+SEARCH_COLUMNS = [
+    ('open_channels', 'tx_hash'),
+    ('shutdown_cells', 'tx_hash'),
+    ('shutdown_cells', 'pre_tx_hash'),
+    ('closed_channels', 'tx_hash'),
+    ('closed_channels', 'pre_tx_hash'),
+]
+
+# 前缀搜索每个字段最多返回的条数
+SEARCH_MAX_LIMIT = 50
+
+HEX_CHARS = set('0123456789abcdef')
+
+# 支持过滤查询和常用列表查询的索引
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_block_number ON open_channels (block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_status_block ON open_channels (status, block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_ckb_capacity ON open_channels (ckb_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_udt_capacity ON open_channels (udt_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_timestamp ON open_channels (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_status_next_check ON open_channels (status, next_check_at)",
+    # live数量和锁定金额的统计只读索引，不回表
+    "CREATE INDEX IF NOT EXISTS idx_open_channels_status_capacity ON open_channels (status, ckb_capacity, udt_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_block_number ON shutdown_cells (block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_status_block ON shutdown_cells (status, block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_have_htlcs_block ON shutdown_cells (have_htlcs, block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_ckb_capacity ON shutdown_cells (ckb_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_udt_capacity ON shutdown_cells (udt_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_delay_epoch ON shutdown_cells (delay_epoch)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_timestamp ON shutdown_cells (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_pre_tx_hash ON shutdown_cells (pre_tx_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_status_next_check ON shutdown_cells (status, next_check_at)",
+    "CREATE INDEX IF NOT EXISTS idx_shutdown_cells_status_capacity ON shutdown_cells (status, ckb_capacity, udt_capacity)",
+    "CREATE INDEX IF NOT EXISTS idx_closed_channels_block_number ON closed_channels (block_number)",
+    "CREATE INDEX IF NOT EXISTS idx_closed_channels_ckb_fee ON closed_channels (ckb_fee)",
+    "CREATE INDEX IF NOT EXISTS idx_closed_channels_udt_fee ON closed_channels (udt_fee)",
+    "CREATE INDEX IF NOT EXISTS idx_closed_channels_timestamp ON closed_channels (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_closed_channels_pre_tx_hash ON closed_channels (pre_tx_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_htlcs_commitment_tx_hash ON htlcs (commitment_tx_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_htlcs_payment_hash ON htlcs (payment_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_htlcs_expiry ON htlcs (htlc_expiry_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_htlcs_type_block ON htlcs (htlc_type, block_number)",
+]
+
+# 归档（见archive.py）：已结算的旧记录按月移到 <db_name>.archive/ 下的文件中，
+# 读取历史记录的查询通过TEMP视图 all_<table> 同时读取主库和所有归档文件
+ARCHIVE_TABLES = ('open_channels', 'shutdown_cells', 'closed_channels', 'htlcs')
+
+
+def archive_dir_of(db_name):
+    return db_name + '.archive'
+
+
+def archive_files(archive_dir):
+    return sorted(glob.glob(os.path.join(archive_dir, '*.db')))
+
+
+# 旧数据库升级时需要补充的列
+MIGRATION_COLUMNS = {
+    'open_channels': [
+        ('next_check_at', 'INTEGER'),
+    ],
+    'shutdown_cells': [
+        ('delay_epoch_value', 'INTEGER'),
+        ('lock_version', 'INTEGER'),
+        ('next_check_at', 'INTEGER'),
+        ('settlement_hash', 'TEXT'),
+    ],
+}
+
 
 class Database:
-    def __init__(self, db_name='fiber_monit.db', pool_size=5):
+    # 连接类型，可以替换为sqlite3.Connection的子类（例如记录commit耗时）
+    connection_factory = sqlite3.Connection
+
+    def __init__(self, db_name='fiber_monit.db', pool_size=5, busy_timeout=5.0, wal=False):
+        """busy_timeout为等待其他进程写锁的秒数；wal为True时把数据库切换为WAL模式（持久生效），
+        多个进程同时写入时（例如backfill）使用，读写互不阻塞"""
         self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self.wal = wal
         self.conn = None
         self.pool_size = pool_size
         self.connection_pool = Queue(maxsize=pool_size)
         self.pool_lock = threading.Lock()
+        self.archive_dir = archive_dir_of(db_name)
+        # 连接 -> (ATTACH时归档目录的mtime, 已ATTACH的别名列表)
+        self.archive_state = {}
         self._initialize_pool()
 
     def __enter__(self):
@@ -24,12 +174,17 @@ class Database:
             self.conn.close()
             self.conn = None
 
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout, check_same_thread=False, factory=self.connection_factory)
+        conn.row_factory = sqlite3.Row
+        if self.wal:
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
     def _initialize_pool(self):
         """初始化连接池"""
         for _ in range(self.pool_size):
-            conn = sqlite3.connect(self.db_name, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            self.connection_pool.put(conn)
+            self.connection_pool.put(self._connect())
     
     def _get_connection_from_pool(self):
         """从连接池获取连接"""
@@ -37,9 +192,7 @@ class Database:
             return self.connection_pool.get_nowait()
         except Empty:
             # 如果池为空，创建新连接
-            conn = sqlite3.connect(self.db_name, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            return conn
+            return self._connect()
     
     def _return_connection_to_pool(self, conn):
         """将连接返回到池中"""
@@ -47,6 +200,7 @@ class Database:
             self.connection_pool.put_nowait(conn)
         except:
             # 如果池已满，关闭连接
+            self.archive_state.pop(conn, None)
             conn.close()
     
     @contextmanager
@@ -54,10 +208,58 @@ class Database:
         """获取数据库连接的上下文管理器"""
         conn = self._get_connection_from_pool()
         try:
+            self._sync_archives(conn)
             yield conn
         finally:
             self._return_connection_to_pool(conn)
 
+    def _sync_archives(self, conn):
+        """归档目录有变化（新增或合并了归档文件）时重新ATTACH，并重建 all_<table> 视图
+
+        没有归档时视图只有主库一个分支，会被SQLite展开，查询计划与直接查询主表相同
+        """
+        try:
+            mtime = os.stat(self.archive_dir).st_mtime_ns
+        except OSError:
+            mtime = None
+        state = self.archive_state.get(conn)
+        if state is not None and state[0] == mtime:
+            return
+        for table in ARCHIVE_TABLES:
+            conn.execute(f'DROP VIEW IF EXISTS temp.all_{table}')
+        for alias in (state[1] if state else ()):
+            conn.execute(f'DETACH DATABASE {alias}')
+        aliases = []
+        for i, path in enumerate(archive_files(self.archive_dir) if mtime is not None else ()):
+            alias = f'archive{i}'
+            try:
+                conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+            except sqlite3.Error as e:
+                print(f"Error attaching archive {path}: {e}")
+                break
+            aliases.append(alias)
+
+        views = 0
+        for table in ARCHIVE_TABLES:
+            columns = [row['name'] for row in conn.execute(f'PRAGMA main.table_info({table})').fetchall()]
+            if not columns:
+                continue
+            selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+            for alias in aliases:
+                existing = {row['name'] for row in conn.execute(f'PRAGMA {alias}.table_info({table})').fetchall()}
+                if existing:
+                    # 归档之后主库新增的列在旧归档文件中为NULL
+                    selects.append(f"SELECT {', '.join(c if c in existing else f'NULL AS {c}' for c in columns)} FROM {alias}.{table}")
+            conn.execute(f"CREATE TEMP VIEW all_{table} AS {' UNION ALL '.join(selects)}")
+            views += 1
+        # init_db建表之前视图不完整，下次取连接时重试
+        self.archive_state[conn] = (mtime if views == len(ARCHIVE_TABLES) else object(), aliases)
+
+    def _count_all(self, conn, table, where='', params=()):
+        """主库和各归档分别COUNT再相加，避免对UNION ALL视图逐行计数"""
+        return sum(conn.execute(f'SELECT COUNT(*) FROM {schema}.{table} {where}', params).fetchone()[0]
+                   for schema in ['main'] + self.archive_state[conn][1])
+
     def init_db(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -105,6 +307,92 @@ class Database:
             );
             """)
 
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS channel_traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tx_hash TEXT NOT NULL UNIQUE,
+                trace TEXT NOT NULL,
+                finished BOOLEAN NOT NULL,
+                timestamp_status_update DATETIME,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """)
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metrics_snapshots (
+                source TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """)
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS htlcs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                block_number INTEGER,
+                tx_hash TEXT NOT NULL,
+                commitment_tx_hash TEXT,
+                input_index INTEGER NOT NULL,
+                htlc_index INTEGER NOT NULL,
+                htlc_type INTEGER,
+                payment_amount INTEGER,
+                udt_args TEXT,
+                payment_hash TEXT,
+                remote_htlc_pubkey_hash TEXT,
+                local_htlc_pubkey_hash TEXT,
+                htlc_expiry_timestamp INTEGER,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(tx_hash, input_index, htlc_index)
+            );
+            """)
+
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS epochs (
+                number INTEGER PRIMARY KEY,
+                start_number INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                start_timestamp INTEGER NOT NULL
+            );
+            """)
+
+            # live状态的时间序列，每个 (分辨率, 桶) 一行，见src/live_history.py
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS live_stats_history (
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                live_open_channels INTEGER NOT NULL,
+                open_ckb_capacity INTEGER NOT NULL,
+                open_udt_capacity INTEGER NOT NULL,
+                live_shutdown_cells INTEGER NOT NULL,
+                shutdown_ckb_capacity INTEGER NOT NULL,
+                shutdown_udt_capacity INTEGER NOT NULL,
+                PRIMARY KEY (resolution, bucket)
+            ) WITHOUT ROWID;
+            """)
+
+            # backfill按区块范围分片，每个范围单独记录进度
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_ranges (
+                kind TEXT NOT NULL,
+                range_start INTEGER NOT NULL,
+                range_end INTEGER NOT NULL,
+                next_block INTEGER NOT NULL,
+                done BOOLEAN NOT NULL DEFAULT 0,
+                timestamp_status_update DATETIME,
+                PRIMARY KEY (kind, range_start, range_end)
+            );
+            """)
+
+            for table, columns in MIGRATION_COLUMNS.items():
+                existing = {row['name'] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()}
+                for column, column_type in columns:
+                    if column not in existing:
+                        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+            for index_sql in INDEXES:
+                cursor.execute(index_sql)
+
             conn.commit()
 
     def insert_open_channel(self, block_number, tx_hash, status, ckb_capacity, udt_capacity, timestamp_status_update,timestamp):
@@ -119,12 +407,13 @@ class Database:
                  print(f"Error inserting open_channel with tx_hash {tx_hash}: {e}")
                  raise
 
-    def insert_shutdown_cell(self, block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp):
+    def insert_shutdown_cell(self, block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp, delay_epoch_value=None, lock_version=None, settlement_hash=None):
+        """have_htlcs为None表示未知（V2 lock的args无法判断），关闭时由update_shutdown_cell_have_htlcs补充"""
         with self.get_connection() as conn:
             try:
                 conn.execute(
-                    "INSERT OR IGNORE INTO shutdown_cells (block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp),
+                    "INSERT OR IGNORE INTO shutdown_cells (block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp, delay_epoch_value, lock_version, settlement_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (block_number, pre_tx_hash, tx_hash, status, ckb_capacity, udt_capacity, delay_epoch, have_htlcs, timestamp_status_update, timestamp, delay_epoch_value, lock_version, settlement_hash),
                 )
                 conn.commit()
             except sqlite3.Error as e:
@@ -143,23 +432,67 @@ class Database:
                  print(f"Error inserting closed_channel with tx_hash {tx_hash}: {e}")
                  raise
 
+    def insert_htlcs(self, block_number, tx_hash, input_index, commitment_tx_hash, htlcs, udt_args, timestamp):
+        """保存解锁commitment cell时witness中的pending htlc，input_index为该commitment cell在交易inputs中的位置"""
+        with self.get_connection() as conn:
+            try:
+                conn.executemany(INSERT_HTLC_SQL, _htlc_rows(block_number, tx_hash, input_index, commitment_tx_hash, htlcs, udt_args, timestamp))
+                conn.commit()
+            except sqlite3.Error as e:
+                 print(f"Error inserting htlcs with tx_hash {tx_hash}: {e}")
+                 raise
+
+    def update_shutdown_cell_have_htlcs(self, items):
+        """items为 [(tx_hash, have_htlcs)]，根据解锁witness补充have_htlcs未知的shutdown cell"""
+        with self.get_connection() as conn:
+            try:
+                conn.executemany(UPDATE_HAVE_HTLCS_SQL, [(have_htlcs, tx_hash) for tx_hash, have_htlcs in items])
+                conn.commit()
+            except sqlite3.Error as e:
+                 print(f"Error updating shutdown cell have_htlcs: {e}")
+                 raise
+
+    def get_htlcs_by_commitment_tx_hash(self, commitment_tx_hash):
+        with self.get_connection() as conn:
+            return conn.execute('SELECT * FROM all_htlcs WHERE commitment_tx_hash = ? ORDER BY input_index, htlc_index', (commitment_tx_hash,)).fetchall()
+
+    def get_htlc_summary(self):
+        """按htlc_type和资产(udt_args)汇总htlc数量和金额"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                """SELECT htlc_type, udt_args, COUNT(*) as count, SUM(payment_amount) as total_amount
+                   FROM all_htlcs GROUP BY htlc_type, udt_args ORDER BY htlc_type"""
+            ).fetchall()
+
+    def get_upcoming_htlc_expiries(self, now, limit=50):
+        """查询即将到期的htlc，now为毫秒时间戳
+        htlcs在commitment cell被解锁时才写入，只有解锁交易产生的新commitment cell仍为live时，其中的htlc才可能还未结算
+        """
+        with self.get_connection() as conn:
+            return conn.execute(
+                """SELECT h.* FROM all_htlcs h JOIN shutdown_cells s ON s.tx_hash = h.tx_hash
+                   WHERE s.status = 'live' AND h.htlc_expiry_timestamp >= ?
+                   ORDER BY h.htlc_expiry_timestamp LIMIT ?""",
+                (now, limit)
+            ).fetchall()
+
     def get_open_channels(self, page=1, per_page=50):
         with self.get_connection() as conn:
             offset = (page - 1) * per_page
-            return conn.execute('SELECT * FROM open_channels ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
+            return conn.execute('SELECT * FROM all_open_channels ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
     
     def get_open_channels_count(self):
         with self.get_connection() as conn:
-            return conn.execute('SELECT COUNT(*) as count FROM open_channels').fetchone()['count']
+            return self._count_all(conn, 'open_channels')
     
     def get_open_channels_by_status(self, status, page=1, per_page=50):
         with self.get_connection() as conn:
             offset = (page - 1) * per_page
-            return conn.execute('SELECT * FROM open_channels WHERE status = ? ORDER BY block_number DESC LIMIT ? OFFSET ?', (status, per_page, offset)).fetchall()
+            return conn.execute('SELECT * FROM all_open_channels WHERE status = ? ORDER BY block_number DESC LIMIT ? OFFSET ?', (status, per_page, offset)).fetchall()
     
     def get_open_channels_count_by_status(self, status):
         with self.get_connection() as conn:
-            return conn.execute('SELECT COUNT(*) as count FROM open_channels WHERE status = ?', (status,)).fetchone()['count']
+            return self._count_all(conn, 'open_channels', 'WHERE status = ?', (status,))
     
     def get_live_open_channels_count(self):
         """获取live状态的open_channels数量"""
@@ -181,6 +514,31 @@ class Database:
                 print(f"Error updating open_channel status for tx_hash {tx_hash}: {e}")
                 raise
     
+    def get_due_live_open_channels(self, now, limit):
+        """按下次检查时间取出已到期的live open_channels，新记录(next_check_at为NULL)最先检查"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT * FROM open_channels WHERE status = "live" AND (next_check_at IS NULL OR next_check_at <= ?) ORDER BY next_check_at LIMIT ?',
+                (now, limit)
+            ).fetchall()
+
+    def get_due_live_open_channels_count(self, now):
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) as count FROM open_channels WHERE status = "live" AND (next_check_at IS NULL OR next_check_at <= ?)',
+                (now,)
+            ).fetchone()['count']
+
+    def update_open_channels_next_check(self, items):
+        """items为[(next_check_at, tx_hash), ...]"""
+        with self.get_connection() as conn:
+            try:
+                conn.executemany('UPDATE open_channels SET next_check_at = ? WHERE tx_hash = ?', items)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error updating open_channels next_check_at: {e}")
+                raise
+
     def get_all_live_shutdown_channels(self):
         """获取所有shutdown_cells记录，用于检查live状态"""
         with self.get_connection() as conn:
@@ -196,27 +554,65 @@ class Database:
                 print(f"Error updating shutdown_channel status for tx_hash {tx_hash}: {e}")
                 raise
 
+    def get_due_live_shutdown_channels(self, now, limit):
+        """按下次检查时间取出已到期的live shutdown_cells，新记录(next_check_at为NULL)最先检查"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT * FROM shutdown_cells WHERE status = "live" AND (next_check_at IS NULL OR next_check_at <= ?) ORDER BY next_check_at LIMIT ?',
+                (now, limit)
+            ).fetchall()
+
+    def get_due_live_shutdown_channels_count(self, now):
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) as count FROM shutdown_cells WHERE status = "live" AND (next_check_at IS NULL OR next_check_at <= ?)',
+                (now,)
+            ).fetchone()['count']
+
+    def update_shutdown_channels_next_check(self, items):
+        """items为[(next_check_at, tx_hash), ...]"""
+        with self.get_connection() as conn:
+            try:
+                conn.executemany('UPDATE shutdown_cells SET next_check_at = ? WHERE tx_hash = ?', items)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error updating shutdown_cells next_check_at: {e}")
+                raise
+
+    def mark_shutdown_cells_due(self, tx_hashes):
+        """把已知被花费的live shutdown_cells的下次检查时间设为0，下一轮检查时最先处理，返回标记的记录数"""
+        with self.get_connection() as conn:
+            try:
+                count = 0
+                for tx_hash in tx_hashes:
+                    count += conn.execute('UPDATE shutdown_cells SET next_check_at = 0 WHERE tx_hash = ? AND status = "live"', (tx_hash,)).rowcount
+                conn.commit()
+                return count
+            except sqlite3.Error as e:
+                print(f"Error marking shutdown_cells due: {e}")
+                raise
+
     def get_last_open_channel(self):
         with self.get_connection() as conn:
-            return conn.execute('SELECT * FROM open_channels ORDER BY block_number DESC LIMIT 1').fetchone()
+            return conn.execute('SELECT * FROM all_open_channels ORDER BY block_number DESC LIMIT 1').fetchone()
 
     def get_shutdown_channels(self, page=1, per_page=50):
         with self.get_connection() as conn:
             offset = (page - 1) * per_page
-            return conn.execute('SELECT * FROM shutdown_cells ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
+            return conn.execute('SELECT * FROM all_shutdown_cells ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
     
     def get_shutdown_channels_count(self):
         with self.get_connection() as conn:
-            return conn.execute('SELECT COUNT(*) as count FROM shutdown_cells').fetchone()['count']
+            return self._count_all(conn, 'shutdown_cells')
     
     def get_shutdown_channels_by_status(self, status, page=1, per_page=50):
         with self.get_connection() as conn:
             offset = (page - 1) * per_page
-            return conn.execute('SELECT * FROM shutdown_cells WHERE status = ? ORDER BY block_number DESC LIMIT ? OFFSET ?', (status, per_page, offset)).fetchall()
+            return conn.execute('SELECT * FROM all_shutdown_cells WHERE status = ? ORDER BY block_number DESC LIMIT ? OFFSET ?', (status, per_page, offset)).fetchall()
     
     def get_shutdown_channels_count_by_status(self, status):
         with self.get_connection() as conn:
-            return conn.execute('SELECT COUNT(*) as count FROM shutdown_cells WHERE status = ?', (status,)).fetchone()['count']
+            return self._count_all(conn, 'shutdown_cells', 'WHERE status = ?', (status,))
     
     def get_live_shutdown_cells_count(self):
         """获取live状态的shutdown_cells数量"""
@@ -226,32 +622,335 @@ class Database:
     def get_shutdown_cell_by_tx_hash(self, tx_hash):
         """根据tx_hash查询shutdown_cell记录"""
         with self.get_connection() as conn:
-            return conn.execute('SELECT * FROM shutdown_cells WHERE tx_hash = ?', (tx_hash,)).fetchone()
+            return conn.execute('SELECT * FROM all_shutdown_cells WHERE tx_hash = ?', (tx_hash,)).fetchone()
 
     def get_closed_channels(self, page=1, per_page=50):
         with self.get_connection() as conn:
             offset = (page - 1) * per_page
-            return conn.execute('SELECT * FROM closed_channels ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
+            return conn.execute('SELECT * FROM all_closed_channels ORDER BY block_number DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
     
     def get_closed_channels_count(self):
         with self.get_connection() as conn:
-            return conn.execute('SELECT COUNT(*) as count FROM closed_channels').fetchone()['count']
+            return self._count_all(conn, 'closed_channels')
+
+    def get_closed_channel_fees_after(self, last_id):
+        """按id增量读取关闭通道的手续费列"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT id, timestamp, ckb_fee, udt_fee FROM all_closed_channels WHERE id > ? ORDER BY id', (last_id,)).fetchall()
+
+    def get_changes_after(self, table, last_id, limit=CHANGES_MAX_LIMIT):
+        """按id增量读取表中新写入的行，只按主键范围查找，供告警等下游按游标消费"""
+        if table not in CHANGE_TABLES:
+            raise ValueError(f"unknown table: {table}")
+        limit = max(1, min(int(limit), CHANGES_MAX_LIMIT))
+        with self.get_connection() as conn:
+            return conn.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (last_id, limit)).fetchall()
+
+    def get_max_id(self, table):
+        if table not in CHANGE_TABLES:
+            raise ValueError(f"unknown table: {table}")
+        with self.get_connection() as conn:
+            return max(conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {schema}.{table}').fetchone()[0]
+                       for schema in ['main'] + self.archive_state[conn][1])
+
+    def get_snapshot_rows(self, table, expressions, last_id, limit):
+        """按id增量读取 (id, *expressions) 元组（不构造sqlite3.Row），包括归档，供列式快照使用
+
+        expressions只能来自src/columnar.py中的列定义，不能来自请求参数
+        """
+        if table not in CHANGE_TABLES:
+            raise ValueError(f"unknown table: {table}")
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(f"SELECT id, {', '.join(expressions)} FROM all_{table} WHERE id > ? ORDER BY id LIMIT ?",
+                                  (last_id, limit)).fetchall()
+
+    def get_live_ids(self, table):
+        """live状态记录的id，走 (status, ...) 索引，不回表"""
+        if table not in ('open_channels', 'shutdown_cells'):
+            raise ValueError(f"unknown table: {table}")
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return [row[0] for row in cursor.execute(f'SELECT id FROM {table} WHERE status = "live"')]
 
     def get_last_close_channel(self):
         with self.get_connection() as conn:
-            return conn.execute('SELECT * FROM closed_channels ORDER BY block_number DESC LIMIT 1').fetchone()
+            return conn.execute('SELECT * FROM all_closed_channels ORDER BY block_number DESC LIMIT 1').fetchone()
+
+    def filter_channels(self, table, filters, cursor=None, limit=50):
+        """按白名单字段过滤查询，按 (block_number, id) 倒序做keyset分页
+
+        filters为 [(field, op, value), ...]，op为 =、>=、<=；cursor为上一页返回的next_cursor。
+        字段、操作符不合法或查询计划需要全表扫描时抛出ValueError。
+        """
+        fields = FILTER_FIELDS.get(table)
+        if fields is None:
+            raise ValueError(f"unknown table: {table}")
+        limit = max(1, min(int(limit), FILTER_MAX_LIMIT))
+
+        conditions = []
+        params = []
+        for field, op, value in filters:
+            if field not in fields:
+                raise ValueError(f"field not filterable: {field}")
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"invalid operator: {op}")
+            if op != '=' and fields[field] is str:
+                raise ValueError(f"range filter not supported on {field}")
+            conditions.append(f"{field} {op} ?")
+            params.append(fields[field](value))
+
+        if cursor:
+            try:
+                cursor_block, cursor_id = (int(x) for x in cursor.split(':'))
+            except ValueError:
+                raise ValueError(f"invalid cursor: {cursor}")
+            conditions.append("(block_number, id) < (?, ?)")
+            params.extend([cursor_block, cursor_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+
+        with self.get_connection() as conn:
+            # 有过滤条件时必须能通过索引定位（SEARCH），拒绝全表或全索引扫描。
+            # 按block_number索引顺序扫描会让范围条件用不上自己的索引，
+            # 这时用 +block_number 排序，让SQLite选择过滤字段的索引再排序
+            for order_by in ("block_number DESC, id DESC", "+block_number DESC, id DESC"):
+                sql = f"SELECT * FROM all_{table} {where} ORDER BY {order_by} LIMIT ?"
+                plan = [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+                # 有归档时计划中的表名带库名前缀，例如 SCAN archive0.open_channels
+                if not filters or not any(detail.startswith("SCAN ") and detail.split()[1].split('.')[-1] == table for detail in plan):
+                    break
+            else:
+                raise ValueError(f"filter combination requires a full scan of {table}: {plan}")
+
+            rows = conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = f"{rows[-1]['block_number']}:{rows[-1]['id']}"
+        return rows, next_cursor
+
+    def search_tx_hash_prefix(self, prefix, limit=20):
+        """按tx_hash前缀搜索三张表（包括pre_tx_hash）
+
+        使用 tx_hash >= prefix AND tx_hash < next_prefix 的范围条件走索引，
+        不使用LIKE。每个字段最多返回limit条，超过时truncated为True。
+        """
+        prefix = prefix.strip().lower()
+        if not prefix.startswith('0x'):
+            prefix = '0x' + prefix
+        if len(prefix) <= 2 or len(prefix) > 66 or not set(prefix[2:]) <= HEX_CHARS:
+            raise ValueError(f"invalid tx_hash prefix: {prefix}")
+        limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+        next_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+        results = []
+        truncated = False
+        with self.get_connection() as conn:
+            for table, column in SEARCH_COLUMNS:
+                rows = conn.execute(
+                    f'SELECT * FROM all_{table} WHERE {column} >= ? AND {column} < ? ORDER BY {column} LIMIT ?',
+                    (prefix, next_prefix, limit + 1)
+                ).fetchall()
+                if len(rows) > limit:
+                    truncated = True
+                    rows = rows[:limit]
+                for row in rows:
+                    results.append({'table': table, 'field': column, 'row': dict(row)})
+
+        return {
+            'query': prefix,
+            'results': results,
+            'truncated': truncated
+        }
+
+    def get_channel_trace(self, tx_hash):
+        """根据起始tx_hash查询已保存的channel trace"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT * FROM channel_traces WHERE tx_hash = ?', (tx_hash,)).fetchone()
+
+    def save_channel_trace(self, tx_hash, trace, finished):
+        """保存或更新channel trace，trace为JSON字符串"""
+        with self.get_connection() as conn:
+            try:
+                conn.execute(
+                    """INSERT INTO channel_traces (tx_hash, trace, finished, timestamp_status_update) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(tx_hash) DO UPDATE SET trace = excluded.trace, finished = excluded.finished,
+                       timestamp_status_update = excluded.timestamp_status_update""",
+                    (tx_hash, trace, finished, int(time.time()*1000)),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving channel_trace for tx_hash {tx_hash}: {e}")
+                raise
+
+    def save_metrics_snapshot(self, source, body):
+        """保存某个进程（如crawler）的metrics采样数据，body为JSON字符串"""
+        with self.get_connection() as conn:
+            try:
+                conn.execute('INSERT OR REPLACE INTO metrics_snapshots (source, body, timestamp) VALUES (?, ?, ?)', (source, body, int(time.time()*1000)))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving metrics snapshot for {source}: {e}")
+                raise
+
+    def get_metrics_snapshots(self):
+        with self.get_connection() as conn:
+            return conn.execute('SELECT * FROM metrics_snapshots').fetchall()
+
+    def get_live_stats(self):
+        """live状态的open channel和shutdown cell数量及锁定的金额"""
+        with self.get_connection() as conn:
+            open_row = conn.execute('SELECT COUNT(*), COALESCE(SUM(ckb_capacity), 0), COALESCE(SUM(udt_capacity), 0) FROM open_channels WHERE status = "live"').fetchone()
+            shutdown_row = conn.execute('SELECT COUNT(*), COALESCE(SUM(ckb_capacity), 0), COALESCE(SUM(udt_capacity), 0) FROM shutdown_cells WHERE status = "live"').fetchone()
+        return dict(zip(LIVE_STATS_FIELDS, tuple(open_row) + tuple(shutdown_row)))
+
+    def record_live_stats(self, stats, timestamp):
+        """把一次采样累加到各分辨率的桶中，并删除超过保留时长的桶"""
+        columns = ', '.join(LIVE_STATS_FIELDS)
+        updates = ', '.join(f'{field} = {field} + excluded.{field}' for field in LIVE_STATS_FIELDS)
+        sql = f'''INSERT INTO live_stats_history (resolution, bucket, samples, {columns}) VALUES (?, ?, 1, {', '.join('?' * len(LIVE_STATS_FIELDS))})
+                  ON CONFLICT (resolution, bucket) DO UPDATE SET samples = samples + 1, {updates}'''
+        values = tuple(stats[field] for field in LIVE_STATS_FIELDS)
+        with self.get_connection() as conn:
+            try:
+                for resolution, retention in RESOLUTIONS:
+                    conn.execute(sql, (resolution, bucket_of(timestamp, resolution)) + values)
+                    if retention is not None:
+                        conn.execute('DELETE FROM live_stats_history WHERE resolution = ? AND bucket < ?', (resolution, timestamp - retention))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error recording live stats: {e}")
+                raise
+
+    def get_live_stats_history(self, resolution, start, end, step):
+        """读取分辨率为resolution、时间在[start, end)内的桶，按step合并，各字段为采样的平均值"""
+        averages = ', '.join(f'ROUND(SUM({field}) * 1.0 / SUM(samples), 2) AS {field}' for field in LIVE_STATS_FIELDS)
+        with self.get_connection() as conn:
+            return conn.execute(f'''SELECT bucket - bucket % ? AS timestamp, {averages} FROM live_stats_history
+                                    WHERE resolution = ? AND bucket >= ? AND bucket < ?
+                                    GROUP BY 1 ORDER BY 1''', (step, resolution, bucket_of(start, resolution), end)).fetchall()
+
+    def insert_epochs(self, epochs):
+        """批量保存epoch信息，epochs为(number, start_number, length, start_timestamp)列表"""
+        with self.get_connection() as conn:
+            try:
+                conn.executemany('INSERT OR REPLACE INTO epochs (number, start_number, length, start_timestamp) VALUES (?, ?, ?, ?)', epochs)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error inserting {len(epochs)} epochs: {e}")
+                raise
+
+    def get_max_epoch_number(self):
+        with self.get_connection() as conn:
+            return conn.execute('SELECT MAX(number) as number FROM epochs').fetchone()['number']
+
+    def get_epochs(self):
+        with self.get_connection() as conn:
+            return conn.execute('SELECT number, start_number, length, start_timestamp FROM epochs ORDER BY number').fetchall()
+
+    def get_live_shutdown_cells_delay(self):
+        """live状态shutdown_cells计算到期时间所需的列"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT tx_hash, block_number, delay_epoch, delay_epoch_value, have_htlcs, ckb_capacity, udt_capacity FROM shutdown_cells WHERE status = "live"').fetchall()
+
+    def plan_backfill_ranges(self, kind, start, end, range_size):
+        """登记[start, end)的backfill范围，返回新增的范围数
+
+        已有范围覆盖的区块沿用已有范围及其进度，只为没有覆盖的区块按range_size新建范围；
+        未完成的已有范围跨越start或end时在边界处拆开（进度随之拆分），
+        使get_pending_backfill_ranges返回的范围都在[start, end)内且互不重叠
+        """
+        now = int(time.time()*1000)
+        with self.get_connection() as conn:
+            try:
+                rows = conn.execute(
+                    'SELECT * FROM backfill_ranges WHERE kind = ? AND range_start < ? AND range_end > ? ORDER BY range_start',
+                    (kind, end, start)
+                ).fetchall()
+                for row in rows:
+                    points = [p for p in (start, end) if row['range_start'] < p < row['range_end']]
+                    if row['done'] or not points:
+                        continue
+                    conn.execute('DELETE FROM backfill_ranges WHERE kind = ? AND range_start = ? AND range_end = ?',
+                                 (kind, row['range_start'], row['range_end']))
+                    bounds = [row['range_start']] + points + [row['range_end']]
+                    # [range_start, next_block)已完成，拆开后每段的进度为该前缀与这一段的交集
+                    conn.executemany(
+                        'INSERT INTO backfill_ranges (kind, range_start, range_end, next_block, done, timestamp_status_update) VALUES (?, ?, ?, ?, ?, ?)',
+                        [(kind, a, b, min(max(row['next_block'], a), b), row['next_block'] >= b, now) for a, b in zip(bounds, bounds[1:])],
+                    )
+                # 没有被已有范围覆盖的区块
+                gaps = []
+                cursor = start
+                for row in rows:
+                    if row['range_start'] > cursor:
+                        gaps.append((cursor, min(row['range_start'], end)))
+                    cursor = max(cursor, row['range_end'])
+                if cursor < end:
+                    gaps.append((cursor, end))
+                ranges = [(i, min(i + range_size, gap_end)) for gap_start, gap_end in gaps for i in range(gap_start, gap_end, range_size)]
+                conn.executemany(
+                    'INSERT OR IGNORE INTO backfill_ranges (kind, range_start, range_end, next_block, timestamp_status_update) VALUES (?, ?, ?, ?, ?)',
+                    [(kind, range_start, range_end, range_start, now) for range_start, range_end in ranges],
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"Error planning backfill ranges for {kind}: {e}")
+                raise
+        return len(ranges)
+
+    def get_pending_backfill_ranges(self, kind, start, end):
+        """返回[start, end)内未完成的范围，范围由plan_backfill_ranges按边界拆分过"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT * FROM backfill_ranges WHERE kind = ? AND done = 0 AND range_start >= ? AND range_end <= ? ORDER BY range_start',
+                (kind, start, end)
+            ).fetchall()
+
+    def merge_backfill_batch(self, kind, range_start, range_end, next_block, open_channels=(), closed_channels=(), htlcs=(), have_htlcs=()):
+        """在同一个事务中写入一批backfill结果并推进该范围的进度，崩溃后从next_block继续
+
+        open_channels/closed_channels的每一项与insert_open_channel/insert_closed_channel的参数一致，
+        htlcs的每一项与insert_htlcs的参数一致，have_htlcs与update_shutdown_cell_have_htlcs的参数一致
+        """
+        with self.get_connection() as conn:
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO open_channels (block_number, tx_hash, status, ckb_capacity, udt_capacity, timestamp_status_update, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    open_channels,
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO closed_channels (block_number, pre_tx_hash, tx_hash, ckb_fee, udt_fee, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    closed_channels,
+                )
+                conn.executemany(INSERT_HTLC_SQL, [row for item in htlcs for row in _htlc_rows(*item)])
+                conn.executemany(UPDATE_HAVE_HTLCS_SQL, [(flag, tx_hash) for tx_hash, flag in have_htlcs])
+                conn.execute(
+                    'UPDATE backfill_ranges SET next_block = ?, done = ?, timestamp_status_update = ? WHERE kind = ? AND range_start = ? AND range_end = ?',
+                    (next_block, next_block >= range_end, int(time.time()*1000), kind, range_start, range_end),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"Error merging backfill batch {kind} {range_start}-{range_end} at {next_block}: {e}")
+                raise
 
     def get_channel_lifecycle(self, tx_hash):
         """获取指定tx_hash的通道完整生命周期"""
         with self.get_connection() as conn:
             # 查询开放通道
-            open_channel = conn.execute('SELECT * FROM open_channels WHERE tx_hash = ?', (tx_hash,)).fetchone()
+            open_channel = conn.execute('SELECT * FROM all_open_channels WHERE tx_hash = ?', (tx_hash,)).fetchone()
             
             # 查询关闭中通道 - 使用pre_tx_hash关联
-            shutdown_channel = conn.execute('SELECT * FROM shutdown_cells WHERE pre_tx_hash = ?', (tx_hash,)).fetchone()
+            shutdown_channel = conn.execute('SELECT * FROM all_shutdown_cells WHERE pre_tx_hash = ?', (tx_hash,)).fetchone()
             
             # 查询已关闭通道 - 使用pre_tx_hash关联
-            closed_channel = conn.execute('SELECT * FROM closed_channels WHERE pre_tx_hash = ?', (tx_hash,)).fetchone()
+            closed_channel = conn.execute('SELECT * FROM all_closed_channels WHERE pre_tx_hash = ?', (tx_hash,)).fetchone()
             
             return {
                 'tx_hash': tx_hash,
@@ -310,7 +1009,7 @@ class Database:
             # 查询指定日期的open_channels数量
             # 处理timestamp字段，可能是毫秒时间戳或ISO格式
             open_count = conn.execute(
-                """SELECT COUNT(*) as count FROM open_channels 
+                """SELECT COUNT(*) as count FROM all_open_channels 
                    WHERE DATE(CASE 
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
@@ -320,7 +1019,7 @@ class Database:
             
             # 查询指定日期的shutdown_channels数量
             shutdown_count = conn.execute(
-                """SELECT COUNT(*) as count FROM shutdown_cells 
+                """SELECT COUNT(*) as count FROM all_shutdown_cells 
                    WHERE DATE(CASE 
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
@@ -343,7 +1042,7 @@ class Database:
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
                    END) as date, COUNT(*) as count 
-                   FROM open_channels 
+                   FROM all_open_channels 
                    WHERE DATE(CASE 
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
@@ -362,7 +1061,7 @@ class Database:
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
                    END) as date, COUNT(*) as count 
-                   FROM shutdown_cells 
+                   FROM all_shutdown_cells 
                    WHERE DATE(CASE 
                        WHEN typeof(timestamp) = 'integer' THEN datetime(timestamp/1000, 'unixepoch')
                        ELSE timestamp 
@@ -408,6 +1107,7 @@ class Database:
                     conn.close()
                 except Empty:
                     break
+            self.archive_state.clear()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+import threading
+
+import numpy as np
+
+DAY_MS = 24 * 60 * 60 * 1000
+PERIODS = {
+    'day': DAY_MS,
+    'week': 7 * DAY_MS,
+    'all': None,
+}
+FEE_FIELDS = ('ckb_fee', 'udt_fee')
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+HISTOGRAM_BINS = 20
+
+
+class FeeStats:
+    """关闭通道手续费统计
+
+    closed_channels的列数据以NumPy数组的形式缓存在内存中，每次请求只增量加载新增的记录，
+    没有新记录时直接返回缓存的统计结果。
+    传入store（columnar.ColumnStore）且列式快照已有数据时，直接使用内存映射的快照列，不查询数据库。
+    """
+
+    def __init__(self, db, store=None):
+        self.db = db
+        self.store = store
+        self.store_version = None
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.columns = {field: np.empty(0, dtype=np.float64) for field in FEE_FIELDS}
+        self.cache = {}
+
+    def refresh(self):
+        """加载id大于last_id的新记录，有新记录时清空统计缓存"""
+        if self.store is not None:
+            version = self.store.version()
+            if version == self.store_version:
+                return
+            columns = self.store.table('closed_channels')
+            if len(columns['id']):
+                self.store_version = version
+                self.timestamps = columns['timestamp']
+                self.columns = {field: columns[field] for field in FEE_FIELDS}
+                self.cache = {}
+                return
+        rows = self.db.get_closed_channel_fees_after(self.last_id)
+        if not rows:
+            return
+        self.last_id = rows[-1]['id']
+        self.timestamps = np.concatenate([self.timestamps, np.array([row['timestamp'] or 0 for row in rows], dtype=np.int64)])
+        for field in FEE_FIELDS:
+            values = np.array([row[field] or 0 for row in rows], dtype=np.float64)
+            self.columns[field] = np.concatenate([self.columns[field], values])
+        self.cache = {}
+
+    def get_stats(self, period='day', window_days=None, field='ckb_fee'):
+        if period not in PERIODS:
+            raise ValueError(f"invalid period: {period}")
+        if field not in FEE_FIELDS:
+            raise ValueError(f"invalid field: {field}")
+        key = (period, window_days, field)
+        with self.lock:
+            self.refresh()
+            if key not in self.cache:
+                self.cache[key] = self._compute(period, window_days, field)
+            return self.cache[key]
+
+    def _compute(self, period, window_days, field):
+        timestamps = self.timestamps
+        values = self.columns[field]
+        # 滚动窗口以最新一笔关闭交易的时间为终点，新数据到来之前结果保持不变
+        if window_days and len(timestamps):
+            mask = timestamps > timestamps.max() - window_days * DAY_MS
+            timestamps = timestamps[mask]
+            values = values[mask]
+
+        result = {
+            'period': period,
+            'window_days': window_days,
+            'field': field,
+            'total': _summary(values),
+            'histogram_edges': [],
+            'buckets': [],
+        }
+        if not len(values):
+            return result
+
+        period_ms = PERIODS[period]
+        groups = timestamps // period_ms if period_ms else np.zeros(len(values), dtype=np.int64)
+        order = np.lexsort((values, groups))
+        groups = groups[order]
+        values = values[order]
+        bucket_ids, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+
+        means = np.add.reduceat(values, starts) / counts
+        percentiles = {name: _sorted_percentile(values, starts, counts, q) for name, q in PERCENTILES}
+
+        edges = np.histogram_bin_edges(values, bins=HISTOGRAM_BINS)
+        bin_index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, HISTOGRAM_BINS - 1)
+        group_index = np.repeat(np.arange(len(bucket_ids)), counts)
+        histograms = np.bincount(group_index * HISTOGRAM_BINS + bin_index, minlength=len(bucket_ids) * HISTOGRAM_BINS)
+        histograms = histograms.reshape(len(bucket_ids), HISTOGRAM_BINS)
+
+        result['histogram_edges'] = edges.tolist()
+        for i, bucket_id in enumerate(bucket_ids.tolist()):
+            bucket = {
+                'start': bucket_id * period_ms if period_ms else None,
+                'count': int(counts[i]),
+                'mean': float(means[i]),
+                'histogram': histograms[i].tolist(),
+            }
+            for name, _ in PERCENTILES:
+                bucket[name] = float(percentiles[name][i])
+            result['buckets'].append(bucket)
+        return result
+
+
+def _sorted_percentile(values, starts, counts, q):
+    """values在每个分组内已排序，按线性插值一次算出所有分组的百分位数"""
+    position = starts + (counts - 1) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def _summary(values):
+    if not len(values):
+        return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None}
+    summary = {'count': int(len(values)), 'mean': float(values.mean())}
+    quantiles = np.quantile(values, [q for _, q in PERCENTILES])
+    for (name, _), value in zip(PERCENTILES, quantiles):
+        summary[name] = float(value)
+    return summary
@@ -0,0 +1,65 @@
+import json
+
+# JSON编解码：优先使用已安装的更快的库（msgspec > orjson），都没有时使用标准库json。
+# dumps返回bytes，loads接受bytes或str
+
+
+class StdlibCodec:
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, obj):
+        # u128金额等超出64位的整数orjson不支持，退回标准库
+        try:
+            return self.orjson.dumps(obj)
+        except TypeError:
+            return json.dumps(obj).encode()
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj):
+        return self.encoder.encode(obj)
+
+    def loads(self, data):
+        return self.decoder.decode(data)
+
+
+CODECS = {
+    "msgspec": MsgspecCodec,
+    "orjson": OrjsonCodec,
+    "json": StdlibCodec,
+}
+
+
+def get_codec(name=None):
+    """返回指定的codec；name为None时按msgspec、orjson、json的顺序选择第一个可用的"""
+    if name is not None:
+        return CODECS[name]()
+    for codec_class in CODECS.values():
+        try:
+            return codec_class()
+        except ImportError:
+            continue
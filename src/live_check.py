@@ -0,0 +1,157 @@
+import random
+import time
+
+from src.const import COMMITMENT_LOCK_CODE_HASH
+from src.maturity import DEFAULT_EPOCH_DURATION_MS
+from src.records import TRANSACTION
+from src.rpc_async import get_transactions
+
+# live状态检查的分级策略：每条记录保存下次检查时间(next_check_at，毫秒)，
+# 每轮只检查已到期的记录，检查后按下面的规则重新计算下次检查时间
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+# 每轮每张表最多检查的记录数，超出的记录顺延到下一轮
+LIVE_CHECK_BATCH = 200
+# 检查出错时的重试间隔
+RETRY_INTERVAL_MS = 5 * MINUTE_MS
+MIN_INTERVAL_MS = MINUTE_MS
+MAX_INTERVAL_MS = 24 * HOUR_MS
+# 下次检查时间随机浮动的比例，避免同一批记录总是同时到期
+INTERVAL_JITTER = 0.1
+
+# (距离上链的时长上限, 检查间隔)：新通道关闭的可能性更大，检查更频繁
+AGE_TIERS = [
+    (DAY_MS, 20 * MINUTE_MS),
+    (7 * DAY_MS, 2 * HOUR_MS),
+    (30 * DAY_MS, 6 * HOUR_MS),
+]
+DORMANT_INTERVAL_MS = 24 * HOUR_MS
+# (ckb_capacity下限, 间隔缩小倍数)：金额越大越需要及时发现
+CAPACITY_TIERS = [
+    (100000 * 10**8, 4),
+    (10000 * 10**8, 2),
+]
+UDT_FACTOR = 2
+
+# shutdown cell：有pending htlc时随时可能被领取
+HTLC_INTERVAL_MS = MINUTE_MS
+# 没有htlc时，delay_epoch到期后才能被正常领取，到期后检查更频繁
+MATURED_INTERVAL_MS = 2 * MINUTE_MS
+# 到期后超过该时长仍未被领取的cell（包括有htlc的）很可能被放弃，改为与open channel相同的按时长和金额分级的间隔
+MATURED_WINDOW_MS = DAY_MS
+# 到期前仍可能被更新版本的commitment交易花费
+IMMATURE_INTERVAL_MS = 30 * MINUTE_MS
+
+# shutdown cell被花费的交易一定以commitment lock cell为input，ShutdownSpendScanner每轮用indexer扫描新区块中的这类input，
+# 把被花费的cell标记为立即检查；距离上次扫描完成不超过该时长时认为扫描正常，逐个检查只作为兜底，按时长和金额分级
+SPEND_SCAN_MAX_AGE_MS = 5 * MINUTE_MS
+SPEND_SCAN_BATCH = 1000
+
+
+def _ms(value):
+    """数据库中的时间戳为毫秒整数，旧数据可能是字符串，无法使用时返回None"""
+    return value if isinstance(value, int) else None
+
+
+def _age(row, now):
+    """距离cell上链的时长，live状态的cell上链后没有发生过变化；
+    不使用timestamp_status_update，它是写入数据库的时间，回填的旧通道也会很新"""
+    block_time = _ms(row['timestamp'])
+    return max(0, now - block_time) if block_time is not None else 0
+
+
+def _jitter(interval):
+    return interval * (1 + random.uniform(-INTERVAL_JITTER, INTERVAL_JITTER))
+
+
+def _clamp(interval):
+    return int(min(max(interval, MIN_INTERVAL_MS), MAX_INTERVAL_MS))
+
+
+def value_interval(row, now):
+    """按上链时长分级，再按金额缩短"""
+    age = _age(row, now)
+    interval = DORMANT_INTERVAL_MS
+    for max_age, tier_interval in AGE_TIERS:
+        if age < max_age:
+            interval = tier_interval
+            break
+    for min_capacity, factor in CAPACITY_TIERS:
+        if (row['ckb_capacity'] or 0) >= min_capacity:
+            interval /= factor
+            break
+    if row['udt_capacity']:
+        interval /= UDT_FACTOR
+    return interval
+
+
+def open_channel_next_check(row, now):
+    return now + _clamp(_jitter(value_interval(row, now)))
+
+
+def shutdown_cell_next_check(row, now, spends_scanned=False):
+    """spends_scanned为True时（ShutdownSpendScanner.current），花费由扫描发现，只按时长和金额分级兜底；
+    否则按htlc和到期时间分级"""
+    if spends_scanned:
+        return now + _clamp(_jitter(value_interval(row, now)))
+    block_time = _ms(row['timestamp'])
+    # 按平均epoch时长估算到期时间
+    matured_at = None if block_time is None or row['delay_epoch'] is None else block_time + row['delay_epoch'] * DEFAULT_EPOCH_DURATION_MS
+    if matured_at is not None and now >= matured_at + MATURED_WINDOW_MS:
+        return now + _clamp(_jitter(value_interval(row, now)))
+    # have_htlcs为None（V2 lock在关闭前无法判断）时，到期前按有htlc处理
+    if row['have_htlcs'] or (row['have_htlcs'] is None and (matured_at is None or now < matured_at)):
+        return now + _clamp(_jitter(HTLC_INTERVAL_MS))
+    interval = min(value_interval(row, now), IMMATURE_INTERVAL_MS)
+    if matured_at is None:
+        return now + _clamp(_jitter(interval))
+    if now >= matured_at:
+        return now + _clamp(_jitter(MATURED_INTERVAL_MS))
+    # 到期前最晚在到期时刻检查一次
+    return min(now + _clamp(_jitter(interval)), matured_at)
+
+
+def retry_next_check(now):
+    return now + _clamp(_jitter(RETRY_INTERVAL_MS))
+
+
+class ShutdownSpendScanner:
+    """扫描新区块中花费commitment lock cell的交易，把被花费的live shutdown cell标记为立即检查
+
+    每轮一次indexer查询覆盖所有shutdown cell，每笔花费再多一次get_transaction，
+    不需要逐个高频检查有htlc或尚未到期的cell。进度只保存在内存中，启动后从当前indexer tip开始，
+    停机期间的花费由逐个检查兜底。
+    """
+
+    def __init__(self):
+        self.next_block = None
+        self.scanned_at = None
+
+    def current(self, now):
+        """最近一次扫描是否在SPEND_SCAN_MAX_AGE_MS内完成"""
+        return self.scanned_at is not None and now - self.scanned_at <= SPEND_SCAN_MAX_AGE_MS
+
+    async def scan(self, db, rpc_client):
+        """扫描到indexer tip，返回标记的cell数"""
+        end = int((await rpc_client.get_indexer_tip())['block_number'], 16) + 1
+        if self.next_block is None:
+            self.next_block = end
+        spent = set()
+        marked = 0
+        for i in range(self.next_block, end, SPEND_SCAN_BATCH):
+            for tx in await get_transactions(rpc_client, COMMITMENT_LOCK_CODE_HASH, i, min(i + SPEND_SCAN_BATCH, end)):
+                if tx.io_type != 'input':
+                    continue
+                spender = await rpc_client.get_transaction(tx.tx_hash, schema=TRANSACTION)
+                out_point = spender.inputs[tx.io_index]
+                # shutdown cell是commitment交易的第0个output
+                if out_point.index == 0:
+                    spent.add(out_point.tx_hash)
+        if spent:
+            marked = db.mark_shutdown_cells_due(list(spent))
+        self.next_block = end
+        self.scanned_at = int(time.time() * 1000)
+        return marked
@@ -0,0 +1,39 @@
+import math
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+# (分辨率, 保留时长)：每次采样同时累加到各分辨率的桶中，超过保留时长的桶被删除，None表示永久保留
+RESOLUTIONS = [
+    (MINUTE_MS, DAY_MS),
+    (HOUR_MS, 30 * DAY_MS),
+    (DAY_MS, None),
+]
+# 每个桶保存各字段的累加值和采样次数，读取时取平均
+LIVE_STATS_FIELDS = (
+    'live_open_channels', 'open_ckb_capacity', 'open_udt_capacity',
+    'live_shutdown_cells', 'shutdown_ckb_capacity', 'shutdown_udt_capacity',
+)
+# /live_stats/history 单次最多返回的点数
+HISTORY_MAX_POINTS = 1000
+
+
+def bucket_of(timestamp, resolution):
+    return timestamp - timestamp % resolution
+
+
+def history_plan(start, end, step, now):
+    """选择查询使用的分辨率和实际步长，返回 (resolution, step)
+
+    只考虑保留时长覆盖start的分辨率；步长至少为分辨率，并放大到点数不超过HISTORY_MAX_POINTS，
+    且为分辨率的整数倍。在此前提下选择不大于步长的最粗分辨率，需要扫描的桶最少。
+    """
+    if end <= start:
+        raise ValueError("to must be greater than from")
+    candidates = [resolution for resolution, retention in RESOLUTIONS if retention is None or start >= now - retention]
+    step = max(step or 0, math.ceil((end - start) / HISTORY_MAX_POINTS))
+    usable = [resolution for resolution in candidates if resolution <= step]
+    resolution = usable[-1] if usable else candidates[0]
+    step = max(resolution, math.ceil(step / resolution) * resolution)
+    return resolution, step
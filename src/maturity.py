@@ -0,0 +1,126 @@
+import threading
+import time
+
+import numpy as np
+
+# 正常情况下一个epoch约4小时，已知epoch太少时用于估算未来epoch的时长
+DEFAULT_EPOCH_DURATION_MS = 4 * 60 * 60 * 1000
+# 用最近多少个已结束epoch的平均时长估算未来epoch
+DURATION_WINDOW = 42
+EPOCH_VALUE_MASK = (1 << 56) - 1
+MAX_LIMIT = 1000
+
+
+class MaturityForecast:
+    """预测live状态shutdown cell何时可以被领取
+
+    epochs表以NumPy数组的形式缓存在内存中，只在有新的epoch时重新加载；
+    每次请求对所有live cell做一次向量化计算，不再向节点请求。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.max_epoch = None
+        self.numbers = np.empty(0, dtype=np.int64)
+        self.starts = np.empty(0, dtype=np.int64)
+        self.lengths = np.empty(0, dtype=np.int64)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.durations = np.empty(0, dtype=np.float64)
+        self.average_duration = float(DEFAULT_EPOCH_DURATION_MS)
+
+    def refresh(self):
+        max_epoch = self.db.get_max_epoch_number()
+        if max_epoch == self.max_epoch:
+            return
+        rows = self.db.get_epochs()
+        self.max_epoch = max_epoch
+        self.numbers = np.array([row['number'] for row in rows], dtype=np.int64)
+        self.starts = np.array([row['start_number'] for row in rows], dtype=np.int64)
+        self.lengths = np.array([row['length'] for row in rows], dtype=np.int64)
+        self.timestamps = np.array([row['start_timestamp'] for row in rows], dtype=np.int64)
+        # 只有相邻epoch都已知时才能得到实际时长，最后一个epoch还没结束，用平均值
+        finished = np.diff(self.timestamps)[np.diff(self.numbers) == 1]
+        if len(finished):
+            self.average_duration = float(finished[-DURATION_WINDOW:].mean())
+        self.durations = np.full(len(rows), self.average_duration)
+        if len(rows) > 1:
+            contiguous = np.diff(self.numbers) == 1
+            self.durations[:-1] = np.where(contiguous, np.diff(self.timestamps), self.average_duration)
+
+    def get_forecast(self, now=None, limit=100, within_hours=None):
+        now = int(time.time() * 1000) if now is None else now
+        limit = max(1, min(limit, MAX_LIMIT))
+        with self.lock:
+            self.refresh()
+            rows = self.db.get_live_shutdown_cells_delay()
+            return self._compute(rows, now, limit, within_hours)
+
+    def _compute(self, rows, now, limit, within_hours):
+        result = {
+            'now': now,
+            'average_epoch_duration': self.average_duration,
+            'summary': {'total': len(rows), 'claimable': 0, 'within_24h': 0, 'unknown': 0},
+            'cells': [],
+        }
+        if not rows:
+            return result
+
+        blocks = np.array([row['block_number'] or 0 for row in rows], dtype=np.int64)
+        # delay_epoch_value为空的旧记录只有epoch数，按fraction为0处理
+        values = np.array([row['delay_epoch_value'] if row['delay_epoch_value'] is not None else row['delay_epoch'] or 0 for row in rows], dtype=np.int64)
+        values &= EPOCH_VALUE_MASK
+        delay_number = values & 0xFFFFFF
+        delay_index = (values >> 24) & 0xFFFF
+        delay_length = (values >> 40) & 0xFFFF
+        delay = delay_number + np.divide(delay_index, delay_length, out=np.zeros(len(values)), where=delay_length > 0)
+
+        # cell所在的epoch以及在epoch中的位置
+        known = np.zeros(len(rows), dtype=bool)
+        target = np.full(len(rows), np.nan)
+        if len(self.numbers):
+            i = np.clip(np.searchsorted(self.starts, blocks, side='right') - 1, 0, None)
+            known = (blocks >= self.starts[i]) & (blocks < self.starts[i] + self.lengths[i])
+            cell_epoch = self.numbers[i] + (blocks - self.starts[i]) / np.maximum(self.lengths[i], 1)
+            target = np.where(known, cell_epoch + delay, np.nan)
+
+        # 到期epoch已知时在该epoch内按时间插值，否则从最后一个已知epoch按平均时长外推
+        target_epoch = np.floor(np.nan_to_num(target)).astype(np.int64)
+        fraction = np.nan_to_num(target) - target_epoch
+        claimable_at = np.full(len(rows), np.nan)
+        if len(self.numbers):
+            j = np.clip(np.searchsorted(self.numbers, target_epoch), 0, len(self.numbers) - 1)
+            in_table = self.numbers[j] == target_epoch
+            interpolated = self.timestamps[j] + fraction * self.durations[j]
+            extrapolated = self.timestamps[-1] + (np.nan_to_num(target) - self.numbers[-1]) * self.average_duration
+            claimable_at = np.where(known, np.where(in_table, interpolated, extrapolated), np.nan)
+
+        claimable = known & (claimable_at <= now)
+        within_day = known & (claimable_at > now) & (claimable_at <= now + 24 * 60 * 60 * 1000)
+        result['summary'].update({
+            'claimable': int(claimable.sum()),
+            'within_24h': int(within_day.sum()),
+            'unknown': int((~known).sum()),
+        })
+
+        selected = known
+        if within_hours is not None:
+            selected = selected & (claimable_at <= now + within_hours * 60 * 60 * 1000)
+        order = np.flatnonzero(selected)
+        order = order[np.argsort(claimable_at[order], kind='stable')][:limit]
+
+        for k in order.tolist():
+            row = rows[k]
+            result['cells'].append({
+                'tx_hash': row['tx_hash'],
+                'block_number': row['block_number'],
+                'ckb_capacity': row['ckb_capacity'],
+                'udt_capacity': row['udt_capacity'],
+                # V2 lock在关闭前无法判断是否有htlc，为None
+                'have_htlcs': None if row['have_htlcs'] is None else bool(row['have_htlcs']),
+                'delay_epoch': {'number': int(delay_number[k]), 'index': int(delay_index[k]), 'length': int(delay_length[k])},
+                'maturity_epoch': float(target[k]),
+                'claimable_timestamp': int(claimable_at[k]),
+                'claimable': bool(claimable[k]),
+            })
+        return result
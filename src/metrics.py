@@ -0,0 +1,246 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus 文本格式的简单实现，爬虫进程和API进程各有一个REGISTRY，
+# 爬虫定期把自己的采样数据写入数据库，由API的 /metrics 合并输出
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self._labels(key), value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (bucket_counts, total, count) in self.values.items():
+                labels = self._labels(key)
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    result.append((f"{self.name}_bucket", dict(labels, le=str(bound)), bucket_count))
+                result.append((f"{self.name}_bucket", dict(labels, le="+Inf"), count))
+                result.append((f"{self.name}_sum", labels, total))
+                result.append((f"{self.name}_count", labels, count))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.const_labels = {}
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self):
+        """返回可JSON序列化的采样数据: [[name, type, help, [[sample_name, labels, value], ...]], ...]"""
+        families = []
+        for metric in self.metrics:
+            samples = [[name, dict(self.const_labels, **labels), value] for name, labels, value in metric.samples()]
+            families.append([metric.name, metric.type, metric.documentation, samples])
+        return families
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    items = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        items.append(f'{key}="{value}"')
+    return "{" + ",".join(items) + "}"
+
+
+def render(*family_lists):
+    """把多个进程的采样数据按metric名称合并，输出Prometheus文本格式"""
+    merged = {}
+    for families in family_lists:
+        for name, metric_type, documentation, samples in families:
+            if name not in merged:
+                merged[name] = (metric_type, documentation, [])
+            merged[name][2].extend(samples)
+
+    lines = []
+    for name, (metric_type, documentation, samples) in merged.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CHAIN_TIP = REGISTRY.register(Gauge("fiber_chain_tip_block", "Latest chain tip block number seen by the crawler"))
+CRAWLER_CHECKPOINT = REGISTRY.register(Gauge("fiber_crawler_checkpoint_block", "Last block processed by each crawler", ["crawler"]))
+CRAWLER_LAG = REGISTRY.register(Gauge("fiber_crawler_lag_blocks", "Chain tip minus crawler checkpoint", ["crawler"]))
+CRAWLER_EXPORT_TIME = REGISTRY.register(Gauge("fiber_crawler_last_export_timestamp_seconds", "Unix time of the last crawler metrics export"))
+
+RPC_LATENCY = REGISTRY.register(Histogram("fiber_rpc_request_seconds", "CKB RPC request latency per attempt", ["method"]))
+RPC_RETRIES = REGISTRY.register(Counter("fiber_rpc_retries_total", "CKB RPC attempts retried after a client error", ["method"]))
+RPC_ERRORS = REGISTRY.register(Counter("fiber_rpc_errors_total", "CKB RPC calls that finally failed", ["method"]))
+RPC_HEDGES = REGISTRY.register(Counter("fiber_rpc_hedged_requests_total", "CKB RPC duplicate requests sent to a second endpoint", ["method"]))
+RPC_COALESCED = REGISTRY.register(Counter("fiber_rpc_coalesced_calls_total", "CKB RPC calls served by an identical in-flight request", ["method"]))
+RPC_BUDGET_WAIT = REGISTRY.register(Histogram("fiber_rpc_budget_wait_seconds", "Time spent waiting for the crawler RPC budget", ["priority"]))
+RPC_BUDGET_INFLIGHT = REGISTRY.register(Gauge("fiber_rpc_budget_inflight", "CKB RPC requests currently holding a budget slot"))
+
+SCHEDULER_LAST_RUN = REGISTRY.register(Gauge("fiber_scheduler_job_last_run_timestamp_seconds", "Unix time the job last started", ["job"]))
+SCHEDULER_DURATION = REGISTRY.register(Gauge("fiber_scheduler_job_duration_seconds", "Duration of the job's last run", ["job"]))
+SCHEDULER_LAG = REGISTRY.register(Gauge("fiber_scheduler_job_lag_seconds", "How late the job's last run started", ["job"]))
+SCHEDULER_BACKLOG = REGISTRY.register(Gauge("fiber_scheduler_job_backlog", "Runs skipped because the previous run overran its interval", ["job"]))
+SCHEDULER_RUNS = REGISTRY.register(Counter("fiber_scheduler_job_runs_total", "Job runs by result", ["job", "status"]))
+
+CRAWLER_STAGE_SECONDS = REGISTRY.register(Histogram("fiber_crawler_stage_seconds", "Crawler stage duration, recorded only when profiling is enabled", ["stage"]))
+
+LIVE_CHECKS = REGISTRY.register(Counter("fiber_live_checks_total", "Live status checks by table and result", ["table", "result"]))
+LIVE_CHECK_OVERDUE = REGISTRY.register(Gauge("fiber_live_check_overdue", "Live cells past their next check time after a check pass", ["table"]))
+
+DB_QUERY_LATENCY = REGISTRY.register(Histogram("fiber_db_query_seconds", "Database method latency", ["method"]))
+DB_COMMIT_LATENCY = REGISTRY.register(Histogram("fiber_db_commit_seconds", "Database commit latency", ["method"]))
+
+API_LATENCY = REGISTRY.register(Histogram("fiber_api_request_seconds", "API handler latency", ["endpoint"]))
+API_REQUESTS = REGISTRY.register(Counter("fiber_api_requests_total", "API requests by status code", ["endpoint", "status"]))
+
+
+def set_chain_tip(block_number):
+    CHAIN_TIP.set(block_number)
+
+
+def set_crawler_checkpoint(crawler, block_number):
+    CRAWLER_CHECKPOINT.set(block_number, crawler=crawler)
+    tip = CHAIN_TIP.get()
+    if tip is not None:
+        CRAWLER_LAG.set(max(tip - block_number, 0), crawler=crawler)
+
+
+class RPCMetricsObserver:
+    """AsyncRPCClient.call 的回调，记录每个方法的延迟、重试、对冲、合并和失败次数"""
+
+    def on_request(self, method, seconds):
+        RPC_LATENCY.observe(seconds, method=method)
+
+    def on_retry(self, method):
+        RPC_RETRIES.inc(method=method)
+
+    def on_error(self, method):
+        RPC_ERRORS.inc(method=method)
+
+    def on_hedge(self, method):
+        RPC_HEDGES.inc(method=method)
+
+    def on_coalesce(self, method):
+        RPC_COALESCED.inc(method=method)
+
+
+def instrument_rpc_client(client_class):
+    client_class.observer = RPCMetricsObserver()
+
+
+_db_method = threading.local()
+
+
+class TimedConnection:
+    """混入sqlite3.Connection，记录commit耗时，归属到当前正在执行的Database方法"""
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            DB_COMMIT_LATENCY.observe(time.perf_counter() - start, method=getattr(_db_method, "name", None) or "unknown")
+
+
+def _timed_db_method(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_db_method, "name", None)
+        _db_method.name = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, method=name)
+            _db_method.name = previous
+    return wrapper
+
+
+def instrument_database(database_class):
+    """给Database的公开方法加上耗时统计，重复调用不会重复包装"""
+    if getattr(database_class, "_metrics_instrumented", False):
+        return
+    database_class._metrics_instrumented = True
+    database_class.connection_factory = type("TimedConnection", (TimedConnection, database_class.connection_factory), {})
+    for name, func in list(vars(database_class).items()):
+        if name.startswith("_") or not inspect.isfunction(func) or name in ("get_connection", "close"):
+            continue
+        setattr(database_class, name, _timed_db_method(name, func))
@@ -0,0 +1,175 @@
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from src.metrics import CRAWLER_STAGE_SECONDS
+
+# 关闭时span()直接返回这个空的上下文管理器，几乎没有开销
+_NULL = nullcontext()
+# 当前协程所在的汇总范围（例如一次任务执行、一个1000区块的窗口），span的耗时同时计入所有范围
+_AGGREGATES = contextvars.ContextVar("profile_aggregates", default=())
+
+
+class Aggregate:
+    """一个汇总范围内各阶段的次数、累计耗时和最大耗时
+
+    span可以嵌套，各阶段的耗时包含其中嵌套的阶段；并发执行的span分别计时，累计耗时可能大于墙钟时间。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall = None
+        self.stages = collections.defaultdict(lambda: [0, 0.0, 0.0])
+
+    def add(self, stage, seconds):
+        stats = self.stages[stage]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "wall": self.wall,
+            "stages": {stage: {"count": count, "total": total, "max": max_seconds}
+                       for stage, (count, total, max_seconds) in self.stages.items()},
+        }
+
+    def __str__(self):
+        stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+        detail = ", ".join(f"{stage} {total:.3f}s/{count}" for stage, (count, total, _) in stages)
+        return f"profile {self.name}: wall {self.wall:.3f}s, {detail or 'no spans'}"
+
+
+class StackSampler:
+    """后台线程定时采样目标线程的调用栈，按collapsed stack格式（"a;b;c 次数"）汇总，可直接用于flamegraph.pl"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            with self.lock:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        """把目前为止的采样写入path并清空，返回写入的采样数"""
+        with self.lock:
+            counts, self.counts = self.counts, collections.Counter()
+        with open(path, "w") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(counts.values())
+
+
+class Profiler:
+    """爬虫各阶段的耗时统计，默认关闭
+
+    用法：with profiler.span("indexer_scan"): ...；with profiler.aggregate(name): ... 汇总其中所有span，
+    结束时输出各阶段耗时并保存在reports中。开启采样时还会定期把调用栈写入output_dir。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sampler = None
+        self.output_dir = None
+        self.reports = collections.deque(maxlen=100)
+
+    def enable(self, sample_interval=None, output_dir="profiles"):
+        """在运行事件循环的线程中调用，sample_interval为None时只统计span"""
+        self.enabled = True
+        if sample_interval and self.sampler is None:
+            os.makedirs(output_dir, exist_ok=True)
+            self.output_dir = output_dir
+            self.sampler = StackSampler(threading.get_ident(), sample_interval)
+            self.sampler.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+    def span(self, stage):
+        if not self.enabled:
+            return _NULL
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            for aggregate in _AGGREGATES.get():
+                aggregate.add(stage, seconds)
+            CRAWLER_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def aggregate(self, name):
+        if not self.enabled:
+            return _NULL
+        return self._aggregate(name)
+
+    @contextmanager
+    def _aggregate(self, name):
+        aggregate = Aggregate(name)
+        token = _AGGREGATES.set(_AGGREGATES.get() + (aggregate,))
+        try:
+            yield aggregate
+        finally:
+            _AGGREGATES.reset(token)
+            aggregate.wall = time.perf_counter() - aggregate.start
+            self.reports.append(aggregate.to_json())
+            print(aggregate)
+
+    async def dump_stacks(self):
+        """把采样的调用栈写入output_dir/crawler-<时间>.folded，可以作为Scheduler任务定期执行"""
+        if self.sampler is None:
+            return
+        path = os.path.join(self.output_dir, f"crawler-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        samples = self.sampler.dump(path)
+        print(f"profile: wrote {samples} stack samples to {path}")
+
+
+profiler = Profiler()
+
+
+class ProfiledConnection:
+    """混入sqlite3.Connection，把commit计入sqlite_commit阶段"""
+
+    def commit(self):
+        with profiler.span("sqlite_commit"):
+            return super().commit()
+
+
+def profile_database(database_class):
+    """在instrument_database之后调用，给Database的连接加上commit的span，重复调用不会重复包装"""
+    if getattr(database_class, "_profile_instrumented", False):
+        return
+    database_class._profile_instrumented = True
+    database_class.connection_factory = type("ProfiledConnection", (ProfiledConnection, database_class.connection_factory), {})
@@ -0,0 +1,285 @@
+# RPC返回对象的精简记录类型：一次遍历完成解析，十六进制数字只转换一次，
+# 使用__slots__减少大批量回填时每个对象的内存占用。
+# 安装了msgspec时另有一组字段相同的Struct，由msgspec按类型直接从响应字节解析，不经过中间的dict
+from typing import Any, Generic, List, Optional, TypeVar
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def udt_amount(output_data):
+    """UDT金额为小端u128，直接按小端解析，不再反转bytearray"""
+    if not output_data or output_data == "0x":
+        return 0
+    return int.from_bytes(bytes.fromhex(output_data[2:] if output_data.startswith("0x") else output_data), "little")
+
+
+class Script:
+    __slots__ = ("code_hash", "hash_type", "args")
+
+    def __init__(self, code_hash, hash_type, args):
+        self.code_hash = code_hash
+        self.hash_type = hash_type
+        self.args = args
+
+    @classmethod
+    def from_json(cls, script):
+        if script is None:
+            return None
+        return cls(script["code_hash"], script["hash_type"], script["args"])
+
+    def to_json(self):
+        return {"code_hash": self.code_hash, "hash_type": self.hash_type, "args": self.args}
+
+
+class OutPoint:
+    __slots__ = ("tx_hash", "index")
+
+    def __init__(self, tx_hash, index):
+        self.tx_hash = tx_hash
+        self.index = index
+
+    @classmethod
+    def from_json(cls, out_point):
+        return cls(out_point["tx_hash"], int(out_point["index"], 16))
+
+    def to_json(self):
+        return {"tx_hash": self.tx_hash, "index": hex(self.index)}
+
+
+class CellOutput:
+    __slots__ = ("capacity", "lock", "type", "udt_amount")
+
+    def __init__(self, capacity, lock, type, udt_amount):
+        self.capacity = capacity
+        self.lock = lock
+        self.type = type
+        self.udt_amount = udt_amount
+
+    @classmethod
+    def from_json(cls, output, output_data):
+        type_script = Script.from_json(output["type"])
+        return cls(
+            int(output["capacity"], 16),
+            Script.from_json(output["lock"]),
+            type_script,
+            udt_amount(output_data) if type_script is not None else 0,
+        )
+
+
+class Transaction:
+    __slots__ = ("hash", "inputs", "outputs", "witnesses", "status", "block_hash", "block_number")
+
+    def __init__(self, hash, inputs, outputs, witnesses, status, block_hash, block_number):
+        self.hash = hash
+        self.inputs = inputs
+        self.outputs = outputs
+        self.witnesses = witnesses
+        self.status = status
+        self.block_hash = block_hash
+        self.block_number = block_number
+
+    @classmethod
+    def from_json(cls, resp):
+        """解析get_transaction的返回值"""
+        tx = resp["transaction"]
+        tx_status = resp.get("tx_status") or {}
+        block_number = tx_status.get("block_number")
+        return cls(
+            tx.get("hash"),
+            [OutPoint.from_json(i["previous_output"]) for i in tx["inputs"]],
+            [CellOutput.from_json(o, d) for o, d in zip(tx["outputs"], tx["outputs_data"])],
+            tx["witnesses"],
+            tx_status.get("status"),
+            tx_status.get("block_hash"),
+            int(block_number, 16) if block_number else None,
+        )
+
+
+class IndexerTx:
+    """get_transactions返回的单个对象（未按交易分组）"""
+    __slots__ = ("tx_hash", "block_number", "tx_index", "io_type", "io_index")
+
+    def __init__(self, tx_hash, block_number, tx_index, io_type, io_index):
+        self.tx_hash = tx_hash
+        self.block_number = block_number
+        self.tx_index = tx_index
+        self.io_type = io_type
+        self.io_index = io_index
+
+    @classmethod
+    def from_json(cls, obj):
+        return cls(obj["tx_hash"], int(obj["block_number"], 16), int(obj["tx_index"], 16), obj["io_type"], int(obj["io_index"], 16))
+
+
+class IndexerCell:
+    """get_cells返回的单个cell"""
+    __slots__ = ("out_point", "block_number", "output")
+
+    def __init__(self, out_point, block_number, output):
+        self.out_point = out_point
+        self.block_number = block_number
+        self.output = output
+
+    @classmethod
+    def from_json(cls, obj):
+        return cls(OutPoint.from_json(obj["out_point"]), int(obj["block_number"], 16), CellOutput.from_json(obj["output"], obj.get("output_data")))
+
+
+class Page:
+    """get_transactions/get_cells的一页结果，objects已解析为记录类型"""
+    __slots__ = ("objects", "last_cursor")
+
+    def __init__(self, objects, last_cursor):
+        self.objects = objects
+        self.last_cursor = last_cursor
+
+    @classmethod
+    def schema(cls, item_class):
+        """返回把一页RPC结果解析为Page的函数，作为AsyncRPCClient.call的schema参数"""
+        from_json = item_class.from_json
+
+        def decode(result):
+            return cls([from_json(obj) for obj in result["objects"]], result.get("last_cursor"))
+        return decode
+
+
+class Schema:
+    """AsyncRPCClient.call的schema参数
+
+    from_json把codec解析出的result（dict）转换为记录；typed_type为msgspec Struct类型时，
+    codec为msgspec的客户端用decode_response按该类型直接解析整个响应，
+    from_typed再把解析结果整理为记录（None表示解析结果就是记录）
+    """
+
+    def __init__(self, from_json, typed_type=None, from_typed=None):
+        self.from_json = from_json
+        self.typed_type = typed_type
+        self.from_typed = from_typed
+        self.decoder = None
+
+    def __call__(self, result):
+        return self.from_json(result)
+
+    def decode_response(self, raw):
+        """按typed_type解析响应字节，返回 (记录, error)"""
+        if self.decoder is None:
+            self.decoder = msgspec.json.Decoder(ResponseStruct[self.typed_type])
+        response = self.decoder.decode(raw)
+        result = response.result
+        if result is not None and self.from_typed is not None:
+            result = self.from_typed(result)
+        return result, response.error
+
+
+if msgspec is not None:
+    T = TypeVar("T")
+
+    # 十六进制数字按str解析，在__post_init__中转换为int，仍在msgspec的同一次解析中完成
+
+    class ScriptStruct(msgspec.Struct):
+        code_hash: str
+        hash_type: str
+        args: str
+
+        def to_json(self):
+            return {"code_hash": self.code_hash, "hash_type": self.hash_type, "args": self.args}
+
+    class OutPointStruct(msgspec.Struct):
+        tx_hash: str
+        index: str
+
+        def __post_init__(self):
+            self.index = int(self.index, 16)
+
+        def to_json(self):
+            return {"tx_hash": self.tx_hash, "index": hex(self.index)}
+
+    class CellOutputStruct(msgspec.Struct):
+        capacity: str
+        lock: ScriptStruct
+        type: Optional[ScriptStruct] = None
+        # 响应中没有该字段，由包含output_data的上层对象填写
+        udt_amount: int = 0
+
+        def __post_init__(self):
+            self.capacity = int(self.capacity, 16)
+
+    class IndexerTxStruct(msgspec.Struct):
+        tx_hash: str
+        block_number: str
+        tx_index: str
+        io_type: str
+        io_index: str
+
+        def __post_init__(self):
+            self.block_number = int(self.block_number, 16)
+            self.tx_index = int(self.tx_index, 16)
+            self.io_index = int(self.io_index, 16)
+
+    class IndexerCellStruct(msgspec.Struct):
+        out_point: OutPointStruct
+        block_number: str
+        output: CellOutputStruct
+        output_data: Optional[str] = None
+
+        def __post_init__(self):
+            self.block_number = int(self.block_number, 16)
+            if self.output.type is not None:
+                self.output.udt_amount = udt_amount(self.output_data)
+
+    class InputStruct(msgspec.Struct):
+        previous_output: OutPointStruct
+
+    class TransactionViewStruct(msgspec.Struct):
+        inputs: List[InputStruct]
+        outputs: List[CellOutputStruct]
+        outputs_data: List[str]
+        witnesses: List[str]
+        hash: Optional[str] = None
+
+        def __post_init__(self):
+            for output, output_data in zip(self.outputs, self.outputs_data):
+                if output.type is not None:
+                    output.udt_amount = udt_amount(output_data)
+
+    class TxStatusStruct(msgspec.Struct):
+        status: Optional[str] = None
+        block_hash: Optional[str] = None
+        block_number: Optional[str] = None
+
+    class TransactionStruct(msgspec.Struct):
+        transaction: TransactionViewStruct
+        tx_status: Optional[TxStatusStruct] = None
+
+    class PageStruct(msgspec.Struct, Generic[T]):
+        objects: List[T]
+        last_cursor: Optional[str] = None
+
+    class ResponseStruct(msgspec.Struct, Generic[T]):
+        result: Optional[T] = None
+        error: Optional[Any] = None
+
+    def _transaction_from_typed(resp):
+        """只整理外层结构，inputs/outputs已经是解析好的记录"""
+        tx = resp.transaction
+        tx_status = resp.tx_status or TxStatusStruct()
+        return Transaction(
+            tx.hash,
+            [i.previous_output for i in tx.inputs],
+            tx.outputs,
+            tx.witnesses,
+            tx_status.status,
+            tx_status.block_hash,
+            int(tx_status.block_number, 16) if tx_status.block_number else None,
+        )
+
+    TX_PAGE = Schema(Page.schema(IndexerTx), PageStruct[IndexerTxStruct])
+    CELL_PAGE = Schema(Page.schema(IndexerCell), PageStruct[IndexerCellStruct])
+    TRANSACTION = Schema(Transaction.from_json, TransactionStruct, _transaction_from_typed)
+else:
+    TX_PAGE = Schema(Page.schema(IndexerTx))
+    CELL_PAGE = Schema(Page.schema(IndexerCell))
+    TRANSACTION = Schema(Transaction.from_json)
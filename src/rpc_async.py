@@ -1,16 +1,121 @@
 import asyncio
-import json
+import collections
 import logging
+import random
+import time
 from typing import Union
 
 import aiohttp
 
+from src.const import JSON_CODEC
+from src.json_codec import get_codec
+from src.profiling import profiler
+from src.records import CELL_PAGE, TRANSACTION, TX_PAGE, udt_amount
+from src.rpc_pool import INDEXER_METHODS, EndpointPool
+from src.rpc_record import ReplayMissError, request_key
+
 LOGGER = logging.getLogger(__name__)
 
+# 每个方法单次请求的超时（秒），indexer扫描一次返回0xffff条，需要更长时间
+DEFAULT_TIMEOUT = 30
+METHOD_TIMEOUTS = {
+    "get_tip_block_number": 5,
+    "get_indexer_tip": 5,
+    "get_block_hash": 10,
+    "get_header": 10,
+    "get_header_by_number": 10,
+    "get_block_median_time": 10,
+    "get_live_cell": 10,
+    "get_current_epoch": 10,
+    "get_epoch_by_number": 10,
+    "get_transaction": 20,
+    "get_transactions": 120,
+    "get_cells": 120,
+    "get_cells_capacity": 60,
+}
+# 可以安全重复发送的只读方法，允许对冲请求
+IDEMPOTENT_METHODS = set(METHOD_TIMEOUTS) | {"get_block", "get_block_by_number", "get_blockchain_info", "get_consensus", "local_node_info", "tx_pool_info", "get_fee_rate_statics"}
+# 对冲请求：等待max(HEDGE_MIN_DELAY, 节点EWMA延迟 x HEDGE_LATENCY_FACTOR)后向第二个节点再发一份
+HEDGE_MIN_DELAY = 0.2
+HEDGE_LATENCY_FACTOR = 3
+# 退避：第i次重试等待BACKOFF_MIN加上[0, min(BACKOFF_MAX, BACKOFF_BASE * 2^i)]之间的随机时间，
+# BACKOFF_MIN保证总的重试时间不短于原来每次固定等待2秒
+BACKOFF_MIN = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20
+# 所有节点都处于熔断状态（例如半开试探还没有返回）时，两次检查之间至少等待的秒数
+CIRCUIT_WAIT_MIN = 0.1
+RETRY_AFTER_MAX = 60
+
+
+def is_typed_decode(codec, schema):
+    """codec为msgspec且schema有typed_type时，按类型直接从响应字节解析记录"""
+    return schema is not None and schema.typed_type is not None and codec.name == "msgspec"
+
+
+def decode_response(codec, raw, schema=None):
+    """解析JSON-RPC响应字节，返回 (result, error)
+
+    schema不为空时result为记录类型：is_typed_decode时不生成中间的dict，否则先解析为dict再用schema转换
+    """
+    if is_typed_decode(codec, schema):
+        with profiler.span("record_decode"):
+            return schema.decode_response(raw)
+    with profiler.span("json_decode"):
+        resp_json = codec.loads(raw)
+    result = resp_json.get("result", None)
+    if schema is not None and result is not None:
+        with profiler.span("record_decode"):
+            result = schema(result)
+    return result, resp_json.get("error", None)
+
+
+def _is_retryable(e):
+    """HTTP 429和5xx、连接错误和超时可以重试，其他HTTP错误直接失败"""
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return True
+
+
+def _retry_after(e):
+    if not isinstance(e, aiohttp.ClientResponseError) or not e.headers:
+        return None
+    value = e.headers.get("Retry-After")
+    try:
+        return min(float(value), RETRY_AFTER_MAX) if value is not None else None
+    except ValueError:
+        # HTTP-date格式的Retry-After不常见，按普通退避处理
+        return None
+
+
+def _backoff_delay(attempt, e):
+    delay = BACKOFF_MIN + random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    retry_after = _retry_after(e)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
 
 class AsyncRPCClient:
+    # 可选的回调对象，需要实现 on_request(method, seconds)、on_retry(method)、on_error(method)、on_hedge(method)、on_coalesce(method)
+    observer = None
+    # 请求和响应的JSON编解码，默认使用已安装的最快实现
+    codec = get_codec(JSON_CODEC)
+    # 配置了多个节点时，对慢的幂等读请求发送对冲请求
+    hedge = True
+
     def __init__(self, url):
-        self.url = url
+        """url可以是单个地址，也可以是多个节点地址的列表"""
+        self.pool = EndpointPool(url)
+        self.url = self.pool.endpoints[0].url
+        # 正在进行中的只读请求，(method, 请求体) -> Task
+        self.inflight = {}
+        # 每个方法被合并到已有请求上的调用次数
+        self.coalesced = collections.Counter()
+        # 可选的全局请求额度（见scheduler.RPCBudget），需要实现 acquire() 和 release()
+        self.budget = None
+        # 可选的录制/回放存储（见rpc_record.RPCRecordStore），只对只读请求生效
+        self.store = None
         connector = aiohttp.TCPConnector(ssl=False)
         self.session = aiohttp.ClientSession(connector=connector)
 
@@ -41,7 +146,14 @@ class AsyncRPCClient:
     async def get_fork_block(self, block_hash, verbosity):
         return await self.call("get_fork_block", [block_hash, verbosity])
 
-    async def get_header_by_number(self, block_number, verbosity):
+    async def get_header(self, block_hash, verbosity=None):
+        if verbosity is None:
+            return await self.call("get_header", [block_hash])
+        return await self.call("get_header", [block_hash, verbosity])
+
+    async def get_header_by_number(self, block_number, verbosity=None):
+        if verbosity is None:
+            return await self.call("get_header_by_number", [block_number])
         return await self.call("get_header_by_number", [block_number, verbosity])
 
     async def get_indexer_tip(self):
@@ -103,8 +215,8 @@ class AsyncRPCClient:
     async def get_blockchain_info(self):
         return await self.call("get_blockchain_info", [])
 
-    async def get_cells(self, search_key, order, limit, after):
-        return await self.call("get_cells", [search_key, order, limit, after])
+    async def get_cells(self, search_key, order, limit, after, schema=None):
+        return await self.call("get_cells", [search_key, order, limit, after], schema=schema)
 
     async def get_block_template(self, bytes_limit=None, proposals_limit=None, max_version=None):
         return await self.call("get_block_template", [])
@@ -133,13 +245,13 @@ class AsyncRPCClient:
     async def verify_transaction_proof(self, tx_proof):
         return await self.call("verify_transaction_proof", [tx_proof])
 
-    async def get_transaction(self, tx_hash, verbosity=None, only_committed=None):
+    async def get_transaction(self, tx_hash, verbosity=None, only_committed=None, schema=None):
         if verbosity is None and only_committed is None:
-            return await self.call("get_transaction", [tx_hash])
-        return await self.call("get_transaction", [tx_hash, verbosity, only_committed])
+            return await self.call("get_transaction", [tx_hash], schema=schema)
+        return await self.call("get_transaction", [tx_hash, verbosity, only_committed], schema=schema)
 
-    async def get_transactions(self, search_key, order, limit, after):
-        return await self.call("get_transactions", [search_key, order, limit, after])
+    async def get_transactions(self, search_key, order, limit, after, schema=None):
+        return await self.call("get_transactions", [search_key, order, limit, after], schema=schema)
 
     async def dry_run_transaction(self, tx):
         return await self.call("dry_run_transaction", [tx])
@@ -194,104 +306,217 @@ class AsyncRPCClient:
     async def test_tx_pool_accept(self, tx, outputs_validator):
         return await self.call("test_tx_pool_accept", [tx, outputs_validator])
 
-    async def call(self, method, params, try_count=5):
+    async def _post(self, url, body, headers, timeout=DEFAULT_TIMEOUT):
+        async with self.session.post(url, data=body, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def _fetch_indexer_tip(self, endpoint):
+        """直接向指定节点查询indexer tip，用于多节点时判断indexer是否追上"""
+        body = self.codec.dumps({"id": 42, "jsonrpc": "2.0", "method": "get_indexer_tip", "params": []})
+        resp_json = self.codec.loads(await self._post(endpoint.url, body, {"content-type": "application/json"}, timeout=METHOD_TIMEOUTS["get_indexer_tip"]))
+        return int(resp_json["result"]["block_number"], 16)
+
+    async def _send(self, endpoint, method, body, headers, failed):
+        """向指定节点发送一次请求，并记录该节点的延迟或失败"""
+        observer = self.observer
+        budget = self.budget
+        if budget is not None:
+            with profiler.span("rpc_budget_wait"):
+                await budget.acquire()
+        start = time.perf_counter()
+        endpoint.inflight += 1
+        try:
+            with profiler.span("rpc_request"):
+                raw = await self._post(endpoint.url, body, headers, METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT))
+        except asyncio.CancelledError:
+            # 对冲请求中较慢的一个被取消，不算节点失败
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if _is_retryable(e):
+                self.pool.record_failure(endpoint)
+                failed.append(endpoint)
+            if observer:
+                observer.on_request(method, time.perf_counter() - start)
+            raise
+        finally:
+            endpoint.inflight -= 1
+            if budget is not None:
+                budget.release()
+        elapsed = time.perf_counter() - start
+        self.pool.record_success(endpoint, elapsed)
+        if observer:
+            observer.on_request(method, elapsed)
+        return raw
+
+    def _hedge_delay(self, method, endpoint):
+        """幂等的读请求超过该时间未返回时，向另一个节点再发一份；返回None表示不对冲"""
+        if not self.hedge or method not in IDEMPOTENT_METHODS or len(self.pool.endpoints) < 2:
+            return None
+        latency = endpoint.latency if endpoint.latency is not None else HEDGE_MIN_DELAY
+        return max(HEDGE_MIN_DELAY, HEDGE_LATENCY_FACTOR * latency)
+
+    async def _request(self, method, body, headers, failed):
+        """发送一次请求（可能带一个对冲请求），返回最先成功的响应"""
+        endpoint = self.pool.select(method, exclude=failed)
+        delay = self._hedge_delay(method, endpoint)
+        if delay is None:
+            return await self._send(endpoint, method, body, headers, failed)
+        pending = {asyncio.ensure_future(self._send(endpoint, method, body, headers, failed))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                secondary = self.pool.select(method, exclude=failed + [endpoint])
+                if secondary is not None and secondary is not endpoint:
+                    if self.observer:
+                        self.observer.on_hedge(method)
+                    pending.add(asyncio.ensure_future(self._send(secondary, method, body, headers, failed)))
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, method, params, try_count=5, schema=None):
+        """schema不为空时，用它把result解析为记录类型（见records.Schema、records.TX_PAGE等），
+        解析方式见decode_response
+
+        同一时刻method、params和schema都相同的只读请求只发送一次，其余调用等待同一个结果
+        （single-flight）。共享的result不能被调用方修改。
+        """
+        body = self.codec.dumps({"id": 42, "jsonrpc": "2.0", "method": method, "params": params})
+        record_key = request_key(method, params) if self.store is not None and method in IDEMPOTENT_METHODS else None
+        if method in IDEMPOTENT_METHODS:
+            key = (method, body, schema)
+            task = self.inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._call(method, body, try_count, record_key, params, schema))
+                self.inflight[key] = task
+                task.add_done_callback(lambda t: self._inflight_done(key, t))
+            else:
+                self.coalesced[method] += 1
+                if self.observer:
+                    self.observer.on_coalesce(method)
+            # 某个调用方被取消时不影响其他等待同一请求的调用方
+            return await asyncio.shield(task)
+        return await self._call(method, body, try_count, schema=schema)
+
+    def _inflight_done(self, key, task):
+        self.inflight.pop(key, None)
+        # 所有调用方都已取消时，避免"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
+
+    def _decode(self, method, raw, schema=None):
+        result, error = decode_response(self.codec, raw, schema)
+        if error is not None:
+            if self.observer:
+                self.observer.on_error(method)
+            error_message = error.get("message", "Unknown error")
+            raise Exception(f"Error: {error_message}")
+        return result
+
+    async def _call(self, method, body, try_count=5, record_key=None, params=None, schema=None):
+        """连接错误、超时、HTTP 429和5xx会重试：还有没试过的节点时立即换节点，
+        否则按指数退避加随机抖动等待（有Retry-After时至少等待该时间）。
+        所有节点都处于熔断状态时等到最早的节点可以重新尝试，不计入重试次数。
+
+        设置了store时，record模式把params和成功响应的原始内容写入store；replay模式只从store读取，
+        不访问节点，没有记录时抛出ReplayMissError。
+
+        schema不为空时返回解析后的记录而不是dict。
+        """
+        store = self.store
+        if store is not None and store.replay:
+            raw = store.get(record_key) if record_key is not None else None
+            if raw is None:
+                raise ReplayMissError(f"no recorded response for {method}: {body.decode()[:200]}")
+            return self._decode(method, raw, schema)
         headers = {"content-type": "application/json"}
-        data = {"id": 42, "jsonrpc": "2.0", "method": method, "params": params}
-        LOGGER.debug(f"request:url:{self.url},data:\n{json.dumps(data)}")
+        observer = self.observer
+        # 0xffff条的分页结果很大，只有开启debug时才输出请求和响应内容
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOGGER.debug(f"request:method:{method},data:\n{body.decode()}")
+        if method in INDEXER_METHODS and self.pool.indexer_tips_stale():
+            await self.pool.refresh_indexer_tips(self._fetch_indexer_tip)
+        failed = []
         for i in range(try_count):
+            while not self.pool.available(method):
+                await asyncio.sleep(max(self.pool.retry_delay(self.pool.endpoints), CIRCUIT_WAIT_MIN))
             try:
-                async with self.session.post(self.url, data=json.dumps(data), headers=headers, timeout=30) as response:
-                    response.raise_for_status()
-                    resp_json = await response.json()
-                    LOGGER.debug(f"response:\n{json.dumps(resp_json)}")
-                    if "error" in resp_json:
-                        error_message = resp_json["error"].get("message", "Unknown error")
-                        raise Exception(f"Error: {error_message}")
-                    return resp_json.get("result", None)
-            except aiohttp.ClientError as e:
-                print(f"e:{e}")
+                raw = await self._request(method, body, headers, failed)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not _is_retryable(e) or i == try_count - 1:
+                    if observer:
+                        observer.on_error(method)
+                    raise
+                if observer:
+                    observer.on_retry(method)
+                print(f"e:{method}:{e}")
                 LOGGER.info(e)
-                LOGGER.debug("request too quickly, wait 2s")
-                await asyncio.sleep(2)
+                # 还有其他节点没试过时立即换节点重试，都失败过才退避等待
+                if len(failed) >= len(self.pool.endpoints):
+                    failed = []
+                    await asyncio.sleep(_backoff_delay(i, e))
                 continue
-            except Exception as e:
-                LOGGER.error("Exception:", exc_info=e)
-                raise e
-        raise Exception("request time out")
+            if debug:
+                LOGGER.debug(f"response:\n{raw.decode()}")
+            result = self._decode(method, raw, schema)
+            # 错误响应在_decode中抛出，不会被录制
+            if record_key is not None:
+                store.put(record_key, method, params, raw)
+            return result
+
+
+def _cell_message(output):
+    cell = {"args": output.lock.args, "capacity": output.capacity}
+    if output.type is not None:
+        cell["udt_args"] = output.type.args
+        cell["udt_capacity"] = output.udt_amount
+    return cell
 
 
 async def get_tx_message(ckbClient, tx_hash):
-    tx = await ckbClient.get_transaction(tx_hash)
+    tx = await ckbClient.get_transaction(tx_hash, schema=TRANSACTION)
     input_cells = []
     output_cells = []
-    # self.node.getClient().get_transaction(tx['transaction']['inputs'][])
-    for i in range(len(tx["transaction"]["inputs"])):
-        pre_cell = (await ckbClient.get_transaction(
-            tx["transaction"]["inputs"][i]["previous_output"]["tx_hash"]
-        ))["transaction"]["outputs"][
-            int(tx["transaction"]["inputs"][i]["previous_output"]["index"], 16)
-        ]
-        pre_cell_outputs_data = (await ckbClient.get_transaction(
-            tx["transaction"]["inputs"][i]["previous_output"]["tx_hash"]
-        ))["transaction"]["outputs_data"][
-            int(tx["transaction"]["inputs"][i]["previous_output"]["index"], 16)
-        ]
-        if pre_cell["type"] is None:
-            input_cells.append(
-                {
-                    "args": pre_cell["lock"]["args"],
-                    "capacity": int(pre_cell["capacity"], 16),
-                }
-            )
-            continue
-        input_cells.append(
-            {
-                "args": pre_cell["lock"]["args"],
-                "capacity": int(pre_cell["capacity"], 16),
-                "udt_args": pre_cell["type"]["args"],
-                "udt_capacity": to_int_from_big_uint128_le(pre_cell_outputs_data),
-            }
-        )
-
-    for i in range(len(tx["transaction"]["outputs"])):
-        if tx["transaction"]["outputs"][i]["type"] is None:
-            output_cells.append(
-                {
-                    "args": tx["transaction"]["outputs"][i]["lock"]["args"],
-                    "capacity": int(
-                        tx["transaction"]["outputs"][i]["capacity"], 16
-                    ),
-                }
-            )
-            continue
-        output_cells.append(
-            {
-                "args": tx["transaction"]["outputs"][i]["lock"]["args"],
-                "capacity": int(tx["transaction"]["outputs"][i]["capacity"], 16),
-                "udt_args": tx["transaction"]["outputs"][i]["type"]["args"],
-                "udt_capacity": to_int_from_big_uint128_le(
-                    tx["transaction"]["outputs_data"][i]
-                ),
-            }
-        )
-    # print({"input_cells": input_cells, "output_cells": output_cells})
-    input_cap = 0
-    for i in range(len(input_cells)):
-        input_cap = input_cap + input_cells[i]["capacity"]
-    for i in range(len(output_cells)):
-        input_cap = input_cap - output_cells[i]["capacity"]
+    ckb_fee = 0
     udt_fee = 0
-    for i in range(len(input_cells)):
-        if 'udt_args' in input_cells[i]:
-            udt_fee = udt_fee + input_cells[i]['udt_capacity']
-    for i in range(len(output_cells)):
-        if 'udt_args' in output_cells[i]:
-            udt_fee = udt_fee - output_cells[i]['udt_capacity']
+    # 同一笔前序交易只请求一次
+    pre_txs = {}
+    for out_point in tx.inputs:
+        pre_tx = pre_txs.get(out_point.tx_hash)
+        if pre_tx is None:
+            pre_tx = await ckbClient.get_transaction(out_point.tx_hash, schema=TRANSACTION)
+            pre_txs[out_point.tx_hash] = pre_tx
+        pre_cell = pre_tx.outputs[out_point.index]
+        cell = _cell_message(pre_cell)
+        cell["lock"] = pre_cell.lock.to_json()
+        cell["out_point"] = out_point.to_json()
+        input_cells.append(cell)
+        ckb_fee += pre_cell.capacity
+        udt_fee += pre_cell.udt_amount
+
+    for output in tx.outputs:
+        output_cells.append(_cell_message(output))
+        ckb_fee -= output.capacity
+        udt_fee -= output.udt_amount
+
     return {
         "input_cells": input_cells,
         "output_cells": output_cells,
-        "ckb_fee": input_cap,
-        'udt_fee':udt_fee
+        "ckb_fee": ckb_fee,
+        'udt_fee':udt_fee,
+        "block_hash": tx.block_hash,
+        "witnesses": tx.witnesses,
     }
 
 
@@ -335,12 +560,7 @@ async def get_udt_balance(client, script, udt):
 
 
 def to_int_from_big_uint128_le(hex_str):
-    if hex_str.startswith("0x"):
-        hex_str = hex_str[2:]
-    buf = bytearray.fromhex(hex_str)
-    buf.reverse()
-    result = int.from_bytes(buf, byteorder="big")
-    return result
+    return udt_amount(hex_str)
 
 
 async def main():
@@ -370,11 +590,9 @@ async def get_transactions(rpcClient,lock_script_code_hash, begin_number,end_num
         "asc",
         "0xffff",
         None,
+        schema=TX_PAGE,
     )
-    # for tx in txs["objects"]:
-    #     print(tx)
-    # Mock response
-    return txs['objects']
+    return txs.objects
 
 async def get_cells(rpcClient,lock_script_code_hash, begin_number,end_number):
     # This is a mock implementation. In a real scenario, you would make an RPC call
@@ -395,9 +613,10 @@ async def get_cells(rpcClient,lock_script_code_hash, begin_number,end_number):
         "asc",
         "0xffff",
         None,
+        schema=CELL_PAGE,
     )
-    print(f"get cells len:{len(cells['objects'])}")
-    return cells['objects']
+    print(f"get cells len:{len(cells.objects)}")
+    return cells.objects
 
 async def get_ln_cell_linked_hashs(ckbClient,tx_hash):
     tx = await ckbClient.get_transaction(tx_hash)
@@ -419,5 +638,26 @@ async def get_ln_cell_linked_hashs(ckbClient,tx_hash):
         return txs["objects"][0]["tx_hash"], txs["objects"][1]["tx_hash"]
     return None, None
 
+async def get_ln_cell_death_hash(ckbClient, tx_hash):
+    """查询tx_hash第0个output被哪笔交易消费，返回(消费交易hash, 该cell的lock code_hash)"""
+    tx = await ckbClient.get_transaction(tx_hash)
+    # 节点不认识的交易返回 {"transaction": null, ...}
+    if tx is None or tx["transaction"] is None:
+        return None, None
+    cellLock = tx["transaction"]["outputs"][0]["lock"]
+    txs = await ckbClient.get_transactions(
+        {
+            "script": cellLock,
+            "script_type": "lock",
+            "script_search_mode": "exact",
+        },
+        "asc",
+        "0xff",
+        None,
+    )
+    if len(txs["objects"]) == 2:
+        return txs["objects"][1]["tx_hash"], cellLock["code_hash"]
+    return None, None
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
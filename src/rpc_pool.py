@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+
+# 依赖indexer的方法，只发给indexer已经追上的节点
+INDEXER_METHODS = {
+    "get_transactions",
+    "get_cells",
+    "get_cells_capacity",
+    "get_indexer_tip",
+}
+# 延迟和错误率的EWMA系数
+EWMA_ALPHA = 0.2
+# 连续失败达到该次数后暂时剔除节点；最后一个健康的节点不会被剔除
+EJECT_AFTER_FAILURES = 3
+EJECT_SECONDS = 5
+MAX_EJECT_SECONDS = 300
+# indexer tip落后最高tip超过该区块数的节点不接收indexer请求
+INDEXER_MAX_LAG = 2
+INDEXER_TIP_INTERVAL = 30
+
+
+class Endpoint:
+    """单个RPC节点的健康状态"""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.failures = 0
+        self.ejected_until = 0
+        self.eject_seconds = EJECT_SECONDS
+        # 剔除到期后进入半开状态，只放行一个试探请求，成功后恢复
+        self.half_open = False
+        self.indexer_tip = None
+
+    def available(self, now):
+        if self.ejected_until > now:
+            return False
+        return not (self.half_open and self.inflight > 0)
+
+    def healthy(self, now):
+        """没有被剔除，也不在半开试探中"""
+        return self.ejected_until <= now and not self.half_open
+
+    def score(self):
+        """越小越好：延迟乘以排队请求数，错误率高的节点成倍降权"""
+        latency = self.latency if self.latency is not None else 0.1
+        return latency * (self.inflight + 1) * (1 + 10 * self.error_rate)
+
+    def to_json(self):
+        return {
+            "url": self.url,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "inflight": self.inflight,
+            "ejected": self.ejected_until > time.monotonic(),
+            "indexer_tip": self.indexer_tip,
+        }
+
+
+class EndpointPool:
+    """多个RPC节点：按EWMA延迟和错误率选择节点
+
+    每个节点相当于一个熔断器：连续失败后剔除（打开），剔除期间不再发送请求；
+    到期后半开，放行一个试探请求，成功则恢复，失败则再次剔除且剔除时间加倍。
+    其他节点都已剔除或在半开试探中时，不剔除最后一个健康的节点，请求继续按退避重试，
+    因此只配置了一个节点时熔断器不会打开。
+    """
+
+    def __init__(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.indexer_tip_time = 0
+        self.indexer_refresh = None
+
+    def _candidates(self, method, exclude=()):
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.available(now) and e not in exclude]
+        if method in INDEXER_METHODS:
+            tips = [e.indexer_tip for e in self.endpoints if e.indexer_tip is not None]
+            if tips:
+                max_tip = max(tips)
+                synced = [e for e in healthy if e.indexer_tip is not None and e.indexer_tip >= max_tip - INDEXER_MAX_LAG]
+                healthy = synced or healthy
+        return healthy
+
+    def available(self, method):
+        """是否还有可以接收请求的节点，全部熔断时调用方等待retry_delay后再试"""
+        return bool(self._candidates(method))
+
+    def select(self, method, exclude=()):
+        """优先选择exclude之外的节点，没有可用节点时返回None"""
+        candidates = self._candidates(method, exclude) or self._candidates(method)
+        if not candidates:
+            return None
+        best = min(e.score() for e in candidates)
+        # 分数相同的节点随机选择，把负载分散到多个节点
+        return random.choice([e for e in candidates if e.score() == best])
+
+    def retry_delay(self, endpoints):
+        """距离最早一个节点可以重新尝试还需要的秒数"""
+        return max(0, min(e.ejected_until for e in endpoints) - time.monotonic())
+
+    def record_success(self, endpoint, seconds):
+        endpoint.latency = seconds if endpoint.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * endpoint.latency
+        endpoint.error_rate = (1 - EWMA_ALPHA) * endpoint.error_rate
+        endpoint.failures = 0
+        endpoint.ejected_until = 0
+        endpoint.eject_seconds = EJECT_SECONDS
+        endpoint.half_open = False
+
+    def record_failure(self, endpoint):
+        endpoint.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * endpoint.error_rate
+        endpoint.failures += 1
+        now = time.monotonic()
+        if not any(e.healthy(now) for e in self.endpoints if e is not endpoint):
+            return
+        if endpoint.failures >= EJECT_AFTER_FAILURES or endpoint.half_open:
+            endpoint.ejected_until = now + endpoint.eject_seconds
+            endpoint.eject_seconds = min(endpoint.eject_seconds * 2, MAX_EJECT_SECONDS)
+            endpoint.failures = 0
+            endpoint.half_open = True
+
+    def indexer_tips_stale(self):
+        return len(self.endpoints) > 1 and time.monotonic() - self.indexer_tip_time > INDEXER_TIP_INTERVAL
+
+    async def refresh_indexer_tips(self, fetch_tip):
+        """向所有节点（包括已剔除的）查询indexer tip，成功的节点恢复接收请求；
+        fetch_tip(endpoint)返回该节点的indexer tip区块号。同一时间只有一个刷新在进行"""
+        if self.indexer_refresh is None:
+            self.indexer_refresh = asyncio.ensure_future(self._refresh_indexer_tips(fetch_tip))
+        try:
+            await asyncio.shield(self.indexer_refresh)
+        finally:
+            if self.indexer_refresh is not None and self.indexer_refresh.done():
+                self.indexer_refresh = None
+
+    async def _refresh_indexer_tips(self, fetch_tip):
+        async def probe(endpoint):
+            start = time.perf_counter()
+            try:
+                endpoint.indexer_tip = await fetch_tip(endpoint)
+                self.record_success(endpoint, time.perf_counter() - start)
+            except Exception:
+                endpoint.indexer_tip = None
+                self.record_failure(endpoint)
+
+        await asyncio.gather(*[probe(e) for e in self.endpoints])
+        self.indexer_tip_time = time.monotonic()
@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from src.const import RPC_URL, RPC_CACHE_DB, RPC_CONFIRMATION_DEPTH
+
+# 允许通过 /rpc 转发的只读方法
+ALLOWED_METHODS = {
+    "get_tip_block_number",
+    "get_tip_header",
+    "get_transaction",
+    "get_header",
+    "get_header_by_number",
+    "get_block_hash",
+    "get_transactions",
+    "get_cells",
+    "get_live_cell",
+}
+
+# get_transactions/get_cells只允许按完整script精确查询，每页最多INDEXER_MAX_LIMIT条，
+# 避免 /rpc 被用来向节点转发大范围的indexer扫描
+INDEXER_QUERY_METHODS = {"get_transactions", "get_cells"}
+INDEXER_MAX_LIMIT = 0xff
+
+# tip缓存时间（秒），判断是否达到确认深度时使用
+TIP_CACHE_SECONDS = 5
+
+
+class RPCError(Exception):
+    """节点返回的JSON-RPC错误，原样返回给调用方"""
+
+    def __init__(self, error):
+        super().__init__(error.get("message", "Unknown error"))
+        self.error = error
+
+
+class RPCCache:
+    """保存不可变RPC结果的磁盘缓存，多个进程可以共享同一个文件"""
+
+    def __init__(self, db_name=RPC_CACHE_DB):
+        self.db_name = db_name
+        self.local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS rpc_cache (
+                cache_key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """)
+            conn.commit()
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, cache_key):
+        row = self._connection().execute("SELECT result FROM rpc_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, cache_key, result):
+        conn = self._connection()
+        try:
+            conn.execute("INSERT OR REPLACE INTO rpc_cache (cache_key, result) VALUES (?, ?)", (cache_key, result))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing rpc_cache for {cache_key}: {e}")
+
+
+def _check_indexer_params(params):
+    """校验indexer查询参数：search_key必须是exact模式，limit超过INDEXER_MAX_LIMIT时截断，返回转发的params"""
+    invalid = RPCError({"code": -32602, "message": "Invalid params: search_key must use script_search_mode \"exact\" and limit must be a hex number"})
+    if not isinstance(params, list) or len(params) < 3 or not isinstance(params[0], dict):
+        raise invalid
+    search_key = params[0]
+    if search_key.get("script_search_mode") != "exact" or not isinstance(search_key.get("script"), dict):
+        raise invalid
+    try:
+        limit = int(params[2], 16)
+    except (TypeError, ValueError):
+        raise invalid
+    return params[:2] + [hex(min(limit, INDEXER_MAX_LIMIT))] + params[3:]
+
+
+class RPCProxy:
+    """转发浏览器端工具的只读RPC请求，缓存已确认的结果并合并相同的并发请求"""
+
+    def __init__(self, url=RPC_URL, cache=None, confirmation_depth=RPC_CONFIRMATION_DEPTH):
+        self.url = url
+        self.cache = cache or RPCCache()
+        self.confirmation_depth = confirmation_depth
+        self.session = requests.Session()
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.tip = None
+        self.tip_time = 0
+
+    def _forward(self, method, params):
+        data = {"id": 42, "jsonrpc": "2.0", "method": method, "params": params}
+        response = self.session.post(self.url, json=data, timeout=30)
+        response.raise_for_status()
+        resp_json = response.json()
+        if "error" in resp_json:
+            raise RPCError(resp_json["error"])
+        return resp_json.get("result", None)
+
+    def _tip_block_number(self):
+        if self.tip is None or time.time() - self.tip_time > TIP_CACHE_SECONDS:
+            self.tip = int(self._forward("get_tip_block_number", []), 16)
+            self.tip_time = time.time()
+        return self.tip
+
+    def _is_confirmed(self, block_number_hex):
+        if block_number_hex is None:
+            return False
+        return int(block_number_hex, 16) + self.confirmation_depth <= self._tip_block_number()
+
+    def _is_immutable(self, method, params, result):
+        """只有已确认足够深度的交易、区块头和区块hash才会被缓存"""
+        if result is None:
+            return False
+        if method == "get_transaction":
+            tx_status = result.get("tx_status") or {}
+            return tx_status.get("status") == "committed" and self._is_confirmed(tx_status.get("block_number"))
+        if method in ("get_header", "get_header_by_number"):
+            return isinstance(result, dict) and self._is_confirmed(result.get("number"))
+        if method == "get_block_hash":
+            return self._is_confirmed(params[0])
+        return False
+
+    def _call_uncached(self, method, params, cache_key):
+        result = self._forward(method, params)
+        if self._is_immutable(method, params, result):
+            self.cache.set(cache_key, json.dumps(result))
+        return result
+
+    def call(self, method, params):
+        if method not in ALLOWED_METHODS:
+            raise RPCError({"code": -32601, "message": f"Method not allowed: {method}"})
+        if method in INDEXER_QUERY_METHODS:
+            params = _check_indexer_params(params)
+
+        cache_key = f"{method}:{json.dumps(params, sort_keys=True, separators=(',', ':'))}"
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+
+        # 相同的请求正在进行中时等待它的结果，不再重复请求节点
+        with self.inflight_lock:
+            future = self.inflight.get(cache_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.inflight[cache_key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._call_uncached(method, params, cache_key)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                self.inflight.pop(cache_key, None)
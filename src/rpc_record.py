@@ -0,0 +1,183 @@
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import zlib
+
+RECORD = "record"
+REPLAY = "replay"
+MODES = (RECORD, REPLAY)
+# 多个回填进程同时写入时等待写锁的秒数
+BUSY_TIMEOUT = 60
+COMPRESS_LEVEL = 6
+# 写入线程每次最多合并提交的记录数
+WRITE_BATCH = 500
+# 写入线程积压的记录数上限，超过时丢弃新的记录，不阻塞请求
+WRITE_QUEUE_SIZE = 10000
+INSERT_RECORD_SQL = "INSERT OR REPLACE INTO rpc_records (request_hash, method, params, response) VALUES (?, ?, ?, ?)"
+
+
+class ReplayMissError(Exception):
+    """回放模式下存储中没有该请求的记录"""
+
+
+def _compress(data):
+    return zlib.compress(data, COMPRESS_LEVEL)
+
+
+def request_key(method, params):
+    """请求内容的sha256：params按键排序、紧凑格式序列化，与使用哪种JSON codec无关"""
+    return hashlib.sha256(json.dumps([method, params], separators=(",", ":"), sort_keys=True).encode()).digest()
+
+
+class RPCRecordStore:
+    """AsyncRPCClient的请求录制/回放存储
+
+    record模式下每个只读请求的method、params和原始响应（节点返回的字节）按请求内容的hash保存，
+    params和响应用zlib压缩，相同请求再次录制时覆盖为最新的响应；replay模式下只从存储中读取，
+    不访问节点，回放时的解析过程与在线请求完全一致。保存params是为了排查解析问题时可以
+    按method列出、查看录制的请求（entries），request_key变化后也可以重新计算主键（rekey）。
+
+    以请求hash为主键的WITHOUT ROWID表，查找只需一次B树查找；使用WAL，
+    多个回填进程可以同时读写同一个文件。
+
+    put在事件循环中调用，只把记录放入队列，由后台写入线程压缩并分批提交，
+    等待其他进程的写锁不会阻塞事件循环；队列满时丢弃记录。close会等待队列中的记录写完。
+    """
+
+    def __init__(self, db_name, mode=RECORD):
+        if mode not in MODES:
+            raise ValueError(f"invalid rpc record mode: {mode}")
+        self.db_name = db_name
+        self.mode = mode
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.records = 0
+        self.dropped = 0
+        self.queue = queue.Queue(WRITE_QUEUE_SIZE)
+        self.writer = None
+        conn = self._connection()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS rpc_records (
+            request_hash BLOB PRIMARY KEY,
+            method TEXT NOT NULL,
+            params BLOB,
+            response BLOB NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID;
+        """)
+        # 之前的版本没有params列，旧记录的params为NULL
+        if "params" not in {row[1] for row in conn.execute("PRAGMA table_info(rpc_records)")}:
+            conn.execute("ALTER TABLE rpc_records ADD COLUMN params BLOB")
+        conn.commit()
+
+    @property
+    def replay(self):
+        return self.mode == REPLAY
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL模式下NORMAL只在checkpoint时fsync，每条记录单独提交也不会太慢
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """返回录制的原始响应，没有记录时返回None"""
+        row = self._connection().execute("SELECT response FROM rpc_records WHERE request_hash = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, key, method, params, response):
+        """放入写入队列，队列满时丢弃该记录，录制失败不影响正常请求"""
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write_loop, name="rpc-record-writer", daemon=True)
+            self.writer.start()
+        try:
+            self.queue.put_nowait((key, method, params, response))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        conn = self._connection()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    break
+                batch.append(item)
+            try:
+                conn.executemany(INSERT_RECORD_SQL, [
+                    (key, method, _compress(json.dumps(params, separators=(",", ":")).encode()), _compress(response))
+                    for key, method, params, response in batch
+                ])
+                conn.commit()
+                self.records += len(batch)
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"Error recording {len(batch)} rpc responses: {e}")
+            if item is None:
+                break
+        conn.close()
+        self.local.conn = None
+
+    def flush(self):
+        """等待写入线程把队列中的记录提交完并退出，之后的put会重新启动写入线程"""
+        writer = self.writer
+        if writer is not None:
+            self.queue.put(None)
+            writer.join()
+            self.writer = None
+
+    def entries(self, method=None):
+        """按录制时间列出记录，返回 (method, params, 原始响应, timestamp)，旧记录的params为None"""
+        sql = "SELECT method, params, response, timestamp FROM rpc_records"
+        args = ()
+        if method is not None:
+            sql += " WHERE method = ?"
+            args = (method,)
+        for row_method, params, response, timestamp in self._connection().execute(sql + " ORDER BY timestamp", args):
+            yield row_method, None if params is None else json.loads(zlib.decompress(params)), zlib.decompress(response), timestamp
+
+    def rekey(self, key_func=request_key):
+        """按保存的method和params重新计算主键，返回更新的记录数；没有params的旧记录保持不变"""
+        conn = self._connection()
+        rows = conn.execute("SELECT request_hash, method, params FROM rpc_records WHERE params IS NOT NULL").fetchall()
+        updated = 0
+        try:
+            for key, method, params in rows:
+                new_key = key_func(method, json.loads(zlib.decompress(params)))
+                if new_key != key:
+                    conn.execute("UPDATE OR REPLACE rpc_records SET request_hash = ? WHERE request_hash = ?", (new_key, key))
+                    updated += 1
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error rekeying rpc records: {e}")
+            raise
+        return updated
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "records": self.records, "dropped": self.dropped}
+
+    def close(self):
+        self.flush()
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import time
+
+from src.metrics import (RPC_BUDGET_INFLIGHT, RPC_BUDGET_WAIT, SCHEDULER_BACKLOG, SCHEDULER_DURATION, SCHEDULER_LAG,
+                         SCHEDULER_LAST_RUN, SCHEDULER_RUNS)
+from src.profiling import profiler
+
+# 数字越小优先级越高：同步新区块的任务优先，状态检查只使用剩余的RPC额度
+PRIORITY_INGEST = 0
+PRIORITY_MAINTENANCE = 1
+PRIORITY_BACKGROUND = 2
+
+# 启动时各任务第一次执行之间最多错开的秒数
+STARTUP_STAGGER = 5
+
+# 当前任务的优先级，由Scheduler在每个任务的协程中设置，RPCBudget据此排队
+CURRENT_PRIORITY = contextvars.ContextVar("rpc_priority", default=PRIORITY_INGEST)
+
+
+class RPCBudget:
+    """AsyncRPCClient的全局请求额度：每秒请求数（令牌桶）和并发数
+
+    等待中的请求按优先级放行；reserved个并发名额只留给PRIORITY_INGEST，
+    低优先级任务再多也不会占满全部并发。
+    """
+
+    def __init__(self, rate, concurrency, reserved=0, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.concurrency = concurrency
+        self.reserved = min(reserved, concurrency - 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.inflight = 0
+        self.waiters = []
+        self.seq = itertools.count()
+        self.timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _limit(self, priority):
+        return self.concurrency if priority == PRIORITY_INGEST else self.concurrency - self.reserved
+
+    def _can_grant(self, priority):
+        return self.inflight < self._limit(priority) and self.tokens >= 1
+
+    def _grant(self):
+        self.inflight += 1
+        self.tokens -= 1
+        RPC_BUDGET_INFLIGHT.set(self.inflight)
+
+    def _wake(self):
+        self.timer = None
+        self._refill()
+        while self.waiters:
+            priority, _, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            if not self._can_grant(priority):
+                break
+            heapq.heappop(self.waiters)
+            self._grant()
+            future.set_result(None)
+        # 因为令牌不足而等待时，到下一个令牌生成时再检查
+        if self.waiters and self.tokens < 1 and self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._wake)
+
+    async def acquire(self):
+        priority = CURRENT_PRIORITY.get()
+        start = time.perf_counter()
+        self._refill()
+        if not self.waiters and self._can_grant(priority):
+            self._grant()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (priority, next(self.seq), future))
+            self._wake()
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 已经分到名额后才被取消时要归还
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+        RPC_BUDGET_WAIT.observe(time.perf_counter() - start, priority=priority)
+
+    def release(self):
+        self.inflight -= 1
+        RPC_BUDGET_INFLIGHT.set(self.inflight)
+        self._wake()
+
+
+class Job:
+    def __init__(self, name, func, interval, priority, jitter, args, profile=True):
+        self.name = name
+        self.profile = profile
+        self.func = func
+        self.interval = interval
+        self.priority = priority
+        self.jitter = jitter
+        self.args = args
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_start = None
+        self.last_duration = None
+        self.last_error = None
+        self.lag = 0
+        self.backlog = 0
+        self.next_run = None
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "priority": self.priority,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_start": self.last_start,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "lag": self.lag,
+            "backlog": self.backlog,
+        }
+
+
+class Scheduler:
+    """统一管理爬虫任务的执行周期
+
+    每个任务同时只有一次在执行；下次运行时间从本次计划时间起算并加上随机抖动，
+    执行时间超过周期时不补跑，错过的周期计入backlog。
+    """
+
+    def __init__(self):
+        self.jobs = []
+
+    def add(self, func, interval, priority=PRIORITY_BACKGROUND, args=(), jitter=0.1, name=None, profile=True):
+        """profile为False的任务（例如很频繁的导出任务）在开启profiler时也不输出每次执行的耗时汇总"""
+        job = Job(name or func.__name__, func, interval, priority, jitter, args, profile)
+        self.jobs.append(job)
+        return job
+
+    def stats(self):
+        return [job.to_json() for job in self.jobs]
+
+    async def run(self):
+        await asyncio.gather(*[self._run_job(job) for job in self.jobs])
+
+    def _next_interval(self, job):
+        return job.interval * (1 + random.uniform(-job.jitter, job.jitter))
+
+    async def _run_job(self, job):
+        # 每个任务在自己的协程中运行，这里设置的优先级只影响该任务发出的RPC请求
+        CURRENT_PRIORITY.set(job.priority)
+        # 启动时把各任务的第一次执行错开几秒
+        job.next_run = time.monotonic() + random.uniform(0, min(job.jitter * job.interval, STARTUP_STAGGER))
+        while True:
+            await asyncio.sleep(max(0, job.next_run - time.monotonic()))
+            job.lag = max(0, time.monotonic() - job.next_run)
+            job.running = True
+            job.last_start = time.time()
+            start = time.perf_counter()
+            try:
+                if job.profile:
+                    with profiler.aggregate(job.name):
+                        await job.func(*job.args)
+                else:
+                    await job.func(*job.args)
+                job.last_error = None
+                SCHEDULER_RUNS.inc(job=job.name, status="ok")
+            except Exception as e:
+                print(f"Error in {job.name}: {e}")
+                job.failures += 1
+                job.last_error = str(e)
+                SCHEDULER_RUNS.inc(job=job.name, status="error")
+            job.runs += 1
+            job.running = False
+            job.last_duration = time.perf_counter() - start
+
+            job.next_run += self._next_interval(job)
+            now = time.monotonic()
+            job.backlog = 0
+            if job.next_run < now:
+                job.backlog = int((now - job.next_run) // job.interval) + 1
+                job.next_run = now
+            SCHEDULER_LAST_RUN.set(job.last_start, job=job.name)
+            SCHEDULER_DURATION.set(job.last_duration, job=job.name)
+            SCHEDULER_LAG.set(job.lag, job=job.name)
+            SCHEDULER_BACKLOG.set(job.backlog, job=job.name)